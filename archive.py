@@ -0,0 +1,97 @@
+"""Record of every video downloaded successfully.
+
+One 'extractor id' line per video (the canonical key format, e.g.
+'youtube dQw4w9WgXcQ') appended to a text file - the same format as
+yt-dlp's --download-archive, so the file can be handed to yt-dlp too.
+
+DownloadArchive is the set-like object yt-dlp's 'download_archive' param
+accepts: yt-dlp records each finished video with add() and, before
+resolving a playlist entry, skips it if it is already in the archive. That
+skip is what a sync needs (download only a playlist's or channel's new
+videos); ordinary downloads use recorder(), which records but never skips,
+so a deleted file can be downloaded again.
+
+The file is re-read from where it was last read whenever it has grown, so
+worker processes and a second copy of the app appending to it are seen.
+"""
+
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadArchive:
+    """Thread-safe set of archived 'extractor id' keys backed by a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._keys = set()
+        self._offset = 0  # bytes of the file read into _keys
+
+    def _refresh(self):
+        # Caller holds the lock
+        try:
+            if os.path.getsize(self.path) == self._offset:
+                return
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning(f"Could not read download archive: {e}")
+            return
+        # Only complete lines; a line being appended is read next time
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        for line in data[:end].decode('utf-8', 'replace').splitlines():
+            if line.strip():
+                self._keys.add(line.strip())
+
+    def __contains__(self, key):
+        with self._lock:
+            self._refresh()
+            return key in self._keys
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._keys)
+
+    def add(self, key):
+        with self._lock:
+            self._refresh()
+            if key in self._keys:
+                return
+            try:
+                # One write of a whole line in append mode, so concurrent
+                # writers don't interleave
+                with open(self.path, 'ab') as f:
+                    f.write(f'{key}\n'.encode())
+            except OSError as e:
+                logger.warning(f"Could not record {key} in the download archive: {e}")
+                return
+            self._keys.add(key)
+
+    def recorder(self):
+        """A 'download_archive' for yt-dlp that records into this archive
+        without skipping anything."""
+        return _ArchiveRecorder(self)
+
+
+class _ArchiveRecorder:
+    def __init__(self, archive):
+        self.archive = archive
+
+    def __contains__(self, key):
+        return False
+
+    def __len__(self):
+        # yt-dlp skips the membership test for an empty archive
+        return 0
+
+    def add(self, key):
+        self.archive.add(key)
@@ -0,0 +1,213 @@
+"""Process-wide download bandwidth limits.
+
+Every YoutubeDL instance is its own little world: yt-dlp's ratelimit only
+throttles the one download it belongs to. BandwidthLimiter caps what all
+downloads in the process - GUI and extension alike - pull from the network
+together, with an optional cap per download and per site on top.
+
+Limits are token buckets that hand out reservations: a reader that takes
+more than is available isn't refused, it is told how long to sleep, and
+the next reader queues behind it. Each download reads through its own
+Throttle, which lets only one of its connections reserve at a time; with
+every busy download holding one place in line, the total is shared evenly
+between them, and whatever an idle or capped download leaves unused goes
+to the others. Limits can be changed at any time and apply immediately.
+
+In "processes" execution mode the buckets live in shared memory (share(),
+attach()), so worker processes draw from the same budget.
+
+Rates are bytes per second; 0 or None means unlimited.
+"""
+
+import ctypes
+import multiprocessing
+import threading
+import time
+
+# Bytes a full bucket may hand out at once, in seconds of its rate
+_BURST_SECONDS = 0.5
+# Largest read a throttled response performs at once; keeps throttling
+# smooth instead of sleeping for multi-megabyte blocks
+_MAX_THROTTLED_READ = 64 * 1024
+
+
+class TokenBucket:
+    """A token bucket whose reserve() returns how long to wait."""
+
+    def __init__(self, rate=0):
+        self._lock = threading.Lock()
+        # rate, tokens, time of the last refill
+        self._state = [0, 0.0, time.monotonic()]
+        self.set_rate(rate)
+
+    @property
+    def rate(self):
+        return int(self._state[0])
+
+    def set_rate(self, rate):
+        with self._lock:
+            state = self._state
+            state[0] = max(0, int(rate or 0))
+            # Forget debt run up under the old rate
+            state[1] = max(min(state[1], state[0] * _BURST_SECONDS), 0.0)
+            state[2] = time.monotonic()
+
+    def reserve(self, n):
+        """Take n tokens; seconds until they are actually available."""
+        with self._lock:
+            state = self._state
+            rate = state[0]
+            if not rate:
+                return 0.0
+            now = time.monotonic()
+            state[1] = min(state[1] + (now - state[2]) * rate, rate * _BURST_SECONDS)
+            state[2] = now
+            state[1] -= n
+            return -state[1] / rate if state[1] < 0 else 0.0
+
+
+class SharedTokenBucket(TokenBucket):
+    """A TokenBucket in shared memory, drawn from by several processes. It
+    reaches another process only as it starts (e.g. as a pool initializer
+    argument). time.monotonic() is system-wide, so the processes agree on
+    the refill clock."""
+
+    def __init__(self, rate=0, context=None):
+        context = context or multiprocessing.get_context('spawn')
+        self._lock = context.Lock()
+        self._state = context.RawArray('d', [0.0, 0.0, time.monotonic()])
+        self.set_rate(rate)
+
+
+class Throttle:
+    """One download's share of a BandwidthLimiter; see BandwidthLimiter.throttle."""
+
+    def __init__(self, limiter, site):
+        self.limiter = limiter
+        self.site = site
+        self._bucket = TokenBucket(limiter.per_download)
+        self._lock = threading.Lock()
+        self.waited = 0.0  # seconds the limits have made the download sleep
+
+    @property
+    def limited(self):
+        return bool(self.limiter.total or self.limiter.per_download
+                    or self.limiter.site_bucket(self.site).rate)
+
+    def consume(self, n):
+        """Account for n bytes read, sleeping as long as the limits require."""
+        limiter = self.limiter
+        if self._bucket.rate != limiter.per_download:
+            self._bucket.set_rate(limiter.per_download)
+        # Connections of one download queue here, so the download holds a
+        # single place in line at the shared buckets (fair sharing)
+        with self._lock:
+            delay = max(bucket.reserve(n) for bucket in (
+                limiter.total_bucket, limiter.site_bucket(self.site), self._bucket))
+            if delay > 0:
+                time.sleep(delay)
+                self.waited += delay
+
+    def wrap(self, response):
+        """Throttle reads from a yt-dlp networking Response in place."""
+        read = response.read
+
+        def throttled_read(amt=None):
+            if not self.limited:
+                return read(amt)
+            if amt is None or amt < 0 or amt > _MAX_THROTTLED_READ:
+                amt = _MAX_THROTTLED_READ
+            data = read(amt)
+            if data:
+                self.consume(len(data))
+            return data
+        response.read = throttled_read
+        return response
+
+
+class BandwidthLimiter:
+    """Total, per-download and per-site rate caps shared by the process -
+    and, after share(), by worker processes too."""
+
+    def __init__(self, total=0, per_download=0, per_site=None):
+        self.total_bucket = TokenBucket()
+        self._site_buckets = {}
+        self._per_download = ctypes.c_longlong(0)
+        self._lock = threading.Lock()
+        self._shared = None
+        self.configure(total, per_download, per_site or {})
+
+    @property
+    def total(self):
+        return self.total_bucket.rate
+
+    @property
+    def per_download(self):
+        return self._per_download.value
+
+    @property
+    def per_site(self):
+        with self._lock:
+            return {site: bucket.rate for site, bucket in self._site_buckets.items()
+                    if bucket.rate}
+
+    def configure(self, total=None, per_download=None, per_site=None):
+        """Change limits at runtime; None leaves a limit as it is. per_site
+        replaces the whole site -> rate mapping."""
+        if total is not None:
+            self.total_bucket.set_rate(total)
+        if per_download is not None:
+            self._per_download.value = max(0, int(per_download or 0))
+        if per_site is not None:
+            with self._lock:
+                for site in per_site:
+                    self._site_buckets.setdefault(site, TokenBucket())
+                for site, bucket in self._site_buckets.items():
+                    bucket.set_rate(per_site.get(site, 0))
+
+    def limits(self):
+        return {
+            'total': self.total,
+            'per_download': self.per_download,
+            'per_site': self.per_site,
+        }
+
+    def site_bucket(self, site):
+        with self._lock:
+            bucket = self._site_buckets.get(site)
+            if bucket is None:
+                bucket = self._site_buckets[site] = TokenBucket()
+            return bucket
+
+    def share(self, sites=(), context=None):
+        """Move the limits into shared memory and return them, for attach()
+        in worker processes: downloads there then draw from the same
+        budget as this process's and see every change made here. sites
+        are the sites whose caps are shared; a site first limited later
+        is limited in this process only."""
+        with self._lock:
+            if self._shared is None:
+                context = context or multiprocessing.get_context('spawn')
+                for site in sites:
+                    self._site_buckets.setdefault(site, TokenBucket())
+                self.total_bucket = SharedTokenBucket(self.total_bucket.rate, context)
+                self._site_buckets = {
+                    site: SharedTokenBucket(bucket.rate, context)
+                    for site, bucket in self._site_buckets.items()}
+                self._per_download = context.RawValue('q', self._per_download.value)
+                self._shared = {'total': self.total_bucket,
+                                'sites': dict(self._site_buckets),
+                                'per_download': self._per_download}
+            return self._shared
+
+    def attach(self, shared):
+        """In a worker process: use the limits another process share()d."""
+        with self._lock:
+            self.total_bucket = shared['total']
+            self._site_buckets = dict(shared['sites'])
+            self._per_download = shared['per_download']
+            self._shared = shared
+
+    def throttle(self, site=None):
+        """A Throttle for one download from site."""
+        return Throttle(self, site)
@@ -0,0 +1,155 @@
+"""Browser cookies loaded once and shared by every yt-dlp instance.
+
+With a browser configured in Settings, every Instagram/Threads fetch and
+download used to have yt-dlp open the browser's cookie database again -
+copy it, query it and decrypt each value. BrowserCookieCache keeps the
+loaded cookies in memory instead; each caller gets its own copy of the
+jar. A loaded jar is reloaded after a TTL, or sooner when the browser has
+written its cookie database since (its mtime changed).
+
+A browser that can't be read (the running browser locks the database, or
+uses encryption yt-dlp can't undo) is remembered as failed for a cool-down
+period: callers are told at once instead of every download trying again,
+and go ahead without cookies. Cookies loaded before keep being served
+while reloading them fails.
+
+Long-lived holders of a jar (pooled yt-dlp instances) can tell from
+generation() whether get() would now serve newer cookies than theirs.
+"""
+
+import copy
+import logging
+import os
+import re
+import threading
+import time
+
+from yt_dlp.cookies import YoutubeDLCookieJar, extract_cookies_from_browser
+
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# yt-dlp names the database it reads in a debug message
+_DATABASE_PATH_RE = re.compile(r'Extracting cookies from: "(?P<path>.+)"')
+
+
+class CookiesUnavailable(Exception):
+    """The browser's cookies can't be read (now, or recently)."""
+
+
+class _LoadLogger:
+    # yt-dlp logger for one load: remembers the database path and passes
+    # everything else on to logging
+    def __init__(self):
+        self.database = None
+
+    def debug(self, message):
+        m = _DATABASE_PATH_RE.search(message)
+        if m:
+            self.database = m.group('path')
+        logger.debug(message)
+
+    def info(self, message):
+        logger.debug(message)
+
+    def warning(self, message, only_once=False):
+        logger.warning(message)
+
+    def error(self, message):
+        logger.error(message)
+
+
+class _Entry:
+    def __init__(self):
+        self.jar = None
+        self.database = None
+        self.mtime = None
+        self.loaded = 0.0
+        self.failed = None  # monotonic time of the last failed load
+        self.error = None
+        self.generation = 0  # successful loads so far
+
+
+class BrowserCookieCache:
+    """Browser cookie jars by yt-dlp 'cookiesfrombrowser' spec; see get()."""
+
+    def __init__(self, ttl=10 * 60, failure_cooldown=5 * 60):
+        self.ttl = ttl
+        self.failure_cooldown = failure_cooldown
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._loads = SingleFlight()
+
+    def get(self, spec):
+        """A YoutubeDLCookieJar with the cookies of spec - a tuple of
+        (browser, profile, keyring, container), trailing items optional.
+        Raises CookiesUnavailable if they can't be read and none were
+        loaded before."""
+        jar = self._current(spec).jar
+        copied = YoutubeDLCookieJar()
+        for cookie in jar:
+            copied.set_cookie(copy.copy(cookie))
+        return copied
+
+    def generation(self, spec):
+        """Which load of spec's cookies get(spec) would copy now (reloading
+        them first if due, like get): it changes whenever they have been
+        reloaded. Raises CookiesUnavailable like get()."""
+        return self._current(spec).generation
+
+    def _current(self, spec):
+        # spec's entry, reloaded if due; it has a jar
+        spec = tuple(spec)
+        with self._lock:
+            entry = self._entries.setdefault(spec, _Entry())
+        if not self._fresh(entry):
+            self._loads.do(spec, lambda: self._load(spec, entry))
+        with self._lock:
+            if entry.jar is None:
+                raise CookiesUnavailable(entry.error)
+            return entry
+
+    def _fresh(self, entry):
+        now = time.monotonic()
+        if entry.failed is not None and now - entry.failed < self.failure_cooldown:
+            # Cooling down: what was loaded before (if anything) will do
+            return True
+        if entry.jar is None or now - entry.loaded >= self.ttl:
+            return False
+        return entry.database is None or self._mtime(entry.database) == entry.mtime
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def _load(self, spec, entry):
+        if self._fresh(entry):
+            return  # loaded by the caller this one waited for
+        browser, profile, keyring, container = (*spec, None, None, None)[:4]
+        load_logger = _LoadLogger()
+        started = time.monotonic()
+        try:
+            jar = extract_cookies_from_browser(
+                browser, profile, load_logger, keyring=keyring, container=container)
+        except Exception as e:
+            with self._lock:
+                entry.failed = time.monotonic()
+                entry.error = f"{browser} cookies unavailable: {e}"
+            logger.warning(f"Could not load {browser} cookies ({e}); "
+                           f"not trying again for {self.failure_cooldown}s")
+            return
+        mtime = (self._mtime(load_logger.database)
+                 if load_logger.database else None)
+        with self._lock:
+            entry.jar = jar
+            entry.database = load_logger.database
+            entry.mtime = mtime
+            entry.loaded = time.monotonic()
+            entry.failed = entry.error = None
+            entry.generation += 1
+        logger.debug(f"Loaded {len(jar)} {browser} cookies in "
+                     f"{time.monotonic() - started:.2f}s")
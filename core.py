@@ -0,0 +1,926 @@
+"""Download engine shared by the desktop GUI and the headless server.
+
+Settings, the yt-dlp option/extraction helpers, URL canonicalization and
+the process-wide engine objects (job scheduler, extraction cache,
+connection tuner, bandwidth limiter, post-processing pool, job journal,
+download archive, browser cookies) live here. Nothing in this module
+imports tkinter or pyperclip, so the headless server (server.py) runs on
+machines without a display or clipboard.
+"""
+
+import os
+import glob
+import json
+import re
+import sys
+import logging
+import functools
+import concurrent.futures
+import multiprocessing
+from yt_dlp.utils import DownloadError, make_archive_id
+
+from archive import DownloadArchive
+from browsercookies import BrowserCookieCache, CookiesUnavailable
+from metacache import ExtractionCache
+from jobjournal import JobJournal
+from rangedl import RangedYoutubeDL
+from tuning import ConnectionTuner
+from bandwidth import BandwidthLimiter
+from scheduler import JobScheduler, PRIORITY_NORMAL, current_job
+from singleflight import SingleFlight
+from ydlpool import YoutubeDLPool
+import procpool
+
+logger = logging.getLogger(__name__)
+
+APP_NAME = "Downstream"
+APP_VERSION = "1.6.3"
+
+def get_base_path():
+    """Get base path for resources, works both in development and when packaged"""
+    try:
+        if getattr(sys, 'frozen', False):
+            # Running in a bundle (PyInstaller)
+            base_path = os.path.dirname(sys.executable)
+            # Check and set Tcl/Tk paths for frozen environment
+            tcl_dir = os.path.join(sys._MEIPASS, "tcl")
+            tk_dir = os.path.join(sys._MEIPASS, "tk")
+
+            if os.path.exists(tcl_dir) and os.path.exists(tk_dir):
+                vers = [d for d in os.listdir(tcl_dir) if d.startswith('tcl')]
+                if vers:
+                    tcl_vers = sorted(vers)[-1]
+                    tk_vers = 'tk' + tcl_vers[3:]
+                    os.environ['TCL_LIBRARY'] = os.path.join(tcl_dir, tcl_vers)
+                    os.environ['TK_LIBRARY'] = os.path.join(tk_dir, tk_vers)
+                    logger.debug(f"Set TCL_LIBRARY to {os.environ['TCL_LIBRARY']}")
+                    logger.debug(f"Set TK_LIBRARY to {os.environ['TK_LIBRARY']}")
+        else:
+            # Running in a normal Python environment
+            base_path = os.path.dirname(os.path.abspath(__file__))
+
+        logger.debug(f"Base path set to: {base_path}")
+        return base_path
+    except Exception as e:
+        logger.error(f"Error in get_base_path: {str(e)}", exc_info=True)
+        raise
+
+# yt-dlp discovers plugin packages named yt_dlp_plugins/ on sys.path. Ours
+# ships the Threads extractor (Threads isn't supported by mainline yt-dlp).
+# In the packaged exe the plugin is bundled into sys._MEIPASS (already on
+# sys.path); adding the exe's own folder too lets a user drop in an updated
+# plugin without rebuilding.
+sys.path.insert(0, get_base_path())
+
+from yt_dlp_plugins.extractor.threads import ThreadsIE, ThreadsUserIE
+
+DEFAULT_SETTINGS = {
+    # Final destination for finished downloads
+    "download_path": os.path.join(os.path.expanduser("~"), "Downloads"),
+    # Source/staging folder for in-progress downloads; "" = download
+    # directly into the destination
+    "temp_path": "",
+    "default_download_type": "video+audio",
+    "format": "mp4",
+    # Browser to borrow cookies from for Instagram/Threads downloads
+    # ("" = none). Much of Meta's content is behind a login; yt-dlp can
+    # reuse an existing browser session instead of asking for credentials.
+    "cookies_browser": "",
+    # Auto download: skip the format picker and download immediately at the
+    # configured quality when a URL is entered/pasted
+    "auto_download": False,
+    "auto_download_quality": "best",
+    # Downloads that may run at once across the GUI and the extension API;
+    # further jobs wait in the queue
+    "max_concurrent_downloads": 3,
+    # Download a playlist's videos as separate jobs, several at a time,
+    # instead of strictly one after another
+    "parallel_playlist_downloads": True,
+    # Parallel HTTP connections (byte ranges) per single-file format;
+    # 1 = one plain stream
+    "connections_per_download": 4,
+    # Tune that count per CDN host from measured throughput and errors,
+    # starting at connections_per_download
+    "adaptive_connections": True,
+    # Bandwidth caps in KB/s, 0 = unlimited: all downloads together, each
+    # single download, and per site (e.g. {"youtube": 2000})
+    "download_rate_limit": 0,
+    "per_download_rate_limit": 0,
+    "site_rate_limits": {},
+    # "threads": jobs run yt-dlp on threads of this process; "processes":
+    # in a pool of worker processes, so CPU-heavy extraction doesn't
+    # compete with the GUI for the GIL
+    "execution_mode": "threads",
+    # Worker processes are replaced after this many jobs to cap memory growth
+    "worker_recycle_after": 20,
+    # Output of audio-only downloads, an AUDIO_FORMATS key
+    "audio_format": "original",
+    # A Threads post's download also takes the videos in the rest of its
+    # thread (the replies)
+    "threads_include_replies": False,
+}
+
+# Quality presets for auto download and the extension API: a yt-dlp format
+# expression plus an optional format_sort. yt-dlp resolves these itself, so
+# no metadata extraction is paid up front. Quality caps use format_sort
+# ('res' = the SHORTER video dimension) instead of [height<=N] filters:
+# vertical reels/Shorts aren't over-throttled by their large height, and a
+# preference (unlike a filter) still succeeds on sites that only serve one
+# resolution.
+QUALITY_FORMATS = {
+    "video+audio": {
+        "best": ("bestvideo+bestaudio/best", None),
+        "medium": ("bestvideo+bestaudio/best", ["res:720"]),
+        "low": ("bestvideo+bestaudio/best", ["res:480"]),
+    },
+    "video-only": {
+        "best": ("bestvideo", None),
+        "medium": ("bestvideo", ["res:720"]),
+        "low": ("bestvideo", ["res:480"]),
+    },
+    # Audio uses proximity sort (~): 'abr:128' (a cap) proved unreliable in
+    # testing - it picked 48kbps on YouTube; '~' picks the closest bitrate
+    "audio-only": {
+        "best": ("bestaudio/best", None),
+        "medium": ("bestaudio/best", ["abr~128"]),
+        "low": ("bestaudio/best", ["abr~64"]),
+    },
+}
+
+# Output formats of audio-only downloads -> FFmpegExtractAudio codec.
+# "original" keeps the downloaded audio stream as it is (AAC -> .m4a,
+# Opus -> .opus), at most remuxing it out of a video container - no
+# decode/encode. "mp3" transcodes, for players that need mp3.
+AUDIO_FORMATS = {
+    "original": "best",
+    "mp3": "mp3",
+}
+
+
+def load_settings(base_path):
+    """Read settings.json, falling back to defaults for missing/invalid values.
+
+    Shared by the GUI and the extension API so both honor the same folders.
+    """
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        settings_path = os.path.join(base_path, "settings.json")
+        if os.path.exists(settings_path):
+            with open(settings_path, "r") as f:
+                settings.update(json.load(f))
+        # Fall back to defaults if saved paths don't exist (e.g. a settings
+        # file created on another machine/OS)
+        if not os.path.isdir(settings.get("download_path", "")):
+            settings["download_path"] = DEFAULT_SETTINGS["download_path"]
+        if settings.get("temp_path") and not os.path.isdir(settings["temp_path"]):
+            settings["temp_path"] = ""
+        settings["auto_download"] = bool(settings.get("auto_download"))
+        settings["parallel_playlist_downloads"] = bool(settings.get("parallel_playlist_downloads"))
+        settings["adaptive_connections"] = bool(settings.get("adaptive_connections"))
+        if settings.get("auto_download_quality") not in ("best", "medium", "low"):
+            settings["auto_download_quality"] = DEFAULT_SETTINGS["auto_download_quality"]
+        try:
+            settings["max_concurrent_downloads"] = min(max(
+                int(settings.get("max_concurrent_downloads")), 1), 16)
+        except (TypeError, ValueError):
+            settings["max_concurrent_downloads"] = DEFAULT_SETTINGS["max_concurrent_downloads"]
+        try:
+            settings["connections_per_download"] = min(max(
+                int(settings.get("connections_per_download")), 1), 16)
+        except (TypeError, ValueError):
+            settings["connections_per_download"] = DEFAULT_SETTINGS["connections_per_download"]
+        if settings.get("audio_format") not in AUDIO_FORMATS:
+            settings["audio_format"] = DEFAULT_SETTINGS["audio_format"]
+        if settings.get("execution_mode") not in ("threads", "processes"):
+            settings["execution_mode"] = DEFAULT_SETTINGS["execution_mode"]
+        try:
+            settings["worker_recycle_after"] = max(int(settings.get("worker_recycle_after")), 1)
+        except (TypeError, ValueError):
+            settings["worker_recycle_after"] = DEFAULT_SETTINGS["worker_recycle_after"]
+        for key in ("download_rate_limit", "per_download_rate_limit"):
+            try:
+                settings[key] = max(int(settings.get(key)), 0)
+            except (TypeError, ValueError):
+                settings[key] = DEFAULT_SETTINGS[key]
+        site_limits = settings.get("site_rate_limits")
+        settings["site_rate_limits"] = {
+            site: max(int(rate), 0) for site, rate in site_limits.items()
+            if isinstance(rate, (int, float))
+        } if isinstance(site_limits, dict) else {}
+    except Exception:
+        return dict(DEFAULT_SETTINGS)
+    return settings
+
+
+def write_settings_file(base_path, settings):
+    with open(os.path.join(base_path, "settings.json"), "w") as f:
+        json.dump(settings, f)
+
+
+def audio_postprocessors(audio_format):
+    """yt-dlp 'postprocessors' turning a download into an audio file of
+    audio_format (an AUDIO_FORMATS key)."""
+    return [{
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': AUDIO_FORMATS[audio_format],
+    }]
+
+
+def build_download_paths(settings):
+    """yt-dlp 'paths' dict: partial files go to temp, finished files to home."""
+    paths = {"home": settings["download_path"]}
+    if settings.get("temp_path"):
+        paths["temp"] = settings["temp_path"]
+    return paths
+
+
+# Let yt-dlp fetch its official JS challenge solver (cached after first use);
+# without it YouTube's "n challenge" fails, hiding formats and throttling
+# download speed
+BASE_YDL_OPTS = {"remote_components": ["ejs:github"]}
+
+# Sites the app accepts. yt-dlp can handle many more, but the GUI's format
+# filtering and options are only tuned for these.
+SUPPORTED_URL_RE = re.compile(
+    r'(youtube\.com|youtu\.be|instagram\.com|threads\.(?:net|com))',
+    re.IGNORECASE)
+
+META_URL_RE = re.compile(r'(instagram\.com|threads\.(?:net|com))', re.IGNORECASE)
+
+SITE_URL_RES = (
+    ("youtube", re.compile(r'(youtube\.com|youtu\.be)', re.IGNORECASE)),
+    ("instagram", re.compile(r'instagram\.com', re.IGNORECASE)),
+    ("threads", re.compile(r'threads\.(?:net|com)', re.IGNORECASE)),
+)
+
+# Per-site cap on concurrently running jobs. Meta answers bursts of
+# parallel requests with login walls and 429s long before bandwidth runs out.
+SITE_CONCURRENCY = {"instagram": 2, "threads": 2}
+
+# Sites whose format ids name one video's media (Threads: '<media pk>-<type>'),
+# so a format picked on one video of a playlist selects nothing on the others
+PER_VIDEO_FORMAT_SITES = frozenset({"threads"})
+
+
+def _scheme_optional(valid_url):
+    # Extractor _VALID_URLs require the scheme; pasted links often lack it
+    return valid_url.replace('https?://', '(?:https?://)?', 1)
+
+
+# Canonical identity of a supported URL, (extractor, id), so equivalent links
+# (youtu.be/X, watch?v=X&t=42, m.youtube.com/shorts/X; threads.net and
+# threads.com, any @username) share cache entries and job keys. Covers the
+# URL shapes AUTO_FETCH_RE accepts; Threads reuses the extractor's own
+# _VALID_URL so the two can't drift apart. Extractor names are yt-dlp's
+# lowercased ie_key, as in its download archive lines.
+CANONICAL_URL_RES = (
+    # A video opened from a playlist (watch?v=X&list=PL...) downloads the
+    # playlist, as yt-dlp does with such a link; checked before "youtube".
+    # Mixes (RD...) only exist next to their video and stay video links.
+    ("youtube:playlist", re.compile(
+        r'(?:youtube\.com/watch\?|youtu\.be/[\w-]{11}/?\?)'
+        r'(?:\S*?&)?list=(?P<id>(?!RD)[\w-]+)', re.IGNORECASE)),
+    ("youtube", re.compile(
+        r'(?:youtube\.com/(?:watch\?(?:\S*?&)?v=|shorts/|embed/|live/)'
+        r'|youtu\.be/)(?P<id>[\w-]{11})', re.IGNORECASE)),
+    ("youtube:playlist", re.compile(
+        r'youtube\.com/playlist\?(?:\S*?&)?list=(?P<id>[\w-]+)', re.IGNORECASE)),
+    # A channel, or its videos/shorts/live tab
+    ("youtube:tab", re.compile(
+        r'youtube\.com/(?P<id>(?:@[\w.-]+|channel/UC[\w-]+|c/[\w.-]+|user/[\w.-]+)'
+        r'(?:/(?:videos|shorts|streams))?)/?(?:[?#]|$)', re.IGNORECASE)),
+    ("instagram", re.compile(
+        r'instagram\.com/(?:[\w.]+/)?(?:reels?|p|tv)/(?P<id>[\w-]+)', re.IGNORECASE)),
+    # A carousel item (?img_index=N) is its own media, with the id
+    # ThreadsIE gives it: CODE-N
+    ("threads", re.compile(
+        _scheme_optional(ThreadsIE._VALID_URL) + r'(?:/?\?(?:[^#\s]*?&)?img_index=(?P<index>\d+))?',
+        re.IGNORECASE)),
+    # A profile's threads and media tabs list the same videos
+    ("threads:user", re.compile(_scheme_optional(ThreadsUserIE._VALID_URL),
+                                re.IGNORECASE)),
+)
+
+CANONICAL_URL_TEMPLATES = {
+    "youtube": "https://www.youtube.com/watch?v={}",
+    "youtube:playlist": "https://www.youtube.com/playlist?list={}",
+    "youtube:tab": "https://www.youtube.com/{}",
+    "instagram": "https://www.instagram.com/p/{}/",
+    # Threads ignores the username segment, so a placeholder works
+    "threads": "https://www.threads.com/@_/post/{}",
+    "threads:user": "https://www.threads.com/@{}",
+}
+
+# Canonical URL kinds that list many videos
+PLAYLIST_KINDS = ("youtube:playlist", "youtube:tab", "threads:user")
+
+
+def _canonical_match(url):
+    for extractor, url_re in CANONICAL_URL_RES:
+        m = url_re.search(url or "")
+        if m:
+            return extractor, m
+    return None, None
+
+
+def canonical_key(url):
+    """(extractor, id) of the media url points at, or None if unknown."""
+    extractor, m = _canonical_match(url)
+    if m is None:
+        return None
+    if m.groupdict().get('index'):
+        return extractor, f"{m.group('id')}-{m.group('index')}"
+    return extractor, m.group('id')
+
+
+def canonical_key_str(url):
+    """canonical_key as an 'extractor id' string (the download archive
+    format); the URL itself for URLs we can't identify."""
+    key = canonical_key(url)
+    return f"{key[0]} {key[1]}" if key else url
+
+
+def canonical_url(url):
+    """The one URL all equivalent links to the same media map to."""
+    extractor, m = _canonical_match(url)
+    if m is None:
+        return url
+    canonical = CANONICAL_URL_TEMPLATES[extractor].format(m.group('id'))
+    if m.groupdict().get('index'):
+        canonical += f"?img_index={m.group('index')}"
+    return canonical
+
+
+def is_playlist_url(url):
+    """Whether url is a playlist or profile rather than one video."""
+    return (canonical_key(url) or ("",))[0] in PLAYLIST_KINDS
+
+
+def site_of(url):
+    """Short site name for a supported URL ('youtube', ...), else None."""
+    for site, site_re in SITE_URL_RES:
+        if site_re.search(url or ""):
+            return site
+    return None
+
+# Matches the error our Threads extractor plugin raises for cross-posts
+# (posts whose video is actually hosted on another site, e.g. an Instagram
+# reel shared to Threads). The phrasing is fixed in threads.py.
+CROSSPOST_ERROR_RE = re.compile(
+    r'Download it from the source instead - (?P<source>[^:]+): (?P<url>https?://\S+)')
+
+
+def site_ydl_opts(url, settings):
+    """Per-site yt-dlp options on top of BASE_YDL_OPTS.
+
+    Instagram and Threads gate much of their content behind a login; when a
+    browser is configured in Settings, reuse its session cookies.
+    """
+    opts = dict(BASE_YDL_OPTS)
+    # Fetch DASH/HLS fragments, and byte ranges of single-file formats
+    # (rangedl.py), in parallel - large downloads are substantially faster.
+    # With adaptive connections the tuner picks the count per CDN host.
+    connections = settings.get(
+        "connections_per_download", DEFAULT_SETTINGS["connections_per_download"])
+    opts["concurrent_fragment_downloads"] = connections
+    opts["ranged_connections"] = connections
+    if settings.get("adaptive_connections", True):
+        opts["connection_tuner"] = connection_tuner
+    # Counted against the process-wide bandwidth limits (bandwidth.py)
+    opts["bandwidth_limiter"] = bandwidth_limiter
+    opts["bandwidth_site"] = site_of(url)
+    # Merging and audio conversion run on postprocess_pool, not in the
+    # download slot
+    opts["postprocess_stage"] = defer_postprocessing
+    # Every finished download is recorded; a sync swaps in the archive
+    # itself so recorded videos are skipped (see download_archive)
+    opts["download_archive"] = download_archive.recorder()
+    browser = (settings.get("cookies_browser") or "").strip()
+    if browser and META_URL_RE.search(url):
+        opts["cookiesfrombrowser"] = (browser,)
+    if settings.get("threads_include_replies") and site_of(url) == "threads":
+        opts["extractor_args"] = {"threads": {"include_replies": ["true"]}}
+    return opts
+
+
+# Options site_ydl_opts() derives from the settings, plus per-run objects;
+# not journaled (see download_resume_spec) but rebuilt on resume
+SITE_YDL_OPT_KEYS = frozenset({
+    *BASE_YDL_OPTS, "concurrent_fragment_downloads", "ranged_connections",
+    "connection_tuner", "bandwidth_limiter", "bandwidth_site",
+    "postprocess_stage", "download_archive", "cookiesfrombrowser",
+    "extractor_args", "progress_hooks", "cancel_event"})
+
+
+def download_resume_spec(url, ydl_opts, label=None, priority=PRIORITY_NORMAL,
+                         parent=None):
+    """Job.resume of a job running run_download(url, ydl_opts): what
+    resume_jobs() needs to queue the same download after a restart. parent
+    is the id of a job whose own resumed download covers this one (a
+    playlist's, for its entries)."""
+    spec = {
+        'url': url,
+        'opts': {k: v for k, v in ydl_opts.items() if k not in SITE_YDL_OPT_KEYS},
+        'label': label,
+        'priority': priority,
+    }
+    if parent is not None:
+        spec['parent'] = parent
+    if ydl_opts.get('download_archive') is download_archive:
+        spec['sync'] = True
+    return spec
+
+
+def download_dedupe_key(url, ydl_opts):
+    """What makes two downloads the same one (JobScheduler dedupe_key):
+    the media plus every option that changes the files produced - format
+    selection, merge/audio conversion, playlist range, output location."""
+    return json.dumps([
+        canonical_key_str(url),
+        ydl_opts.get('format'), ydl_opts.get('format_sort'),
+        ydl_opts.get('merge_output_format'),
+        [pp.get('preferredcodec') for pp in ydl_opts.get('postprocessors') or []],
+        ydl_opts.get('noplaylist'), ydl_opts.get('playliststart'),
+        ydl_opts.get('playlistend'), ydl_opts.get('playlist_reverse'),
+        ydl_opts.get('outtmpl'), ydl_opts.get('paths'),
+    ], sort_keys=True)
+
+
+def run_with_cookie_fallback(ydl_opts, action):
+    """Run action(ydl); without browser cookies if they can't be loaded.
+
+    Reading a browser's cookie DB fails routinely (the browser is running
+    and locks the file, or uses cookie encryption yt-dlp can't decrypt).
+    Public posts don't need the login anyway, so a broken cookie source
+    must not take down every Instagram/Threads download. The cookies come
+    from browser_cookies, loaded before action starts, so a failure costs
+    no wasted extraction - and within its cool-down, not even the attempt.
+    """
+    spec = ydl_opts.get('cookiesfrombrowser')
+    if spec is not None:
+        try:
+            # Part of the pooled instances' profile: one created with
+            # cookies browser_cookies has since reloaded isn't reused
+            generation = browser_cookies.generation(spec)
+            with ydl_pool.instance({**ydl_opts, 'cookies_generation': generation}) as ydl:
+                return action(ydl)
+        except CookiesUnavailable as e:
+            logger.debug(f"{e}; continuing without cookies")
+            ydl_opts = {k: v for k, v in ydl_opts.items() if k != 'cookiesfrombrowser'}
+    with ydl_pool.instance(ydl_opts) as ydl:
+        return action(ydl)
+
+
+def with_job_progress(ydl_opts):
+    """ydl_opts plus a progress hook reporting to the scheduler job running
+    on this thread, so /api/jobs can show its bytes, speed and ETA, and the
+    job's cancel event, so cancelling the job stops yt-dlp."""
+    job = current_job()
+    if job is None:
+        return ydl_opts
+    return {**ydl_opts,
+            'progress_hooks': [*ydl_opts.get('progress_hooks', []), job.progress_hook],
+            'cancel_event': job.cancel_event}
+
+
+def remove_partial_files(job):
+    """Delete what job's downloads left behind in the temp folder: .part
+    files, their .ytdl/.ranges resume state and DASH/HLS fragments."""
+    for tmpfilename in job.partial_files:
+        leftovers = [tmpfilename, tmpfilename + '.ytdl', tmpfilename + '.ranges',
+                     *glob.glob(glob.escape(tmpfilename) + '-Frag*')]
+        for path in leftovers:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove {path}: {e}")
+
+
+def _cleanup_if_cancelled():
+    # After yt-dlp gave up: a cancelled job's partial files aren't resumed
+    job = current_job()
+    if job is not None and job.cancel_event.is_set():
+        remove_partial_files(job)
+
+
+def download_from_info(ydl, info, url):
+    """Like ydl.download([url]), but from an already-extracted info dict.
+
+    Skips the second extraction (page fetch, player JS, n-challenge, the
+    Threads GraphQL call). The info is cleaned the way yt-dlp's
+    --load-info-json does; otherwise the format picked during extraction
+    overrides this download's format selection. If the stored stream URLs
+    were rejected anyway, falls back to a regular download of url.
+    """
+    try:
+        ydl.process_ie_result(ydl.sanitize_info(info, True), download=True)
+    except DownloadError as e:
+        logger.warning(f"Download from extracted info failed ({e}); "
+                       "re-extracting")
+        return ydl.download([url])
+    return ydl._download_retcode
+
+
+def run_download(url, ydl_opts, info=None):
+    """Download url with ydl_opts, from info (an extracted info dict, see
+    download_from_info) if given. Runs in a worker process in "processes"
+    execution mode. Returns yt-dlp's return code."""
+    pool = process_pool
+    try:
+        if pool is not None:
+            opts, hooks, engine = _worker_args(ydl_opts)
+            return pool.run(_download_task, url, opts, engine, info,
+                            progress_hooks=hooks,
+                            cancel_event=ydl_opts.get('cancel_event'),
+                            on_deferred=_defer_to_current_job(ydl_opts))
+        if info is not None:
+            return run_with_cookie_fallback(
+                ydl_opts, lambda ydl: download_from_info(ydl, info, url))
+        return run_with_cookie_fallback(ydl_opts, lambda ydl: ydl.download([url]))
+    except Exception:
+        _cleanup_if_cancelled()
+        raise
+
+
+def run_extraction(url, ydl_opts, download=False):
+    """Sanitized info dict of url, downloading it too if download. Runs in
+    a worker process in "processes" execution mode."""
+    pool = process_pool
+    try:
+        if pool is not None:
+            opts, hooks, engine = _worker_args(ydl_opts)
+            return pool.run(_extract_task, url, opts, engine, download,
+                            progress_hooks=hooks,
+                            cancel_event=ydl_opts.get('cancel_event'),
+                            on_deferred=_defer_to_current_job(ydl_opts))
+        return run_with_cookie_fallback(
+            ydl_opts,
+            lambda ydl: ydl.sanitize_info(ydl.extract_info(url, download=download)))
+    except Exception:
+        _cleanup_if_cancelled()
+        raise
+
+
+def _worker_args(ydl_opts):
+    """(picklable ydl_opts, progress hooks, engine state) for handing
+    ydl_opts to a worker process. The engine objects in ydl_opts live in
+    this process; the worker uses its own, set up from the engine state."""
+    opts = {k: v for k, v in ydl_opts.items() if k not in (
+        'progress_hooks', 'connection_tuner', 'bandwidth_limiter', 'cancel_event',
+        'download_archive', 'postprocess_stage')}
+    archive = ydl_opts.get('download_archive')
+    engine = {
+        'archive': ('sync' if archive is download_archive
+                    else 'record' if archive is not None else None),
+        'connections': (connection_tuner.default
+                        if 'connection_tuner' in ydl_opts else None),
+        'throttled': 'bandwidth_limiter' in ydl_opts,
+        'deferred': 'postprocess_stage' in ydl_opts,
+    }
+    return opts, ydl_opts.get('progress_hooks', []), engine
+
+
+def _worker_ydl_opts(opts, engine):
+    # In the worker: plug this process's engine objects and the IPC
+    # progress/log forwarding into opts from _worker_args
+    opts = {**opts, 'progress_hooks': [procpool.progress_hook],
+            'logger': procpool.WorkerLogger(),
+            # Progress arrives structured through the hook
+            'noprogress': True}
+    cancel_event = procpool.cancel_event()
+    if cancel_event is not None:
+        opts['cancel_event'] = cancel_event
+    if engine['archive'] == 'sync':
+        opts['download_archive'] = download_archive
+    elif engine['archive'] == 'record':
+        opts['download_archive'] = download_archive.recorder()
+    if engine['connections'] is not None:
+        connection_tuner.default = engine['connections']
+        opts['connection_tuner'] = connection_tuner
+    if engine['throttled']:
+        # Attached to the parent's limits by _init_worker_engine
+        opts['bandwidth_limiter'] = bandwidth_limiter
+    if engine['deferred']:
+        opts['postprocess_stage'] = _defer_postprocessing_in_worker
+    return opts
+
+
+def _init_worker_engine(shared_limits, shared_postprocess_slots):
+    # Worker process initializer: draw from the parent's bandwidth budget,
+    # which Settings and PUT /api/limits keep changing while jobs run, and
+    # share its limit on post-processing running at once
+    global postprocess_slots
+    bandwidth_limiter.attach(shared_limits)
+    postprocess_slots = shared_postprocess_slots
+
+
+def _defer_postprocessing_in_worker(fn):
+    # 'postprocess_stage' in a worker process: fn runs on a thread of the
+    # worker (procpool.defer) while the worker takes the next download, and
+    # the parent's job stays 'processing' until it is done - the worker
+    # counterpart of defer_postprocessing
+    def run():
+        with postprocess_slots:
+            return fn()
+    return procpool.defer(run)
+
+
+def _defer_to_current_job(ydl_opts):
+    # on_deferred for ProcessPool.run: the current job waits for the
+    # post-processing its worker handed off, as with defer_postprocessing
+    job = current_job()
+    if job is None or 'postprocess_stage' not in ydl_opts:
+        return None
+    return job.defer
+
+
+def _download_task(url, opts, engine, info):
+    # Runs in a worker process, see run_download
+    opts = _worker_ydl_opts(opts, engine)
+    if info is not None:
+        return run_with_cookie_fallback(
+            opts, lambda ydl: download_from_info(ydl, info, url))
+    return run_with_cookie_fallback(opts, lambda ydl: ydl.download([url]))
+
+
+def _extract_task(url, opts, engine, download):
+    # Runs in a worker process, see run_extraction
+    opts = _worker_ydl_opts(opts, engine)
+    return run_with_cookie_fallback(
+        opts,
+        lambda ydl: ydl.sanitize_info(ydl.extract_info(url, download=download)))
+
+
+def list_playlist_entries(ydl, url):
+    """Yield a playlist's entries flat - {'id', 'url', 'title',
+    'archive_id', 'info'} dicts, no per-entry extraction - as the extractor
+    pages through them. archive_id is the entry's download archive key.
+    info is the entry's info dict if the extractor already resolved it
+    (Threads profiles, carousels; see run_download), else None."""
+    info = ydl.extract_info(url, download=False, process=False)
+    if info.get('_type') in ('url', 'url_transparent'):
+        info = ydl.extract_info(info['url'], download=False, process=False,
+                                ie_key=info.get('ie_key'))
+    for entry in info.get('entries') or []:
+        if not entry:
+            continue
+        entry_url = entry.get('url') or entry.get('webpage_url')
+        if is_playlist_url(entry_url):
+            # A channel URL lists its tabs (videos, shorts, live) as
+            # playlists of their own
+            yield from list_playlist_entries(ydl, entry_url)
+            continue
+        yield playlist_entry_item(entry, entry_url)
+
+
+def playlist_entry_item(entry, entry_url):
+    """The list_playlist_entries dict of a playlist entry (flat, or
+    resolved) whose page is entry_url."""
+    ie_key = entry.get('ie_key') or entry.get('extractor_key')
+    return {'id': entry.get('id'),
+            'url': entry_url,
+            'title': entry.get('title') or entry.get('id'),
+            'archive_id': (make_archive_id(ie_key, entry['id'])
+                           if ie_key and entry.get('id')
+                           else canonical_key_str(entry_url)),
+            'info': entry if entry.get('formats') else None}
+
+
+def select_playlist_entries(entries, start=None, end=None, reverse=False):
+    """(playlist_index, entry) pairs to download, with the semantics of
+    yt-dlp's playliststart/playlistend/playlist_reverse: the range picks by
+    original position, reversing only changes the order."""
+    selected = list(enumerate(entries, 1))[(start or 1) - 1:end]
+    if reverse:
+        selected.reverse()
+    return selected
+
+
+# How long extraction results stay cached per site. The expiry stamped into
+# the stream URLs themselves caps this further (see metacache.py).
+SITE_CACHE_TTLS = {"youtube": 3 * 60 * 60, "instagram": 30 * 60, "threads": 30 * 60}
+
+extraction_cache = ExtractionCache(
+    os.path.join(get_base_path(), "extraction_cache.sqlite3"),
+    site_ttls=SITE_CACHE_TTLS)
+
+# Concurrent extract_info_cached calls for the same cache key share one
+# extraction (e.g. the GUI's auto-fetch and a manual search)
+extraction_flights = SingleFlight()
+
+
+def extraction_cache_key(url, settings):
+    """Cache key for url: a logged-in extraction can see formats an
+    anonymous one can't, so the cookie source is part of the key; so are
+    extractor arguments, which change what is extracted."""
+    opts = site_ydl_opts(url, settings)
+    cookies = opts.get("cookiesfrombrowser")
+    key = f"{canonical_key_str(url)}|{cookies[0] if cookies else ''}"
+    if opts.get("extractor_args"):
+        key += f"|{json.dumps(opts['extractor_args'], sort_keys=True)}"
+    return key
+
+
+def extract_info_cached(url, settings, cancel_event=None):
+    """extract_info(url, download=False), served from the extraction cache
+    when possible. Only single videos are stored; a resolved playlist is
+    far too large. A call for a URL already being extracted waits for
+    that extraction instead of starting another. Setting cancel_event
+    aborts the extraction with DownloadCancelled (or, while waiting for
+    another caller's, CancelledError)."""
+    key = extraction_cache_key(url, settings)
+    info = extraction_cache.get(key)
+    if info is not None:
+        logger.debug(f"Extraction cache hit for {url}")
+        return info
+
+    def extract():
+        ydl_opts = site_ydl_opts(url, settings)
+        if cancel_event is not None:
+            ydl_opts['cancel_event'] = cancel_event
+        info = run_extraction(url, ydl_opts)
+        if 'entries' not in info:
+            extraction_cache.put(key, info, site=site_of(url))
+        return info
+    return extraction_flights.do(key, extract, cancel_event)
+
+
+# Learns per CDN host how many fragments/byte ranges to fetch at once;
+# remembered across runs. Its starting value is set by configure_engine().
+connection_tuner = ConnectionTuner(
+    os.path.join(get_base_path(), "connection_tuning.json"),
+    default=DEFAULT_SETTINGS["connections_per_download"], minimum=1, maximum=16)
+
+# Bandwidth caps shared by every download in the process; configured from
+# settings by configure_engine() and changed live from Settings and
+# PUT /api/limits
+bandwidth_limiter = BandwidthLimiter()
+
+
+def apply_rate_limits(settings):
+    """Push the KB/s limits in settings to bandwidth_limiter."""
+    bandwidth_limiter.configure(
+        total=settings["download_rate_limit"] * 1024,
+        per_download=settings["per_download_rate_limit"] * 1024,
+        per_site={site: rate * 1024
+                  for site, rate in settings["site_rate_limits"].items()})
+
+
+# One scheduler for the whole process, so GUI and extension downloads share
+# a single bounded worker pool and the per-site caps. Sized from settings in
+# configure_engine() and resized when Settings are saved.
+job_scheduler = JobScheduler(
+    max_workers=DEFAULT_SETTINGS["max_concurrent_downloads"],
+    site_limits=SITE_CONCURRENCY)
+
+# Browser cookies for Instagram/Threads, loaded once and shared instead of
+# read from the browser's database by every yt-dlp instance
+browser_cookies = BrowserCookieCache()
+
+def _new_ydl(params):
+    # ydl_pool's factory. Raises CookiesUnavailable if the browser cookies
+    # params asks for can't be had.
+    spec = params.get('cookiesfrombrowser')
+    if spec is not None:
+        params['cookie_jar'] = browser_cookies.get(spec)
+    return RangedYoutubeDL(params)
+
+
+# Finished YoutubeDL instances, handed out again to runs with the same
+# options, so repeated fetches/downloads reuse their connections
+ydl_pool = YoutubeDLPool(_new_ydl)
+
+# Every video downloaded successfully, as 'extractor id' lines (yt-dlp's
+# download archive format). Downloads record into it; syncs of a playlist
+# or channel skip what it holds without resolving those entries.
+download_archive = DownloadArchive(os.path.join(get_base_path(), "download_archive.txt"))
+
+
+def new_playlist_entries(selected):
+    """The (playlist_index, entry) pairs from select_playlist_entries
+    whose video isn't in the download archive yet."""
+    return [(index, entry) for index, entry in selected
+            if entry['archive_id'] not in download_archive]
+
+
+# Downloads queued or running, so the ones an exit or crash interrupted are
+# queued again at the next start (resume_jobs)
+job_journal = JobJournal(os.path.join(get_base_path(), "jobs.sqlite3"))
+job_scheduler.journal = job_journal
+
+
+def _resumed_download(url, ydl_opts):
+    # Target of a job queued by resume_jobs
+    if run_download(url, with_job_progress(ydl_opts)) != 0:
+        # Only reachable with ignoreerrors (playlists)
+        raise Exception("Some playlist entries could not be downloaded")
+
+
+def resume_jobs(settings):
+    """Queue the downloads the journal holds from the last run again and
+    return their Jobs. They extract afresh (stream URLs expire) and yt-dlp
+    continues their partial files and fragments instead of starting over."""
+    entries = job_journal.unfinished()
+    journaled = {job_id for job_id, _ in entries}
+    specs = []
+    for job_id, spec in entries:
+        if spec.get('parent') in journaled:
+            continue  # its playlist is downloaded again as a whole
+        try:
+            url = spec['url']
+            opts = {**site_ydl_opts(url, settings), **spec['opts']}
+            if spec.get('sync'):
+                opts['download_archive'] = download_archive
+        except (KeyError, TypeError):
+            logger.warning(f"Skipping unreadable journal entry {job_id}")
+            continue
+        specs.append({
+            'target': functools.partial(_resumed_download, url, opts),
+            'url': url,
+            'key': canonical_key_str(url),
+            'site': site_of(url),
+            'priority': spec.get('priority', PRIORITY_NORMAL),
+            'label': spec.get('label'),
+            'dedupe_key': download_dedupe_key(url, opts),
+            'resume': {k: v for k, v in spec.items() if k != 'parent'},
+        })
+    jobs = job_scheduler.submit_many(specs) if specs else []
+    # The new jobs are journaled under their own ids
+    for job_id in journaled:
+        job_journal.remove(job_id)
+    if jobs:
+        logger.info(f"Resuming {len(jobs)} unfinished download(s)")
+    return jobs
+
+
+# ffmpeg post-processing (merging formats, mp3 conversion) of finished
+# downloads runs here, sized to the CPU count: the download slot goes on to
+# the next download (or playlist entry) while conversions run in parallel.
+# Threads suffice, the work happens in ffmpeg subprocesses.
+POSTPROCESS_WORKERS = os.cpu_count() or 2
+postprocess_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=POSTPROCESS_WORKERS, thread_name_prefix='postprocess')
+
+
+def defer_postprocessing(fn):
+    """'postprocess_stage' of RangedYoutubeDL: run fn on postprocess_pool
+    as part of the current scheduler job (which stays 'processing' until
+    it is done). Outside a job fn runs inline. In a worker process the
+    stage is _defer_postprocessing_in_worker instead."""
+    job = current_job()
+    if job is None:
+        return None
+    future = postprocess_pool.submit(fn)
+    job.defer(future)
+    return future
+
+
+# Worker processes for "processes" execution mode (procpool.py), else None.
+# Set up by configure_execution().
+process_pool = None
+# How many workers' post-processing may run at once, across all of them:
+# a semaphore shared with the workers, sized like postprocess_pool
+postprocess_slots = None
+
+
+def configure_execution(settings):
+    """Switch between thread and process execution and size the process
+    pool like the scheduler. Jobs already running finish where they are."""
+    global process_pool, postprocess_slots
+    if settings["execution_mode"] == "processes":
+        if process_pool is None:
+            if postprocess_slots is None:
+                postprocess_slots = multiprocessing.get_context('spawn').BoundedSemaphore(
+                    POSTPROCESS_WORKERS)
+            process_pool = procpool.ProcessPool(
+                settings["max_concurrent_downloads"],
+                settings["worker_recycle_after"],
+                initializer=_init_worker_engine,
+                initargs=(bandwidth_limiter.share(site for site, _ in SITE_URL_RES),
+                          postprocess_slots))
+        elif (process_pool.max_workers != settings["max_concurrent_downloads"]
+              or process_pool.max_tasks_per_child != settings["worker_recycle_after"]):
+            process_pool.resize(settings["max_concurrent_downloads"],
+                                settings["worker_recycle_after"])
+    elif process_pool is not None:
+        pool, process_pool = process_pool, None
+        pool.shutdown(wait=False)
+
+
+def stop_process_pool():
+    """Shut the worker processes down (waiting for running tasks)."""
+    global process_pool
+    if process_pool is not None:
+        pool, process_pool = process_pool, None
+        pool.shutdown(wait=True)
+
+
+def configure_engine(settings):
+    """Apply loaded settings to the process-wide engine objects; called once
+    at startup by either entry point."""
+    job_scheduler.set_max_workers(settings["max_concurrent_downloads"])
+    connection_tuner.default = settings["connections_per_download"]
+    apply_rate_limits(settings)
+    configure_execution(settings)
@@ -0,0 +1,1467 @@
+"""Tkinter desktop app; started through downstream.py."""
+import sys
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import ttk, messagebox, filedialog
+import os
+import re
+import threading
+import functools
+import logging
+from datetime import datetime
+import pyperclip
+
+# Configure logging with more detailed format
+logging.basicConfig(
+    level=logging.DEBUG,  # Changed to DEBUG for more verbose logging
+    format='%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+from core import (
+    APP_NAME, APP_VERSION, QUALITY_FORMATS, AUDIO_FORMATS,
+    SUPPORTED_URL_RE, CROSSPOST_ERROR_RE,
+    get_base_path, load_settings, write_settings_file, build_download_paths,
+    audio_postprocessors,
+    PER_VIDEO_FORMAT_SITES,
+    canonical_key_str, canonical_url, is_playlist_url, site_of, site_ydl_opts,
+    download_dedupe_key, download_resume_spec, resume_jobs,
+    run_with_cookie_fallback, run_download, with_job_progress,
+    list_playlist_entries, playlist_entry_item, select_playlist_entries,
+    new_playlist_entries,
+    extract_info_cached, download_archive,
+    bandwidth_limiter, apply_rate_limits, job_scheduler, configure_engine,
+    configure_execution,
+)
+from scheduler import PRIORITY_HIGH, current_job
+from server import run_api_server
+
+
+class FormatSelector(tk.Toplevel):
+    def __init__(self, parent, formats, merge_audio=False):
+        self.selected_format = None
+        self.merge_audio = merge_audio
+        try:
+            super().__init__(parent)
+            self.title("Select Format")
+
+            if not formats:
+                self.geometry("600x120")
+                self.resizable(False, False)
+                ttk.Label(self, text="No suitable formats found for this download type.").pack(pady=20)
+                ttk.Button(self, text="Close", command=self.destroy).pack(pady=10)
+                return
+
+            # Bottom bar packed first so it keeps its space when resizing
+            btn_frame = ttk.Frame(self)
+            btn_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(0, 8))
+            ttk.Button(btn_frame, text="Download",
+                       command=self.select_format).pack()
+
+            main_frame = ttk.Frame(self)
+            main_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+            self.tree = ttk.Treeview(main_frame, columns=("format_id", "ext", "resolution", "filesize", "tbr", "acodec"), show="headings")
+
+            self.tree.heading("format_id", text="ID")
+            self.tree.heading("ext", text="Format")
+            self.tree.heading("resolution", text="Resolution")
+            self.tree.heading("filesize", text="File Size")
+            self.tree.heading("tbr", text="Bitrate")
+            self.tree.heading("acodec", text="Audio")
+
+            self.tree.column("format_id", width=40)
+            self.tree.column("ext", width=50)
+            self.tree.column("resolution", width=100)
+            self.tree.column("filesize", width=80)
+            self.tree.column("tbr", width=70)
+            self.tree.column("acodec", width=80)
+
+            scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.tree.yview)
+            self.tree.configure(yscrollcommand=scrollbar.set)
+
+            self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+            for f in formats:
+                try:
+                    filesize = f.get('filesize', None)
+                    if filesize and filesize > 0:
+                        filesize = f"{filesize/1024/1024:.1f} MB"
+                    else:
+                        filesize = "N/A"
+
+                    resolution = f.get('resolution', 'N/A')
+                    if resolution == 'audio only':
+                        resolution = f"Audio ({f.get('abr', 'N/A')}kbps)"
+                    elif f.get('height'):
+                        resolution = f"{f.get('height')}p"
+
+                    acodec = f.get('acodec', 'N/A')
+                    if self.merge_audio and acodec in (None, 'none'):
+                        # Video-only stream; best audio is merged at download
+                        acodec = 'auto (best)'
+
+                    self.tree.insert("", tk.END, values=(
+                        str(f.get('format_id', 'N/A')),
+                        str(f.get('ext', 'N/A')),
+                        str(resolution),
+                        str(filesize),
+                        f"{str(f.get('tbr', 'N/A'))} kbps" if f.get('tbr') else 'N/A',
+                        str(acodec)
+                    ))
+                except Exception as e:
+                    logger.error(f"Error processing format: {str(e)}")
+                    continue
+
+            self.tree.bind('<Double-1>', lambda e: self.select_format())
+
+            # Resizable, but no taller than the end of the list
+            rowheight = 20
+            try:
+                rh = ttk.Style(self).lookup("Treeview", "rowheight")
+                rowheight = int(rh) if rh else 20
+            except (ValueError, tk.TclError):
+                pass
+            chrome = 95  # heading row + button bar + padding
+            full_height = len(formats) * rowheight + chrome
+            self.resizable(True, True)
+            self.minsize(460, min(200, full_height))
+            self.maxsize(1200, max(200, full_height))
+            self.geometry(f"600x{min(300, full_height)}")
+
+            self.grab_set()
+        except Exception as e:
+            logger.error(f"Error in FormatSelector initialization: {str(e)}", exc_info=True)
+            messagebox.showerror("Error", f"Failed to initialize format selector: {str(e)}")
+            self.destroy()
+
+    def select_format(self):
+        selection = self.tree.selection()
+        if not selection:
+            self.bell()  # Download pressed with nothing selected
+            return
+        values = self.tree.item(selection[0])['values']
+        self.selected_format = str(values[0])
+        self.destroy()
+
+class DownstreamApp:
+    def __init__(self, root):
+        try:
+            logger.debug("Initializing Downstream GUI")
+            self.root = root
+            self.root.title(f"{APP_NAME} v{APP_VERSION}")
+
+            # Initialize variables
+            self.setup_gui()
+
+            # Size the window to exactly fit its content (no clipped fields,
+            # no dead space) and keep it fixed
+            self.root.update_idletasks()
+            self.root.geometry("")
+            self.root.resizable(False, False)
+            self.resume_downloads()
+            logger.debug("GUI initialization completed")
+        except Exception as e:
+            logger.error(f"Failed to initialize GUI: {str(e)}", exc_info=True)
+            messagebox.showerror("Error", f"Failed to initialize application: {str(e)}")
+            raise
+
+    def setup_gui(self):
+        try:
+            logger.debug("Setting up GUI components")
+            # Settings are loaded first so widgets can pick up saved defaults
+            self.base_path = get_base_path()
+            self.settings = self.load_settings()
+            self.set_window_icon()
+
+            # Configure button style
+            self.style = ttk.Style()
+            self.style.configure("TButton", padding=5, width=10)
+            self.style.configure("TLabel", padding=3)
+
+            # Main frame setup - the frame's own padding is the window
+            # margin; no extra outer padding on top of it
+            self.main_frame = ttk.Frame(self.root, padding="10")
+            self.main_frame.pack(fill=tk.BOTH, expand=True)
+
+            # Create and pack all GUI elements
+            self.create_url_frame()
+            self.create_download_options()
+            self.create_playlist_options()
+            self.create_progress_frame()
+
+            # Settings lives in the window's native title-bar menu (the icon
+            # at the top left); deferred until the window exists on screen
+            self.root.after(200, self.add_settings_to_system_menu)
+            logger.debug("GUI setup completed successfully")
+        except Exception as e:
+            logger.error(f"Error in setup_gui: {str(e)}", exc_info=True)
+            raise
+
+    def set_window_icon(self):
+        # icon.ico sits next to the script in development; PyInstaller unpacks
+        # bundled data files into sys._MEIPASS
+        candidates = [os.path.join(self.base_path, "icon.ico")]
+        if getattr(sys, 'frozen', False):
+            candidates.insert(0, os.path.join(sys._MEIPASS, "icon.ico"))
+        for icon_path in candidates:
+            if os.path.exists(icon_path):
+                try:
+                    # default= applies to every window (Settings, History, ...)
+                    self.root.iconbitmap(default=icon_path)
+                except tk.TclError:
+                    logger.warning(f"Could not apply window icon {icon_path}")
+                return
+
+    # App-defined WM_SYSCOMMAND ids must be < 0xF000
+    SYSMENU_SETTINGS_ID = 0x1000
+    SYSMENU_HISTORY_ID = 0x1010
+
+    def add_settings_to_system_menu(self):
+        """Append Settings... and Download History... to the native
+        title-bar (system) menu.
+
+        Windows-only: the system menu belongs to the OS window, so this uses
+        the Win32 API and subclasses the window procedure to receive the
+        clicks. On other platforms (or if the hook fails) a plain menubar is
+        used instead so the dialogs stay reachable.
+        """
+        if os.name != 'nt':
+            self._fallback_menubar()
+            return
+        # Never install twice: rebinding _wnd_proc_ref would garbage-collect
+        # the callback Windows is still calling, crashing the process
+        if getattr(self, '_wnd_proc_ref', None) is not None:
+            return
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            user32 = ctypes.windll.user32
+            LRESULT = ctypes.c_longlong
+            GWLP_WNDPROC = -4
+            WM_SYSCOMMAND = 0x0112
+            MF_SEPARATOR, MF_STRING = 0x800, 0x0
+
+            # The OS-level window is the parent of Tk's inner window
+            hwnd = user32.GetParent(self.root.winfo_id())
+            if not hwnd:
+                return
+
+            user32.GetSystemMenu.restype = ctypes.c_void_p
+            user32.GetSystemMenu.argtypes = [wintypes.HWND, wintypes.BOOL]
+            user32.AppendMenuW.argtypes = [ctypes.c_void_p, ctypes.c_uint,
+                                           ctypes.c_size_t, wintypes.LPCWSTR]
+            self._sysmenu_actions = {
+                self.SYSMENU_SETTINGS_ID: ("Settings...", self.show_settings),
+                self.SYSMENU_HISTORY_ID: ("Download History...", self.show_history),
+            }
+            sysmenu = user32.GetSystemMenu(hwnd, False)
+            user32.AppendMenuW(sysmenu, MF_SEPARATOR, 0, None)
+            for item_id, (label, _) in self._sysmenu_actions.items():
+                user32.AppendMenuW(sysmenu, MF_STRING, item_id, label)
+
+            user32.CallWindowProcW.restype = LRESULT
+            user32.CallWindowProcW.argtypes = [ctypes.c_void_p, wintypes.HWND,
+                                               ctypes.c_uint, wintypes.WPARAM,
+                                               wintypes.LPARAM]
+            user32.SetWindowLongPtrW.restype = ctypes.c_void_p
+            user32.SetWindowLongPtrW.argtypes = [wintypes.HWND, ctypes.c_int,
+                                                 ctypes.c_void_p]
+
+            WNDPROC = ctypes.WINFUNCTYPE(LRESULT, wintypes.HWND, ctypes.c_uint,
+                                         wintypes.WPARAM, wintypes.LPARAM)
+
+            # The callback must not call into Tcl/Tk: it runs re-entrantly
+            # inside Tk's own message dispatch, which crashes the
+            # interpreter. It only queues the id; the poller below reacts.
+            self._sysmenu_clicked_ids = []
+
+            def wnd_proc(h, msg, wparam, lparam):
+                if msg == WM_SYSCOMMAND and int(wparam) in self._sysmenu_actions:
+                    self._sysmenu_clicked_ids.append(int(wparam))
+                    return 0
+                return user32.CallWindowProcW(self._old_wnd_proc, h, msg, wparam, lparam)
+
+            # Keep a reference on self: if the callback is garbage collected
+            # while installed, the process crashes
+            self._wnd_proc_ref = WNDPROC(wnd_proc)
+            self._old_wnd_proc = user32.SetWindowLongPtrW(
+                hwnd, GWLP_WNDPROC,
+                ctypes.cast(self._wnd_proc_ref, ctypes.c_void_p))
+
+            def poll_sysmenu():
+                while self._sysmenu_clicked_ids:
+                    item_id = self._sysmenu_clicked_ids.pop(0)
+                    self._sysmenu_actions[item_id][1]()
+                self.root.after(150, poll_sysmenu)
+            poll_sysmenu()
+            logger.debug("Settings and History added to the system menu")
+        except Exception:
+            logger.warning("Could not modify the system menu; falling back "
+                           "to a menubar", exc_info=True)
+            self._fallback_menubar()
+
+    def _fallback_menubar(self):
+        menubar = tk.Menu(self.root, tearoff=0)
+        app_menu = tk.Menu(menubar, tearoff=0)
+        app_menu.add_command(label="Settings...", command=self.show_settings)
+        app_menu.add_command(label="Download History...", command=self.show_history)
+        menubar.add_cascade(label="Menu", menu=app_menu)
+        self.root.config(menu=menubar)
+
+    def create_url_frame(self):
+        # URL Frame with validation
+        url_frame = ttk.Frame(self.main_frame)
+        url_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Label(url_frame, text="Video URL:").pack(side=tk.LEFT)
+        self.url_var = tk.StringVar()
+        self.url_entry = ttk.Entry(url_frame, textvariable=self.url_var)
+        self.url_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+
+        self.add_context_menu(self.url_entry)
+        self.check_clipboard()
+
+        # Enter in the URL field starts the format search
+        self.url_entry.bind('<Return>', lambda e: self.prepare_download())
+
+        # Auto-fetch formats when a complete video URL lands in the field
+        # (paste or typing). The trace is installed after check_clipboard so
+        # a URL auto-filled from the clipboard at startup doesn't pop a
+        # dialog before the user has done anything.
+        self._auto_fetch_job = None
+        # Cancel event of the running format search, see run_fetch
+        self._fetch_cancel = None
+        self._last_fetched_url = canonical_url(self.url_var.get().strip())
+        self.url_var.trace_add('write', self._schedule_auto_fetch)
+
+    # Matches only complete video/shorts/playlist/reel/post URLs so
+    # auto-fetch doesn't fire on a half-typed address
+    AUTO_FETCH_RE = re.compile(
+        r'(youtube\.com/watch\?\S*v=[\w-]{11}'
+        r'|youtu\.be/[\w-]{11}'
+        r'|youtube\.com/shorts/[\w-]{11}'
+        r'|youtube\.com/playlist\?\S*list=[\w-]+'
+        # youtube.com/@handle, /channel/UC..., /c/..., /user/... and their
+        # videos/shorts/live tabs
+        r'|youtube\.com/(?:@[\w.-]+|channel/UC[\w-]+|c/[\w.-]+|user/[\w.-]+)'
+        r'(?:/(?:videos|shorts|streams))?/?(?:[?#]\S*)?$'
+        # instagram.com/reel/CODE, /reels/, /p/, /tv/ - with or without a
+        # leading /username/ path segment (share links include one)
+        r'|instagram\.com/(?:[\w.]+/)?(?:reels?|p|tv)/[\w-]+'
+        # threads.net|.com/@username/post/CODE
+        r'|threads\.(?:net|com)/@?[\w.]+/post/[\w-]+'
+        # threads.net|.com/@username (profile), or its /media tab
+        r'|threads\.(?:net|com)/@[\w.]+(?:/media)?/?(?:[?#]\S*)?$)',
+        re.IGNORECASE
+    )
+
+    def _schedule_auto_fetch(self, *_):
+        # A search still running for a URL no longer in the field is stale
+        if canonical_url(self.url_var.get().strip()) != self._last_fetched_url:
+            self.cancel_fetch()
+        if self._auto_fetch_job is not None:
+            self.root.after_cancel(self._auto_fetch_job)
+        self._auto_fetch_job = self.root.after(700, self._auto_fetch)
+
+    def _auto_fetch(self):
+        self._auto_fetch_job = None
+        url = self.url_var.get().strip()
+        if (url and canonical_url(url) != self._last_fetched_url
+                and self.AUTO_FETCH_RE.search(url)):
+            self.prepare_download()
+
+    def paste_url(self):
+        """Paste the clipboard URL and search for formats immediately."""
+        try:
+            text = (pyperclip.paste() or "").strip()
+        except Exception:
+            text = ""
+        if not text:
+            messagebox.showerror("Error", "Clipboard is empty")
+            return
+        self.url_var.set(text)
+        # Skip the debounce the paste just scheduled - search right now
+        if self._auto_fetch_job is not None:
+            self.root.after_cancel(self._auto_fetch_job)
+            self._auto_fetch_job = None
+        self.prepare_download()
+
+    def create_download_options(self):
+        # The Download button sits to the right of the option box, outside it
+        options_row = ttk.Frame(self.main_frame)
+        options_row.pack(fill=tk.X, pady=(0, 10))
+
+        download_frame = ttk.LabelFrame(options_row, text="Download Options", padding="10")
+        download_frame.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        saved_type = self.settings.get("default_download_type", "video+audio")
+        if saved_type not in ("video+audio", "video-only", "audio-only"):
+            saved_type = "video+audio"
+        self.download_type = tk.StringVar(value=saved_type)
+        ttk.Radiobutton(download_frame, text="Video + Audio", value="video+audio",
+                       variable=self.download_type).pack(side=tk.LEFT, padx=10)
+        ttk.Radiobutton(download_frame, text="Video Only", value="video-only",
+                       variable=self.download_type).pack(side=tk.LEFT, padx=10)
+        ttk.Radiobutton(download_frame, text="Audio Only", value="audio-only",
+                       variable=self.download_type).pack(side=tk.LEFT, padx=10)
+
+        # Paste stacked on Download beside the box. The buttons are placed
+        # with exact pixel geometry (see _align_action_buttons) so their
+        # outer edges meet the box's drawn outline, which starts half a
+        # label-line below the widget's top edge
+        self.download_frame = download_frame
+        self._btn_spacer = ttk.Frame(options_row, width=100)
+        self._btn_spacer.pack(side=tk.LEFT, fill=tk.Y, padx=(10, 0))
+
+        self.paste_btn = tk.Button(self._btn_spacer, text="Paste", width=12,
+                                   command=self.paste_url, relief=tk.RAISED)
+        self.download_btn = tk.Button(self._btn_spacer, text="Download", width=12,
+                                      command=self.prepare_download, relief=tk.RAISED)
+        self._btn_spacer.configure(
+            width=max(self.paste_btn.winfo_reqwidth(),
+                      self.download_btn.winfo_reqwidth()))
+        # Align once the box is actually on screen with real geometry;
+        # idle-time callbacks can fire before Tk has computed any sizes
+        self.download_frame.bind('<Map>', lambda e: self._align_action_buttons())
+
+    def _align_action_buttons(self):
+        """Pin Paste/Download to the drawn outline of the options box."""
+        offset = tkfont.nametofont("TkDefaultFont").metrics("linespace") // 2
+        box_height = self.download_frame.winfo_height()
+        if box_height < 20:  # geometry not computed yet - try again shortly
+            self.root.after(50, self._align_action_buttons)
+            return
+        usable = box_height - offset
+        gap = 3
+        top_h = (usable - gap) // 2
+        bottom_h = usable - gap - top_h   # bottom edge lands exactly on the box
+        width = self._btn_spacer.winfo_reqwidth()
+        self.paste_btn.place(x=0, y=offset, width=width, height=top_h)
+        self.download_btn.place(x=0, y=offset + top_h + gap, width=width, height=bottom_h)
+
+    def create_playlist_options(self):
+        # Add playlist options frame
+        playlist_frame = ttk.LabelFrame(self.main_frame, text="Playlist Options", padding="10")
+        playlist_frame.pack(fill=tk.X, pady=(0, 10))
+        self.playlist_frame = playlist_frame
+
+        self.is_playlist = tk.BooleanVar(value=False)
+        self.playlist_info = None
+
+        # Playlist checkboxes
+        self.download_all = tk.BooleanVar(value=True)
+        self.reverse_playlist = tk.BooleanVar(value=False)
+        # Sync: skip videos already in the download archive
+        self.sync_playlist = tk.BooleanVar(value=False)
+
+        ttk.Checkbutton(playlist_frame, text="Download All Videos", 
+                       variable=self.download_all).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(playlist_frame, text="Reverse Order", 
+                       variable=self.reverse_playlist).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(playlist_frame, text="Only New", 
+                       variable=self.sync_playlist).pack(side=tk.LEFT, padx=5)
+
+        # Add playlist range entries
+        range_frame = ttk.Frame(playlist_frame)
+        range_frame.pack(side=tk.LEFT, padx=5)
+
+        self.start_index = tk.StringVar(value="")
+        self.end_index = tk.StringVar(value="")
+
+        ttk.Label(range_frame, text="Start:").pack(side=tk.LEFT)
+        ttk.Entry(range_frame, textvariable=self.start_index, width=5).pack(side=tk.LEFT, padx=2)
+        ttk.Label(range_frame, text="End:").pack(side=tk.LEFT, padx=2)
+        ttk.Entry(range_frame, textvariable=self.end_index, width=5).pack(side=tk.LEFT)
+
+        # Titles of the loaded playlist's entries, filled in page by page as
+        # the flat listing streams in; packed only while a playlist is loaded
+        self.playlist_entries_frame = ttk.Frame(self.main_frame)
+        self.playlist_entries = tk.Listbox(self.playlist_entries_frame, height=6,
+                                           activestyle='none')
+        entries_scrollbar = ttk.Scrollbar(self.playlist_entries_frame, orient=tk.VERTICAL,
+                                          command=self.playlist_entries.yview)
+        self.playlist_entries.configure(yscrollcommand=entries_scrollbar.set)
+        self.playlist_entries.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        entries_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+    def add_playlist_entries(self, titles):
+        if not self.playlist_entries_frame.winfo_manager():
+            self.playlist_entries_frame.pack(fill=tk.X, pady=(0, 10),
+                                             after=self.playlist_frame)
+        for title in titles:
+            index = self.playlist_entries.size() + 1
+            self.playlist_entries.insert(tk.END, f"{index}. {title}")
+        self.status_var.set(
+            f"Loading playlist... {self.playlist_entries.size()} videos so far")
+
+    def clear_playlist_entries(self):
+        self.playlist_entries.delete(0, tk.END)
+        self.playlist_entries_frame.pack_forget()
+
+    def create_progress_frame(self):
+        progress_frame = ttk.Frame(self.main_frame)
+        progress_frame.pack(fill=tk.X, pady=(5, 0))  
+
+        self.progress_var = tk.DoubleVar()
+        self.progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var, 
+                                          maximum=100, mode='determinate')
+        self.progress_bar.pack(fill=tk.X)
+
+        status_row = ttk.Frame(progress_frame)
+        status_row.pack(fill=tk.X, pady=(2, 0))
+        self.status_var = tk.StringVar(value="Ready")
+        self.status_label = ttk.Label(status_row, textvariable=self.status_var)
+        self.status_label.pack(side=tk.LEFT)
+
+        # Stops the format search and this window's downloads
+        self.active_jobs = set()
+        self.cancel_btn = ttk.Button(status_row, text="Cancel", state=tk.DISABLED,
+                                     command=self.cancel_downloads)
+        self.cancel_btn.pack(side=tk.RIGHT)
+
+    def flash_status(self, flashes=3, interval=250):
+        """Flash the status label red the given number of times, then
+        restore the theme's default text color."""
+        def step(i):
+            if i >= flashes * 2:
+                self.status_label.configure(foreground='')
+                return
+            self.status_label.configure(foreground='red' if i % 2 == 0 else 'black')
+            self.root.after(interval, step, i + 1)
+        step(0)
+
+    def add_context_menu(self, entry):
+        menu = tk.Menu(entry, tearoff=0)
+        menu.add_command(label="Cut", command=lambda: entry.event_generate("<<Cut>>"))
+        menu.add_command(label="Copy", command=lambda: entry.event_generate("<<Copy>>"))
+        menu.add_command(label="Paste", command=lambda: entry.event_generate("<<Paste>>"))
+
+        def show_menu(event):
+            menu.tk_popup(event.x_root, event.y_root)
+
+        entry.bind("<Button-3>", show_menu)  
+        entry.bind("<Control-Button-1>", show_menu)  
+
+    def prepare_download(self):
+        url = self.url_var.get().strip()
+        if not url:
+            messagebox.showerror("Error", "Please enter a video URL")
+            return
+
+        if not SUPPORTED_URL_RE.search(url):
+            messagebox.showerror(
+                "Error",
+                "Unsupported URL.\n\nSupported sites: YouTube, Instagram, Threads")
+            return
+
+        # Equivalent links (share links, timestamps, mirror domains) all
+        # become the same URL. Also strips a playlist URL down to its list=
+        url = canonical_url(url)
+
+        # Remember what we fetched so the auto-fetch trace doesn't fire a
+        # second search for the same URL
+        self._last_fetched_url = url
+
+        # Auto download: no format fetch, no picker - yt-dlp resolves the
+        # configured quality preset itself at download time
+        if self.settings.get("auto_download"):
+            quality = self.settings.get("auto_download_quality", "best")
+            self.status_var.set(f"Auto-downloading ({quality} quality)...")
+            self.start_download(
+                url, auto_quality=quality,
+                is_playlist=is_playlist_url(url))
+            return
+
+        self.status_var.set("Fetching available formats...")
+        if is_playlist_url(url):
+            target = self.fetch_playlist
+        else:
+            target = self.fetch_formats
+        self.cancel_fetch()
+        cancel = self._fetch_cancel = threading.Event()
+        self.update_cancel_button()
+        threading.Thread(target=self.run_fetch, args=(target, url, cancel),
+                         daemon=True).start()
+
+    def run_fetch(self, target, url, cancel):
+        """Run target(url, cancel) - a format search - on this thread. cancel
+        is set when the search is abandoned (Cancel, or a new URL); yt-dlp
+        then stops at its next request and the search shows nothing."""
+        def finished():
+            if self._fetch_cancel is cancel:
+                self._fetch_cancel = None
+                self.update_cancel_button()
+        try:
+            target(url, cancel)
+        finally:
+            self.root.after(0, finished)
+
+    def cancel_fetch(self):
+        """Abandon the running format search; True if there was one."""
+        if self._fetch_cancel is None:
+            return False
+        self._fetch_cancel.set()
+        self._fetch_cancel = None
+        self.update_cancel_button()
+        return True
+
+    def fetch_formats(self, url, cancel):
+        try:
+            info = extract_info_cached(url, self.settings, cancel)
+            if cancel.is_set():
+                return
+
+            # Check if URL is a playlist
+            is_playlist = 'entries' in info
+            self.root.after(0, self.is_playlist.set, is_playlist)
+            if is_playlist:
+                # The same listing fetch_playlist builds, complete already:
+                # the download starts from these entries instead of
+                # listing the playlist again. A resolved entry's 'url' is
+                # its stream's, so its page URL is taken.
+                entries = [playlist_entry_item(entry, entry['webpage_url'])
+                           for entry in info['entries'] if entry]
+                self.playlist_info = {'url': url, 'entries': entries, 'complete': True}
+                self.root.after(0, self.clear_playlist_entries)
+                self.root.after(0, self.add_playlist_entries,
+                                [entry['title'] for entry in entries])
+                # For playlists, use the first video's formats
+                formats = info['entries'][0]['formats'] if info['entries'] else []
+
+                # Update status with playlist info
+                playlist_count = len(info['entries'])
+                self.root.after(0, self.status_var.set, f"Playlist detected: {playlist_count} videos")
+            else:
+                self.playlist_info = None
+                formats = info['formats']
+                self.root.after(0, self.clear_playlist_entries)
+
+            formats = self.filter_formats(formats)
+
+            # Show format selector; a single video's info is handed on so
+            # the download doesn't extract it again
+            video_info = None if is_playlist else info
+            self.root.after(0, lambda: self.show_format_selector(
+                formats, url, video_info))
+
+        except Exception as e:
+            if not cancel.is_set():
+                self.show_fetch_error(e)
+
+    # Flat playlist listings stream into the entry list in pages this size
+    PLAYLIST_PAGE_SIZE = 50
+
+    def fetch_playlist(self, url, cancel):
+        """List a playlist flat - ids and titles only, no per-entry
+        extraction - streaming titles into the UI page by page. Only the
+        first entry is fully extracted, to seed the format picker."""
+        self.root.after(0, self.is_playlist.set, True)
+        self.root.after(0, self.clear_playlist_entries)
+
+        def list_entries(ydl):
+            # Only what the UI and the download need; a resolved entry holds
+            # hundreds of KB of formats
+            listing = self.playlist_info = {'url': url, 'entries': [], 'complete': False}
+            page = []
+            for item in list_playlist_entries(ydl, url):
+                listing['entries'].append(item)
+                if len(listing['entries']) == 1:
+                    threading.Thread(target=self.seed_playlist_picker,
+                                     args=(url, item, cancel), daemon=True).start()
+                page.append(item['title'])
+                if len(page) >= self.PLAYLIST_PAGE_SIZE:
+                    self.root.after(0, self.add_playlist_entries, page)
+                    page = []
+            if page:
+                self.root.after(0, self.add_playlist_entries, page)
+            listing['complete'] = True
+            return listing['entries']
+
+        try:
+            entries = run_with_cookie_fallback(
+                {**site_ydl_opts(url, self.settings), 'cancel_event': cancel},
+                list_entries)
+            if cancel.is_set():
+                return
+            count = len(entries)
+            new = len(new_playlist_entries(enumerate(entries)))
+            self.root.after(0, self.status_var.set,
+                            f"Playlist detected: {count} videos"
+                            + (f" ({new} not downloaded yet)" if new < count else ""))
+            if not count:
+                self.root.after(0, lambda: self.show_format_selector([], url))
+        except Exception as e:
+            if not cancel.is_set():
+                self.show_fetch_error(e)
+
+    def seed_playlist_picker(self, url, entry, cancel):
+        """Open the format picker with the formats of a playlist's first
+        entry (a list_playlist_entries item). An entry the listing already
+        resolved (Threads profiles) isn't extracted again."""
+        try:
+            info = entry['info'] or extract_info_cached(entry['url'], self.settings, cancel)
+            if cancel.is_set():
+                return
+            formats = self.filter_formats(info.get('formats') or [])
+            self.root.after(0, lambda: self.show_format_selector(formats, url))
+        except Exception as e:
+            if not cancel.is_set():
+                self.show_fetch_error(e)
+
+    def filter_formats(self, formats):
+        """Formats suitable for the selected download type, best first."""
+        # Filter and sort formats based on download type
+        download_type = self.download_type.get()
+        all_formats = formats
+        if download_type == "video+audio":
+            # List every video format, not just files that already
+            # contain audio - YouTube only serves those at low
+            # resolution. Audio is merged in at download time.
+            formats = [f for f in formats if
+                f.get('vcodec') != 'none' and
+                f.get('ext') in ['mp4', 'mkv', 'webm']
+            ]
+            if not formats:
+                # Other sites (Instagram/Threads) may use containers
+                # not in the list above - accept any video stream
+                formats = [f for f in all_formats if f.get('vcodec') != 'none']
+            formats.sort(key=lambda x: (
+                int(x.get('height', 0) or 0),
+                float(x.get('tbr', 0) or 0)
+            ), reverse=True)
+        elif download_type == "video-only":
+            formats = [f for f in formats if
+                f.get('vcodec') != 'none' and
+                f.get('acodec') == 'none' and
+                f.get('ext') in ['mp4', 'webm']
+            ]
+            formats.sort(key=lambda x: int(x.get('height', 0) or 0), reverse=True)
+        else:  # audio-only
+            formats = [f for f in formats if
+                f.get('acodec') != 'none' and
+                f.get('vcodec') == 'none' and
+                f.get('ext') in ['m4a', 'mp3', 'opus', 'webm']
+            ]
+            formats.sort(key=lambda x: float(x.get('abr', 0) or 0), reverse=True)
+            if not formats:
+                # Instagram/Threads usually have no separate audio
+                # streams; offer combined files (acodec may be
+                # unknown/None there) - the audio extraction step
+                # (audio_postprocessors) strips the video at download
+                # time, copying the audio stream as is or converting it
+                # to the chosen audio format
+                formats = [f for f in all_formats if
+                           f.get('acodec') != 'none']
+                formats.sort(key=lambda x: float(
+                    x.get('abr', 0) or x.get('tbr', 0) or 0), reverse=True)
+        return formats
+
+    def show_fetch_error(self, e):
+        error_msg = str(e)
+        crosspost = CROSSPOST_ERROR_RE.search(error_msg)
+        if crosspost:
+            self.root.after(0, self.show_crosspost_warning,
+                            crosspost.group('source'), crosspost.group('url'))
+        else:
+            self.root.after(0, lambda: messagebox.showerror("Error", f"Failed to fetch formats: {error_msg}"))
+            self.root.after(0, self.status_var.set, "Ready")
+
+    def show_crosspost_warning(self, source, source_url):
+        """The Threads post has no video of its own - it's cross-posted from
+        another site. Say where the video actually lives and, when the app
+        supports that site, offer to download from there right away."""
+        self.status_var.set(f"Cross-post - video is on {source}")
+        if SUPPORTED_URL_RE.search(source_url):
+            if messagebox.askyesno(
+                    "Cross-posted video",
+                    "This Threads post is a cross-post - the video is "
+                    f"actually hosted on {source}:\n\n{source_url}\n\n"
+                    f"Download it from {source} now?"):
+                self.url_var.set(source_url)
+                self.prepare_download()
+        else:
+            messagebox.showwarning(
+                "Cross-posted video",
+                "This Threads post is a cross-post - the video is actually "
+                f"hosted on {source}. Download it from the source "
+                f"instead:\n\n{source_url}")
+
+    def show_format_selector(self, formats, url, info=None):
+        selector = FormatSelector(self.root, formats,
+                                  merge_audio=self.download_type.get() == "video+audio")
+        self.root.wait_window(selector)
+        if not selector.selected_format:
+            self.status_var.set("Download cancelled")
+        elif (info is None and self.is_playlist.get()
+                and site_of(url) in PER_VIDEO_FORMAT_SITES):
+            # The picker lists the first video's formats, whose ids the
+            # other videos don't have: download every video at the picked
+            # resolution instead
+            picked = next((f for f in formats if str(f.get('format_id'))
+                           == str(selector.selected_format)), {})
+            self.start_download(url, auto_quality='best', like_format=picked)
+        else:
+            self.start_download(url, selector.selected_format, info=info)
+
+    def start_download(self, url, format_id=None, auto_quality=None, is_playlist=None,
+                       info=None, like_format=None):
+        """Download url.
+
+        Either format_id (a concrete format chosen in the picker) or
+        auto_quality ('best'/'medium'/'low', resolved by yt-dlp via
+        QUALITY_FORMATS) must be given. like_format, with auto_quality, is a
+        format picked on another video (see show_format_selector): the
+        closest resolution is taken, else the best file there is.
+        is_playlist=None means "use the state discovered by fetch_formats";
+        auto downloads skip that fetch, so they pass an explicit URL-based
+        value instead. info is the
+        still-fresh info dict fetch_formats extracted for url, if any; the
+        download then starts from it instead of extracting again.
+        """
+        format_id = str(format_id) if format_id is not None else None
+        download_type = self.download_type.get()
+        if is_playlist is None:
+            is_playlist = self.is_playlist.get() and self.playlist_info
+
+        # Only prefix filenames with the playlist index for playlist downloads;
+        # for single videos %(playlist_index)s expands to "NA"
+        outtmpl = '%(playlist_index)s-%(title)s.%(ext)s' if is_playlist else '%(title)s.%(ext)s'
+
+        ydl_opts = {
+            **site_ydl_opts(url, self.settings),
+            'outtmpl': outtmpl,
+            'paths': build_download_paths(self.settings),
+            'progress_hooks': [self.download_progress_hook],
+        }
+
+        if not is_playlist:
+            # A watch URL carrying a &list= param must not pull the playlist
+            ydl_opts['noplaylist'] = True
+
+        if is_playlist:
+            # Skip broken entries and keep downloading the rest. Only for
+            # playlists: on a single video this would swallow the real error
+            # and leave nothing but a generic non-zero exit code
+            ydl_opts['ignoreerrors'] = True
+            # Add playlist-specific options
+            if not self.download_all.get():
+                try:
+                    start = int(self.start_index.get()) if self.start_index.get() else None
+                    end = int(self.end_index.get()) if self.end_index.get() else None
+
+                    if start is not None and start < 1:
+                        raise ValueError("Start index must be 1 or greater")
+                    if end is not None and start is not None and end < start:
+                        raise ValueError("End index must be greater than start index")
+
+                    if start is not None:
+                        ydl_opts['playliststart'] = start
+                    if end is not None:
+                        ydl_opts['playlistend'] = end
+                except ValueError as e:
+                    messagebox.showerror("Error", str(e))
+                    return
+
+            ydl_opts['noplaylist'] = False
+            ydl_opts['playlist_reverse'] = self.reverse_playlist.get()
+            if self.sync_playlist.get():
+                # yt-dlp skips archived entries before resolving them
+                ydl_opts['download_archive'] = download_archive
+
+        if auto_quality is not None:
+            type_presets = QUALITY_FORMATS[download_type]
+            format_expr, format_sort = type_presets.get(
+                auto_quality, type_presets['best'])
+            if like_format is not None:
+                if not format_expr.endswith('/best'):
+                    format_expr += '/best'
+                if like_format.get('height') and download_type != "audio-only":
+                    format_sort = [f"res:{like_format['height']}"]
+            ydl_opts['format'] = format_expr
+            if format_sort:
+                ydl_opts['format_sort'] = format_sort
+            if download_type == "video+audio":
+                ydl_opts['merge_output_format'] = self.settings['format']
+            elif download_type == "audio-only":
+                ydl_opts['postprocessors'] = audio_postprocessors(
+                    self.settings["audio_format"])
+        elif download_type == "video+audio":
+            # Merge the chosen video with the best audio; fall back to the
+            # bare format (progressive files already contain audio)
+            ydl_opts.update({
+                'format': f'{format_id}+bestaudio[ext=m4a]/{format_id}+bestaudio/{format_id}/best',
+                'merge_output_format': self.settings['format']
+            })
+        elif download_type == "video-only":
+            ydl_opts['format'] = format_id
+        else:
+            ydl_opts.update({
+                'format': format_id,
+                'postprocessors': audio_postprocessors(self.settings["audio_format"]),
+            })
+
+        sync = ydl_opts.get('download_archive') is download_archive
+        playlist_suffix = (" (Playlist sync)" if sync
+                           else " (Playlist)" if is_playlist else "")
+        format_desc = f'auto-{auto_quality}' if auto_quality else format_id
+        if like_format is not None:
+            format_desc = f"{like_format['height']}p" if like_format.get('height') else 'best'
+
+        if is_playlist and self.settings.get("parallel_playlist_downloads"):
+            self.start_playlist_fanout(url, ydl_opts, f"{download_type}:{format_desc}")
+            return
+
+        def report_failure(error):
+            # yt-dlp errors read "ERROR: <reason>"; show just the reason
+            error_msg = re.sub(r'^\s*ERROR:\s*', '', error)
+            self.log_download(url, f"{download_type}:{format_desc}", f"Failed: {error_msg}")
+            crosspost = CROSSPOST_ERROR_RE.search(error_msg)
+            if crosspost:
+                self.root.after(0, self.show_crosspost_warning,
+                                crosspost.group('source'), crosspost.group('url'))
+            else:
+                self.root.after(0, self.status_var.set, "Download failed!")
+                self.root.after(0, lambda: messagebox.showerror("Error", f"Download failed: {error_msg}"))
+            self.root.after(0, self.progress_var.set, 0)
+
+        def job_finished(job):
+            # Runs once merging/conversion on the post-processing pool is
+            # done too
+            if job.state == 'failed':
+                report_failure(job.error)
+                return
+            if job.state == 'cancelled':
+                self.log_download(url, f"{download_type}:{format_desc}", "Cancelled")
+                self.root.after(0, self.status_var.set, "Download cancelled")
+                self.root.after(0, self.progress_var.set, 0)
+                return
+            self.root.after(0, self.status_var.set, "Download completed!")
+            self.root.after(0, self.flash_status)
+            self.root.after(0, self.progress_var.set, 100)
+            self.root.after(2000, self.progress_var.set, 0)
+            self.log_download(url, f"{download_type}:{format_desc}", "Success" + playlist_suffix)
+
+        def download_thread():
+            # Outcome is reported by job_finished
+            self.root.after(0, self.status_var.set, "Downloading..." + playlist_suffix)
+            error_code = run_download(url, with_job_progress(ydl_opts), info)
+            if error_code != 0:
+                # Only reachable with ignoreerrors (playlists): some
+                # entries failed but the rest were downloaded
+                raise Exception("Some playlist entries could not be downloaded "
+                                "(see download history for details)")
+            if current_job().deferred:
+                self.root.after(0, self.status_var.set, "Converting..." + playlist_suffix)
+
+        label = f"{download_type}:{format_desc}"
+        job = job_scheduler.submit(
+            download_thread, url, key=canonical_key_str(url),
+            site=site_of(url), priority=PRIORITY_HIGH, label=label,
+            dedupe_key=download_dedupe_key(url, ydl_opts),
+            resume=download_resume_spec(url, ydl_opts, label, PRIORITY_HIGH))
+        self.track_job(job)
+        job.add_done_callback(job_finished)
+        if job.target is not download_thread:
+            # Same download already queued or running (double click, or
+            # the extension); this one just reports its outcome
+            self.status_var.set("Already downloading this - waiting for it to finish...")
+        elif job.state == 'queued':
+            ahead = job_scheduler.queued_ahead(job)
+            self.status_var.set(
+                f"Queued - waiting for a free download slot ({ahead} ahead)..."
+                if ahead else "Queued - waiting for a free download slot...")
+
+    def start_playlist_fanout(self, url, ydl_opts, desc):
+        """Download a playlist's entries as separate scheduler jobs, so up
+        to "Parallel downloads" of them run at once. Most of a playlist of
+        short videos is per-entry extraction latency, which this overlaps.
+
+        ydl_opts are the playlist download's options; their playlist range
+        and order are applied here and each entry's %(playlist_index)s is
+        baked into its output template. As with ignoreerrors, a failing
+        entry doesn't stop the others.
+        """
+        start = ydl_opts.get('playliststart')
+        end = ydl_opts.get('playlistend')
+        reverse = ydl_opts.get('playlist_reverse')
+        sync = ydl_opts.get('download_archive') is download_archive
+        entry_opts = {k: v for k, v in ydl_opts.items() if k not in (
+            'playliststart', 'playlistend', 'playlist_reverse',
+            'ignoreerrors', 'progress_hooks')}
+        entry_opts['noplaylist'] = True
+        # Entries already listed for the picker (if the listing finished)
+        listed = self.playlist_info
+        known = (listed['entries'] if listed and listed.get('url') == url
+                 and listed.get('complete') else None)
+
+        def plan():
+            entries = known
+            if entries is None:
+                self.root.after(0, self.status_var.set, "Listing playlist...")
+                entries = run_with_cookie_fallback(
+                    with_job_progress(site_ydl_opts(url, self.settings)),
+                    lambda ydl: list(list_playlist_entries(ydl, url)))
+            selected = select_playlist_entries(entries, start, end, reverse)
+            if not selected:
+                raise Exception("No playlist entries in the selected range")
+            if sync:
+                selected = new_playlist_entries(selected)
+                if not selected:
+                    self.log_download(url, desc, "Up to date (Playlist sync)")
+                    self.root.after(0, self.status_var.set, "Up to date - no new videos")
+                    return
+            # yt-dlp pads %(playlist_index)s to the digits of the last index
+            width = len(str(max(index for index, _ in selected)))
+            state = {'finished': 0, 'failed': 0, 'cancelled': 0}
+            lock = threading.Lock()
+
+            def entry_finished(outcome):
+                # outcome: the entry job's final state
+                with lock:
+                    state['finished'] += 1
+                    if outcome != 'done':
+                        state[outcome] += 1
+                    finished, failed = state['finished'], state['failed']
+                    cancelled = state['cancelled']
+                total = len(selected)
+                self.root.after(0, self.progress_var.set, finished / total * 100)
+                if finished < total:
+                    self.root.after(0, self.status_var.set,
+                                    f"Downloading playlist: {finished} of {total} done...")
+                    return
+                if cancelled:
+                    self.log_download(url, desc, f"Cancelled ({total - cancelled} of "
+                                      f"{total} playlist entries finished before)")
+                    self.root.after(0, self.status_var.set, "Download cancelled")
+                elif failed:
+                    self.log_download(url, desc, f"Failed: {failed} of {total} "
+                                      "playlist entries could not be downloaded")
+                    self.root.after(0, self.status_var.set,
+                                    f"Download finished - {failed} of {total} videos failed "
+                                    "(see download history)")
+                else:
+                    self.log_download(url, desc, f"Success ({total} new, Playlist sync)"
+                                      if sync else "Success (Playlist)")
+                    self.root.after(0, self.status_var.set, "Download completed!")
+                self.root.after(0, self.flash_status)
+                self.root.after(2000, self.progress_var.set, 0)
+
+            def entry_done(entry_url, job):
+                # When the job is done, conversion included
+                if job.state == 'failed':
+                    error_msg = re.sub(r'^\s*ERROR:\s*', '', job.error)
+                    self.log_download(entry_url, desc, f"Failed: {error_msg}")
+                entry_finished(job.state)
+
+            def entry_job(entry_url, opts, info):
+                run_download(entry_url, with_job_progress(opts), info)
+
+            self.root.after(0, self.status_var.set,
+                            f"Downloading playlist: 0 of {len(selected)} done...")
+            plan_job = current_job()
+            for index, entry in selected:
+                opts = dict(entry_opts, outtmpl=f"{index:0{width}d}-%(title)s.%(ext)s")
+                job = job_scheduler.submit(
+                    functools.partial(entry_job, entry['url'], opts, entry['info']),
+                    entry['url'], key=canonical_key_str(entry['url']), site=site_of(url),
+                    priority=PRIORITY_HIGH, label=f"{desc} #{index}",
+                    dedupe_key=download_dedupe_key(entry['url'], opts),
+                    resume=download_resume_spec(
+                        entry['url'], opts, f"{desc} #{index}", PRIORITY_HIGH,
+                        parent=plan_job.id))
+                self.track_job(job)
+                job.add_done_callback(functools.partial(entry_done, entry['url']))
+                if plan_job.cancel_event.is_set():
+                    # Cancel pressed while entries were being queued
+                    job_scheduler.cancel(job.id)
+
+        def plan_finished(job):
+            if job.state == 'cancelled':
+                self.log_download(url, desc, "Cancelled")
+                self.root.after(0, self.status_var.set, "Download cancelled")
+            elif job.state == 'failed':
+                error_msg = re.sub(r'^\s*ERROR:\s*', '', job.error)
+                self.log_download(url, desc, f"Failed: {error_msg}")
+                self.root.after(0, self.status_var.set, "Download failed!")
+                self.root.after(0, lambda: messagebox.showerror("Error", f"Download failed: {error_msg}"))
+
+        # Interrupted while queueing its entries, the playlist is resumed
+        # as one sequential download (standing in for its queued entries)
+        job = job_scheduler.submit(plan, url, key=canonical_key_str(url),
+                                   site=site_of(url), priority=PRIORITY_HIGH,
+                                   label=f"{desc} (playlist)",
+                                   dedupe_key=download_dedupe_key(url, ydl_opts),
+                                   resume=download_resume_spec(
+                                       url, ydl_opts, f"{desc} (playlist)",
+                                       PRIORITY_HIGH))
+        self.track_job(job)
+        job.add_done_callback(plan_finished)
+
+    def resume_downloads(self):
+        """Queue the downloads the last session left unfinished again."""
+        jobs = resume_jobs(self.settings)
+        if not jobs:
+            return
+        for job in jobs:
+            self.track_job(job)
+            job.add_done_callback(self.resumed_job_finished)
+        self.status_var.set(f"Resuming {len(jobs)} unfinished download(s)...")
+
+    def resumed_job_finished(self, job):
+        if job.state == 'done':
+            self.log_download(job.url, job.label, "Success (Resumed)")
+        elif job.state == 'cancelled':
+            self.log_download(job.url, job.label, "Cancelled")
+        else:
+            error_msg = re.sub(r'^\s*ERROR:\s*', '', job.error)
+            self.log_download(job.url, job.label, f"Failed: {error_msg}")
+
+    def track_job(self, job):
+        """Let the Cancel button reach job until it has finished. Callable
+        from any thread."""
+        def track():
+            self.active_jobs.add(job)
+            self.update_cancel_button()
+            job.add_done_callback(lambda job: self.root.after(0, untrack))
+
+        def untrack():
+            self.active_jobs.discard(job)
+            self.update_cancel_button()
+        self.root.after(0, track)
+
+    def update_cancel_button(self):
+        busy = self.active_jobs or self._fetch_cancel is not None
+        self.cancel_btn.configure(state=tk.NORMAL if busy else tk.DISABLED)
+
+    def cancel_downloads(self):
+        """Cancel button: stop the format search and every download started
+        from this window, queued or running."""
+        fetching = self.cancel_fetch()
+        for job in list(self.active_jobs):
+            job_scheduler.cancel(job.id)
+        if self.active_jobs:
+            # Running downloads stop within moments; their jobs report back
+            self.status_var.set("Cancelling...")
+        elif fetching:
+            self.status_var.set("Ready")
+
+    def download_progress_hook(self, d):
+        if d['status'] == 'downloading':
+            try:
+                total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
+                downloaded = d.get('downloaded_bytes', 0)
+                if total > 0:
+                    progress = (downloaded / total) * 100
+                    self.root.after(0, self.progress_var.set, progress)
+            except:
+                pass
+
+    def load_settings(self):
+        return load_settings(self.base_path)
+
+    def save_settings(self, source_var, dest_var, type_var, format_var,
+                      audio_format_var, cookies_var, auto_var, quality_var, workers_var,
+                      parallel_playlist_var, total_rate_var, job_rate_var,
+                      processes_var, settings_window):
+        source = source_var.get().strip()
+        dest = dest_var.get().strip()
+        try:
+            total_rate = int(total_rate_var.get() or 0)
+            job_rate = int(job_rate_var.get() or 0)
+            if total_rate < 0 or job_rate < 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Speed limits must be whole numbers of KB/s (0 = unlimited)")
+            return
+        if not os.path.isdir(dest):
+            messagebox.showerror("Error", f"Destination folder does not exist:\n{dest}")
+            return
+        if source and not os.path.isdir(source):
+            messagebox.showerror("Error", f"Source folder does not exist:\n{source}")
+            return
+
+        self.settings["temp_path"] = source
+        self.settings["download_path"] = dest
+        self.settings["default_download_type"] = type_var.get()
+        self.settings["format"] = format_var.get()
+        self.settings["audio_format"] = audio_format_var.get()
+        self.settings["cookies_browser"] = cookies_var.get().strip()
+        self.settings["auto_download"] = bool(auto_var.get())
+        self.settings["auto_download_quality"] = quality_var.get()
+        self.settings["max_concurrent_downloads"] = workers_var.get()
+        self.settings["parallel_playlist_downloads"] = bool(parallel_playlist_var.get())
+        self.settings["download_rate_limit"] = total_rate
+        self.settings["per_download_rate_limit"] = job_rate
+        self.settings["execution_mode"] = "processes" if processes_var.get() else "threads"
+        # Per-site limits are only set via settings.json/the API; keep any
+        # the API changed since startup
+        self.settings["site_rate_limits"] = {
+            site: rate // 1024 for site, rate in bandwidth_limiter.per_site.items()}
+        self.save_settings_file()
+        job_scheduler.set_max_workers(workers_var.get())
+        apply_rate_limits(self.settings)
+        configure_execution(self.settings)
+        # Apply the new default to the main window immediately
+        self.download_type.set(type_var.get())
+        settings_window.destroy()
+        messagebox.showinfo("Success", "Settings saved!")
+
+    def save_settings_file(self):
+        write_settings_file(self.base_path, self.settings)
+
+    def check_clipboard(self):
+        try:
+            clipboard_content = pyperclip.paste()
+            if SUPPORTED_URL_RE.search(clipboard_content or ""):
+                self.url_var.set(clipboard_content)
+        except:
+            pass
+
+    def show_settings(self):
+        settings_window = tk.Toplevel(self.root)
+        settings_window.title("Settings")
+        settings_window.geometry("520x395")
+        settings_window.resizable(False, False)
+
+        settings_frame = ttk.Frame(settings_window, padding="10")
+        settings_frame.pack(fill=tk.BOTH, expand=True)
+
+        def folder_row(label, value):
+            row = ttk.Frame(settings_frame)
+            row.pack(fill=tk.X, pady=3)
+            ttk.Label(row, text=label, width=22).pack(side=tk.LEFT)
+            var = tk.StringVar(value=value)
+            entry = ttk.Entry(row, textvariable=var)
+            entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+            self.add_context_menu(entry)
+            ttk.Button(row, text="Browse",
+                       command=lambda: self.browse_path(var)).pack(side=tk.RIGHT)
+            return var
+
+        # Source folder holds in-progress downloads; finished files are moved
+        # to the destination. Leave source empty to download directly.
+        source_var = folder_row("Source (in-progress):", self.settings.get("temp_path", ""))
+        dest_var = folder_row("Destination (finished):", self.settings["download_path"])
+
+        type_frame = ttk.Frame(settings_frame)
+        type_frame.pack(fill=tk.X, pady=3)
+        ttk.Label(type_frame, text="Default download:", width=22).pack(side=tk.LEFT)
+        type_var = tk.StringVar(value=self.download_type.get())
+        for text, value in (("Video + Audio", "video+audio"),
+                            ("Video Only", "video-only"),
+                            ("Audio Only", "audio-only")):
+            ttk.Radiobutton(type_frame, text=text, value=value,
+                            variable=type_var).pack(side=tk.LEFT, padx=4)
+
+        format_frame = ttk.Frame(settings_frame)
+        format_frame.pack(fill=tk.X, pady=3)
+        ttk.Label(format_frame, text="Format:", width=22).pack(side=tk.LEFT)
+        format_var = tk.StringVar(value=self.settings["format"])
+        format_entry = ttk.Entry(format_frame, textvariable=format_var, width=10)
+        format_entry.pack(side=tk.LEFT, padx=5)
+        # "original" keeps the downloaded audio stream; mp3 re-encodes it
+        ttk.Label(format_frame, text="Audio:").pack(side=tk.LEFT, padx=(15, 0))
+        audio_format_var = tk.StringVar(value=self.settings["audio_format"])
+        ttk.Combobox(format_frame, textvariable=audio_format_var, width=9,
+                     state="readonly",
+                     values=tuple(AUDIO_FORMATS)).pack(side=tk.LEFT, padx=5)
+
+        self.add_context_menu(format_entry)
+
+        # Instagram/Threads mostly require a login; picking a browser here
+        # lets yt-dlp reuse that browser's session cookies
+        cookies_frame = ttk.Frame(settings_frame)
+        cookies_frame.pack(fill=tk.X, pady=3)
+        ttk.Label(cookies_frame, text="Instagram/Threads login:", width=22).pack(side=tk.LEFT)
+        cookies_var = tk.StringVar(value=self.settings.get("cookies_browser", ""))
+        ttk.Combobox(cookies_frame, textvariable=cookies_var, width=10,
+                     state="readonly",
+                     values=("", "chrome", "edge", "firefox", "brave",
+                             "opera", "vivaldi")).pack(side=tk.LEFT, padx=5)
+        ttk.Label(cookies_frame,
+                  text="browser to reuse cookies from").pack(side=tk.LEFT)
+
+        # Auto download: skip the format picker and start downloading at a
+        # preset quality as soon as a URL is entered/pasted
+        auto_frame = ttk.Frame(settings_frame)
+        auto_frame.pack(fill=tk.X, pady=3)
+        ttk.Label(auto_frame, text="Auto download:", width=22).pack(side=tk.LEFT)
+        auto_var = tk.BooleanVar(value=bool(self.settings.get("auto_download")))
+        quality_var = tk.StringVar(
+            value=self.settings.get("auto_download_quality", "best"))
+        quality_box = ttk.Combobox(auto_frame, textvariable=quality_var, width=8,
+                                   state="readonly", values=("best", "medium", "low"))
+
+        def sync_quality_state(*_):
+            quality_box.configure(state="readonly" if auto_var.get() else "disabled")
+
+        ttk.Checkbutton(auto_frame, text="on, at quality:", variable=auto_var,
+                        command=sync_quality_state).pack(side=tk.LEFT, padx=5)
+        quality_box.pack(side=tk.LEFT, padx=5)
+        sync_quality_state()
+
+        # Downloads beyond this wait in a queue (GUI and extension combined)
+        workers_frame = ttk.Frame(settings_frame)
+        workers_frame.pack(fill=tk.X, pady=3)
+        ttk.Label(workers_frame, text="Parallel downloads:", width=22).pack(side=tk.LEFT)
+        workers_var = tk.IntVar(
+            value=self.settings.get("max_concurrent_downloads", 3))
+        ttk.Spinbox(workers_frame, from_=1, to=16, width=5, state="readonly",
+                    textvariable=workers_var).pack(side=tk.LEFT, padx=5)
+        parallel_playlist_var = tk.BooleanVar(
+            value=bool(self.settings.get("parallel_playlist_downloads")))
+        ttk.Checkbutton(workers_frame, text="also for playlist videos",
+                        variable=parallel_playlist_var).pack(side=tk.LEFT, padx=5)
+
+        # Extraction is CPU-heavy; in worker processes it can't make the
+        # window stutter. Takes effect for downloads started afterwards.
+        processes_frame = ttk.Frame(settings_frame)
+        processes_frame.pack(fill=tk.X, pady=3)
+        ttk.Label(processes_frame, text="", width=22).pack(side=tk.LEFT)
+        processes_var = tk.BooleanVar(
+            value=self.settings.get("execution_mode") == "processes")
+        ttk.Checkbutton(processes_frame,
+                        text="Run downloads in separate processes",
+                        variable=processes_var).pack(side=tk.LEFT, padx=5)
+
+        # Applies to running downloads too. Shown from the live limits: the
+        # extension API may have changed them since this window's settings
+        # were loaded
+        limits = bandwidth_limiter.limits()
+        rate_frame = ttk.Frame(settings_frame)
+        rate_frame.pack(fill=tk.X, pady=3)
+        ttk.Label(rate_frame, text="Speed limit (KB/s):", width=22).pack(side=tk.LEFT)
+        total_rate_var = tk.StringVar(value=str(limits['total'] // 1024))
+        total_rate_entry = ttk.Entry(rate_frame, textvariable=total_rate_var, width=7)
+        total_rate_entry.pack(side=tk.LEFT, padx=5)
+        ttk.Label(rate_frame, text="total,").pack(side=tk.LEFT)
+        job_rate_var = tk.StringVar(value=str(limits['per_download'] // 1024))
+        job_rate_entry = ttk.Entry(rate_frame, textvariable=job_rate_var, width=7)
+        job_rate_entry.pack(side=tk.LEFT, padx=5)
+        ttk.Label(rate_frame, text="per download (0 = unlimited)").pack(side=tk.LEFT)
+        self.add_context_menu(total_rate_entry)
+        self.add_context_menu(job_rate_entry)
+
+        save_frame = ttk.Frame(settings_frame)
+        save_frame.pack(fill=tk.X, pady=10)
+        ttk.Button(save_frame, text="Save",
+                   command=lambda: self.save_settings(source_var, dest_var, type_var,
+                                                      format_var, audio_format_var,
+                                                      cookies_var,
+                                                      auto_var, quality_var,
+                                                      workers_var,
+                                                      parallel_playlist_var,
+                                                      total_rate_var,
+                                                      job_rate_var,
+                                                      processes_var,
+                                                      settings_window)).pack()
+
+    def browse_path(self, path_var):
+        path = filedialog.askdirectory(
+            initialdir=path_var.get() or self.settings["download_path"])
+        if path:
+            path_var.set(path)
+
+    def log_download(self, url, download_type, status):
+        try:
+            log_path = os.path.join(self.base_path, "download_history.log")
+            with open(log_path, "a") as f:
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                f.write(f"{timestamp} | {download_type} | {url} | {status}\n")
+        except:
+            pass
+
+    def show_history(self):
+        history_window = tk.Toplevel(self.root)
+        history_window.title("Download History")
+        history_window.geometry("600x400")
+        history_window.resizable(False, False)  
+
+        text_widget = tk.Text(history_window, wrap=tk.WORD, width=70, height=20)
+        text_widget.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+
+        scrollbar = ttk.Scrollbar(history_window, orient=tk.VERTICAL, command=text_widget.yview)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text_widget.configure(yscrollcommand=scrollbar.set)
+
+        try:
+            with open(os.path.join(self.base_path, "download_history.log"), "r") as f:
+                history = f.read()
+                text_widget.insert(tk.END, history)
+        except:
+            text_widget.insert(tk.END, "No download history available.")
+
+        text_widget.configure(state=tk.DISABLED)
+
+def main():
+    logger.info("Starting Downstream application")
+    if os.name == 'nt':
+        # Give the process its own taskbar identity; otherwise Windows groups
+        # the window under pythonw.exe and shows the Python/Tk icon instead
+        # of ours
+        try:
+            import ctypes
+            ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(
+                "Boneless3vil.Downstream")
+        except Exception:
+            logger.warning("Could not set AppUserModelID", exc_info=True)
+    try:
+        configure_engine(load_settings(get_base_path()))
+
+        # Start the API server in a separate thread
+        api_thread = threading.Thread(target=run_api_server, daemon=True)
+        api_thread.start()
+        logger.info("API server started")
+
+        # Initialize Tk root with error handling
+        try:
+            root = tk.Tk()
+            logger.debug("Created Tk root window")
+
+            # Test Tk functionality
+            test_label = ttk.Label(root, text="Initializing...")
+            test_label.destroy()
+            logger.debug("Successfully tested Tk widget creation")
+
+        except tk.TclError as e:
+            logger.error(f"Failed to initialize Tk: {str(e)}", exc_info=True)
+            if "Can't find a usable init.tcl" in str(e):
+                error_msg = (
+                    "Error: Cannot initialize the graphical interface.\n\n"
+                    "This might be caused by:\n"
+                    "1. Missing Tcl/Tk libraries\n"
+                    "2. Incorrect Tcl/Tk paths\n"
+                    "3. Antivirus blocking the executable\n\n"
+                    "Try:\n"
+                    "1. Running as administrator\n"
+                    "2. Temporarily disabling antivirus\n"
+                    "3. Reinstalling the application"
+                )
+            else:
+                error_msg = f"Failed to initialize graphical interface:\n{str(e)}"
+
+            # Try to show error in GUI if possible, otherwise use console
+            try:
+                messagebox.showerror("Fatal Error", error_msg)
+            except:
+                print("FATAL ERROR:", error_msg)
+            sys.exit(1)
+
+        app = DownstreamApp(root)
+        logger.debug("Created DownstreamApp instance")
+        logger.info("Starting main event loop")
+        root.mainloop()
+
+    except Exception as e:
+        logger.error(f"Application error: {str(e)}", exc_info=True)
+        if not isinstance(e, SystemExit):
+            try:
+                messagebox.showerror("Fatal Error", 
+                                   f"Application failed to start: {str(e)}\n\n"
+                                   "Please check the logs for more details.")
+            except:
+                print("FATAL ERROR:", str(e))
+        sys.exit(1)
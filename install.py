@@ -22,7 +22,7 @@ VENV_DIR = os.path.join(SCRIPT_DIR, ".venv")
 IS_WINDOWS = os.name == "nt"
 VENV_BIN = os.path.join(VENV_DIR, "Scripts" if IS_WINDOWS else "bin")
 VENV_PYTHON = os.path.join(VENV_BIN, "python.exe" if IS_WINDOWS else "python")
-RUNTIME_PACKAGES = ["yt-dlp", "pyperclip", "flask", "flask-cors"]
+RUNTIME_PACKAGES = ["yt-dlp", "pyperclip", "flask", "flask-cors", "waitress"]
 EXTENSION_DIR = os.path.join(SCRIPT_DIR, "chrome_extension")
 
 
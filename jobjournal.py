@@ -0,0 +1,89 @@
+"""On-disk journal of unfinished download jobs.
+
+Jobs run on daemon threads, so closing the window, a crash or a reboot used
+to drop every queued and half-finished download. The scheduler records
+each job that can be restarted (its resume spec, plain JSON) here when it
+is queued and deletes the record once the job has finished - done, failed
+or cancelled. Whatever is left at the next start was interrupted and is
+queued again; yt-dlp then picks up the partial files it left behind.
+
+SQLite in WAL mode: a record is durable once add() returns, and a crash
+can't corrupt the file.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class JobJournal:
+    """Resume specs of unfinished jobs, by job id. Thread-safe; the
+    connection is opened lazily on first use."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        # Caller holds the lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY,'
+                ' created REAL NOT NULL,'
+                ' spec TEXT NOT NULL)')
+        return self._conn
+
+    def add(self, entries):
+        """Record (job id, created timestamp, spec) entries, in one
+        transaction."""
+        try:
+            rows = [(job_id, created, json.dumps(spec))
+                    for job_id, created, spec in entries]
+            with self._lock:
+                conn = self._connect()
+                conn.executemany('INSERT OR REPLACE INTO jobs (id, created, spec)'
+                                 ' VALUES (?, ?, ?)', rows)
+                conn.commit()
+        except (sqlite3.Error, TypeError, ValueError):
+            # A broken journal must never break downloads
+            logger.warning("Job journal write failed", exc_info=True)
+
+    def remove(self, job_id):
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+                conn.commit()
+        except sqlite3.Error:
+            logger.warning("Job journal write failed", exc_info=True)
+
+    def unfinished(self):
+        """[(job id, spec)] of every recorded job, oldest first."""
+        try:
+            with self._lock:
+                rows = self._connect().execute(
+                    'SELECT id, spec FROM jobs ORDER BY created').fetchall()
+        except sqlite3.Error:
+            logger.warning("Job journal read failed", exc_info=True)
+            return []
+        entries = []
+        for job_id, data in rows:
+            try:
+                entries.append((job_id, json.loads(data)))
+            except ValueError:
+                logger.warning(f"Dropping unreadable journal entry {job_id}")
+                self.remove(job_id)
+        return entries
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
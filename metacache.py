@@ -0,0 +1,164 @@
+"""Persistent extraction (metadata) cache shared by the GUI and the API.
+
+Extracted info dicts are stored as JSON in a small SQLite database, so
+re-opening a URL seen minutes ago - or one the extension just downloaded -
+skips yt-dlp's extraction entirely, across restarts too.
+
+Entries expire after a per-site TTL, but never later than the stream URLs
+inside them: YouTube (googlevideo) URLs carry an ``expire=`` unix timestamp
+and Meta's CDN URLs an ``oe=`` hex timestamp; an info dict whose URLs are
+dead is worse than no cache at all. The database is kept under a byte
+budget by evicting the least recently used entries.
+"""
+
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Expiry timestamps embedded in CDN stream URLs
+_EXPIRE_PARAM_RE = re.compile(r'[?&/]expire[=/](\d{9,11})')
+_META_OE_PARAM_RE = re.compile(r'[?&]oe=([0-9A-Fa-f]{8})')
+
+# Treat URLs as dead this long before their stated expiry, so a download
+# started from a cache hit doesn't run into it halfway through
+_EXPIRY_MARGIN = 10 * 60
+
+
+def _cdn_expiry(info):
+    """Earliest expiry timestamp of any stream URL in info, or None."""
+    expiries = []
+    for f in info.get('formats') or [info]:
+        url = f.get('url') or ''
+        m = _EXPIRE_PARAM_RE.search(url)
+        if m:
+            expiries.append(int(m.group(1)))
+        m = _META_OE_PARAM_RE.search(url)
+        if m:
+            expiries.append(int(m.group(1), 16))
+    return min(expiries) if expiries else None
+
+
+class ExtractionCache:
+    """SQLite-backed info dict cache with TTLs and LRU eviction.
+
+    Safe to use from several threads; the connection is opened lazily on
+    first use.
+    """
+
+    def __init__(self, path, site_ttls=None, default_ttl=30 * 60,
+                 max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.site_ttls = dict(site_ttls or {})
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        # Caller holds the lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                ' key TEXT PRIMARY KEY,'
+                ' site TEXT,'
+                ' info TEXT NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' expires REAL NOT NULL,'
+                ' last_used REAL NOT NULL)')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS entries_last_used'
+                ' ON entries (last_used)')
+        return self._conn
+
+    def get(self, key):
+        """The cached info dict for key, or None if missing/expired."""
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(
+                    'SELECT info, expires FROM entries WHERE key = ?',
+                    (key,)).fetchone()
+                if row is None or row[1] <= now:
+                    if row is not None:
+                        conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                        conn.commit()
+                    self.misses += 1
+                    return None
+                conn.execute('UPDATE entries SET last_used = ? WHERE key = ?',
+                             (now, key))
+                conn.commit()
+                self.hits += 1
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError):
+            # A broken cache must never break downloads
+            logger.warning("Extraction cache read failed", exc_info=True)
+            return None
+
+    def put(self, key, info, site=None):
+        """Store a JSON-serializable info dict (see YoutubeDL.sanitize_info)."""
+        now = time.time()
+        expires = now + self.site_ttls.get(site, self.default_ttl)
+        cdn_expiry = _cdn_expiry(info)
+        if cdn_expiry is not None:
+            expires = min(expires, cdn_expiry - _EXPIRY_MARGIN)
+        if expires <= now:
+            return
+        try:
+            data = json.dumps(info, default=str)
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    'INSERT OR REPLACE INTO entries'
+                    ' (key, site, info, size, expires, last_used)'
+                    ' VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, site, data, len(data), expires, now))
+                self._evict(conn, now)
+                conn.commit()
+        except (sqlite3.Error, TypeError, ValueError):
+            logger.warning("Extraction cache write failed", exc_info=True)
+
+    def _evict(self, conn, now):
+        # Caller holds the lock: drop expired entries, then the least
+        # recently used ones until the cache fits its byte budget
+        conn.execute('DELETE FROM entries WHERE expires <= ?', (now,))
+        total = conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute(
+                'SELECT key, size FROM entries ORDER BY last_used').fetchall():
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self._lock:
+            try:
+                entries, size = self._connect().execute(
+                    'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries'
+                ).fetchone()
+            except sqlite3.Error:
+                entries, size = None, None
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': entries,
+                'bytes': size,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,349 @@
+"""Running download work in a pool of worker processes.
+
+yt-dlp extraction is CPU-heavy pure Python (player JS handling, format
+sorting, JSON traversal); several extractions on threads of the GUI process
+contend for the GIL and make the window stutter. ProcessPool runs such work
+in separate processes instead. The callers still run on scheduler threads
+and simply block on the result, so queueing, priorities and per-site caps
+are unchanged.
+
+Workers send progress and log events back over a multiprocessing queue; a
+relay thread in the parent hands them to the progress hooks registered for
+the task and to this process's logging. Each worker is replaced after
+max_tasks_per_child tasks so memory yt-dlp accumulates (extractor caches,
+leaked responses) is given back regularly. Every worker process is its own
+single-process executor, so the pool counts tasks per process: a worker
+that has been handed its last task is retired - it exits once that task is
+done - and a fresh one starts when work needs it. (ProcessPoolExecutor's own
+max_tasks_per_child deadlocks on Python 3.11 when workers are replaced.)
+
+Task functions must be importable module-level functions (they are pickled
+by name), as must their arguments and results. Exceptions raised in a
+worker arrive as WorkerError with the original message.
+
+A task can be cancelled cooperatively: run() mirrors the caller's cancel
+event into a flag shared with the workers, which task code polls through
+cancel_event().
+
+A task can also hand work off past its own end with defer() (yt-dlp's
+ffmpeg post-processing): it runs on a thread of the worker process, which
+meanwhile takes the next task, and the caller's run() gets a Future in this
+process that completes along with it.
+"""
+
+import concurrent.futures
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Progress events of one task sent at most this often (status changes, e.g.
+# 'finished', always go through)
+_PROGRESS_INTERVAL = 0.2
+# Tasks that can be cancelled while running at once (slots in the shared
+# flag array); further tasks just can't be
+_CANCEL_SLOTS = 256
+# How often a waiting run() looks at its cancel event
+_CANCEL_POLL_INTERVAL = 0.2
+
+# Worker-process state, set by _init_worker / _run_task
+_events = None
+_cancel_flags = None
+_task_id = None
+_cancel_slot = None
+_last_progress = (None, 0.0)
+_deferred = None  # count of the task's defer() calls; None: not allowed
+_deferred_pool = None
+
+
+class WorkerError(Exception):
+    """An exception raised by a task in a worker process."""
+
+
+def _init_worker(events, cancel_flags, initializer, initargs):
+    global _events, _cancel_flags
+    _events = events
+    _cancel_flags = cancel_flags
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _send(kind, payload):
+    if _events is not None and _task_id is not None:
+        _events.put((_task_id, kind, payload))
+
+
+def _run_task(task_id, cancel_slot, can_defer, fn, args):
+    # Returns (fn's result, how many times it called defer())
+    global _task_id, _cancel_slot, _last_progress, _deferred
+    _task_id = task_id
+    _cancel_slot = cancel_slot
+    _last_progress = (None, 0.0)
+    _deferred = 0 if can_defer else None
+    try:
+        return fn(*args), _deferred or 0
+    except Exception as e:
+        # The original may not survive pickling (yt-dlp errors carry
+        # tracebacks); the message is what callers use
+        raise WorkerError(str(e)) from None
+    finally:
+        _task_id = None
+        _cancel_slot = None
+        _deferred = None
+
+
+class _CancelFlag:
+    def __init__(self, slot):
+        self.slot = slot
+
+    def is_set(self):
+        return bool(_cancel_flags[self.slot])
+
+
+def cancel_event():
+    """For use inside a worker: an object whose is_set() tells whether the
+    running task was cancelled (like the threading.Event given to run()),
+    or None if the task can't be cancelled."""
+    return _CancelFlag(_cancel_slot) if _cancel_slot is not None else None
+
+
+def defer(fn):
+    """For use inside a worker: run fn on a thread of this process, where it
+    may outlast the task, and return its Future; the task's run() in the
+    parent hands a matching Future to its on_deferred. Returns None (fn
+    should run inline) if that run() has no on_deferred."""
+    global _deferred, _deferred_pool
+    if _task_id is None or _deferred is None:
+        return None
+    if _deferred_pool is None:
+        _deferred_pool = concurrent.futures.ThreadPoolExecutor(
+            thread_name_prefix='deferred')
+    task_id, index, events = _task_id, _deferred, _events
+    _deferred += 1
+
+    def done(future):
+        error = future.exception()
+        events.put((task_id, 'deferred',
+                    (index, None if error is None else str(error))))
+    future = _deferred_pool.submit(fn)
+    future.add_done_callback(done)
+    return future
+
+
+def progress_hook(d):
+    """yt-dlp progress hook for use inside a worker: forwards d (minus the
+    info dict and other unpicklable values) to the parent."""
+    global _last_progress
+    now = time.monotonic()
+    status = d.get('status')
+    if status == _last_progress[0] and now - _last_progress[1] < _PROGRESS_INTERVAL:
+        return
+    _last_progress = (status, now)
+    _send('progress', {k: v for k, v in d.items()
+                       if isinstance(v, (str, int, float, bool, type(None)))})
+
+
+class WorkerLogger:
+    """yt-dlp 'logger' for use inside a worker: messages go to the parent's
+    logging instead of the worker's (invisible) stdout."""
+
+    def debug(self, msg):
+        # yt-dlp routes info-level screen output through debug() too
+        _send('log', (logging.DEBUG, msg))
+
+    def info(self, msg):
+        _send('log', (logging.INFO, msg))
+
+    def warning(self, msg):
+        _send('log', (logging.WARNING, msg))
+
+    def error(self, msg):
+        _send('log', (logging.ERROR, msg))
+
+
+def _resolve(future, error):
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(WorkerError(error))
+
+
+class _Worker:
+    """One worker process: a single-process executor and its task counts."""
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.tasks = 0    # handed to this process so far
+        self.running = 0  # submitted and not yet returned to run()
+
+
+class ProcessPool:
+    """Runs tasks on up to max_workers worker processes, each replaced after
+    max_tasks_per_child tasks. Processes start on first use and run
+    initializer(*initargs) first, if given; initargs may hold shared memory
+    and locks, which can only be handed over as a process starts."""
+
+    def __init__(self, max_workers=3, max_tasks_per_child=20,
+                 initializer=None, initargs=()):
+        self.max_workers = max(1, int(max_workers))
+        self.max_tasks_per_child = max(1, int(max_tasks_per_child))
+        self.initializer = initializer
+        self.initargs = tuple(initargs)
+        # spawn everywhere: forking a process with Tk and worker threads
+        # running is unsafe, and Windows has nothing else
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._workers = []  # processes still taking tasks
+        self._events = None
+        self._cancel_flags = None
+        self._free_slots = list(range(_CANCEL_SLOTS))
+        self._hooks = {}  # task id -> progress hooks in this process
+        self._ids = itertools.count()
+        # (task id, index) -> Future of deferred work still running, and the
+        # outcomes of deferred work that finished before its task returned
+        self._deferred = {}
+        self._deferred_early = {}
+
+    def _start(self):
+        # Caller holds the lock
+        if self._events is None:
+            self._events = self._context.Queue()
+            self._cancel_flags = self._context.Array('b', _CANCEL_SLOTS)
+            threading.Thread(target=self._relay, args=(self._events,),
+                             daemon=True, name='process-pool-relay').start()
+
+    def _new_worker(self):
+        # Caller holds the lock
+        worker = _Worker(concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._events, self._cancel_flags,
+                      self.initializer, self.initargs)))
+        self._workers.append(worker)
+        return worker
+
+    def _submit(self, *args):
+        # Caller holds the lock. An idle process, else a new one while
+        # there's room, else the least busy one (the task queues there)
+        worker = next((w for w in self._workers if not w.running), None)
+        if worker is None:
+            if len(self._workers) < self.max_workers:
+                worker = self._new_worker()
+            else:
+                worker = min(self._workers, key=lambda w: w.running)
+        future = worker.executor.submit(_run_task, *args)
+        worker.tasks += 1
+        worker.running += 1
+        if worker.tasks >= self.max_tasks_per_child:
+            # Recycle: the process exits once its submitted tasks are done
+            self._workers.remove(worker)
+            worker.executor.shutdown(wait=False)
+        return worker, future
+
+    def run(self, fn, *args, progress_hooks=(), cancel_event=None,
+            on_deferred=None):
+        """Run fn(*args) in a worker process and return its result. Blocks
+        the calling thread; progress_hooks get the task's progress events.
+        Setting cancel_event (a threading.Event) sets the task's
+        cancel_event() in the worker. on_deferred(future) is called, before
+        run() returns, for each defer() of the task; without it, defer()
+        declines and the work runs within the task."""
+        task_id = next(self._ids)
+        self._hooks[task_id] = list(progress_hooks)
+        slot = worker = None
+        try:
+            with self._lock:
+                self._start()
+                if cancel_event is not None and self._free_slots:
+                    slot = self._free_slots.pop()
+                    self._cancel_flags[slot] = 0
+                worker, future = self._submit(
+                    task_id, slot, on_deferred is not None, fn, args)
+            result, deferred = self._wait(future, slot, cancel_event)
+            for index in range(deferred):
+                on_deferred(self._deferred_future((task_id, index)))
+            return result
+        finally:
+            with self._lock:
+                self._hooks.pop(task_id, None)
+                for deferred_id in [d for d in self._deferred_early if d[0] == task_id]:
+                    del self._deferred_early[deferred_id]
+                if worker is not None:
+                    worker.running -= 1
+                if slot is not None:
+                    self._free_slots.append(slot)
+
+    def _wait(self, future, slot, cancel_event):
+        if slot is None:
+            return future.result()
+        while True:
+            try:
+                return future.result(timeout=_CANCEL_POLL_INTERVAL)
+            except concurrent.futures.TimeoutError:
+                if cancel_event.is_set():
+                    self._cancel_flags[slot] = 1
+                    future.cancel()  # if it hasn't started yet
+
+    def _deferred_future(self, deferred_id):
+        future = concurrent.futures.Future()
+        # Already under way in the worker: can't be cancelled from here
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            if deferred_id not in self._deferred_early:
+                self._deferred[deferred_id] = future
+                return future
+            error = self._deferred_early.pop(deferred_id)
+        _resolve(future, error)
+        return future
+
+    def _deferred_done(self, deferred_id, error):
+        # Relay thread: deferred work finished in a worker
+        with self._lock:
+            future = self._deferred.pop(deferred_id, None)
+            if future is None:
+                if deferred_id[0] in self._hooks:
+                    # Its task is still returning; run() picks it up. (After
+                    # a failed task nobody waits for it.)
+                    self._deferred_early[deferred_id] = error
+                return
+        _resolve(future, error)
+
+    def resize(self, max_workers=None, max_tasks_per_child=None):
+        """Apply new limits; running tasks finish on the current processes."""
+        with self._lock:
+            if max_workers is not None:
+                self.max_workers = max(1, int(max_workers))
+            if max_tasks_per_child is not None:
+                self.max_tasks_per_child = max(1, int(max_tasks_per_child))
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.executor.shutdown(wait=False)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _relay(self, events):
+        while True:
+            try:
+                task_id, kind, payload = events.get()
+            except (EOFError, OSError):
+                return
+            if kind == 'log':
+                level, msg = payload
+                logger.log(level, msg)
+                continue
+            if kind == 'deferred':
+                index, error = payload
+                self._deferred_done((task_id, index), error)
+                continue
+            for hook in self._hooks.get(task_id, ()):
+                try:
+                    hook(payload)
+                except Exception:
+                    logger.warning("Progress hook failed", exc_info=True)
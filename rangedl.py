@@ -0,0 +1,463 @@
+"""Multi-connection downloads of single-file (progressive) formats.
+
+yt-dlp's concurrent_fragment_downloads only helps fragmented DASH/HLS
+formats. Instagram/Threads videos and YouTube's progressive formats are one
+file fetched over one HTTP stream, and CDNs throttle per connection. This
+downloader splits such a file into byte ranges fetched over parallel
+connections, each written straight to its offset in a preallocated .part
+file, which is renamed into place once every range is complete.
+
+How far each range got is saved next to the .part file (.part.ranges), so
+a download interrupted by a crash, an exit or an error continues from
+there the next time instead of starting over.
+
+Servers that don't honor Range requests (no 206 / Content-Range) get the
+stock single-stream HttpFD, as do small files and anything unusual
+(POST data, impersonation, a Range already requested by the extractor).
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+
+import yt_dlp
+from yt_dlp.downloader import get_suitable_downloader
+from yt_dlp.downloader.http import HttpFD
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+from yt_dlp.utils import ContentTooShortError, DownloadCancelled, parse_http_range
+from yt_dlp.utils.networking import HTTPHeaderDict
+
+# Files smaller than this aren't worth extra connections
+MIN_SPLIT_SIZE = 4 * 1024 * 1024
+_READ_SIZE = 64 * 1024
+# Progress hooks fire at most this often, whichever connection calls them
+_PROGRESS_INTERVAL = 0.25
+# Range positions are saved at most this often while downloading
+_SAVE_INTERVAL = 1.0
+
+
+class RangesNotSupported(Exception):
+    """The server answered a Range request with the whole file."""
+
+
+class RangedHttpFD(HttpFD):
+    """HttpFD that fetches one file over several connections.
+
+    The number of connections comes from the 'ranged_connections' param
+    (values below 2 disable splitting).
+    """
+
+    FD_NAME = 'ranged-http'
+
+    def real_download(self, filename, info_dict):
+        connections = self.params.get('ranged_connections') or 1
+        headers = HTTPHeaderDict(
+            {'Accept-Encoding': 'identity'}, info_dict.get('http_headers'))
+        tmpfilename = self.temp_name(filename)
+        ranges_file = tmpfilename + '.ranges'
+        resume = (self._load_ranges(ranges_file)
+                  if self.params.get('continuedl', True)
+                  and os.path.isfile(tmpfilename) else None)
+        if (connections < 2 or filename == '-' or self.params.get('test')
+                or info_dict.get('request_data')
+                or self._get_impersonate_target(info_dict) is not None
+                or 'Range' in headers
+                # A partial file from a single-stream attempt: let HttpFD
+                # resume it instead of starting over
+                or (resume is None and os.path.isfile(tmpfilename))):
+            return super().real_download(filename, info_dict)
+
+        size = self._probe_size(info_dict['url'], headers)
+        if resume is not None and size != resume['size']:
+            # Not the file the saved ranges belong to (or no longer served
+            # in ranges); its partial data is useless
+            self.to_screen('[download] Partial file does not match; starting over')
+            self._discard(tmpfilename)
+            resume = None
+        if not size or size < MIN_SPLIT_SIZE:
+            return super().real_download(filename, info_dict)
+
+        try:
+            return self._ranged_download(filename, tmpfilename, info_dict,
+                                         headers, size, connections, resume)
+        except RangesNotSupported:
+            self.to_screen('[download] Server ignores byte ranges; '
+                           'falling back to a single connection')
+            self._discard(tmpfilename)
+            return super().real_download(filename, info_dict)
+
+    @staticmethod
+    def _load_ranges(ranges_file):
+        """Saved state of an interrupted ranged download - {'size': total,
+        'parts': [[first, last, position], ...]} - or None."""
+        try:
+            with open(ranges_file) as f:
+                state = json.load(f)
+            if all(first <= position <= last + 1
+                   for first, last, position in state['parts']):
+                return state
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    @staticmethod
+    def _save_ranges(ranges_file, size, parts):
+        # Written aside and swapped in, so a crash mid-write leaves the
+        # previous state rather than a truncated file
+        with open(ranges_file + '.tmp', 'w') as f:
+            json.dump({'size': size, 'parts': parts}, f)
+        os.replace(ranges_file + '.tmp', ranges_file)
+
+    @staticmethod
+    def _discard(tmpfilename):
+        for path in (tmpfilename, tmpfilename + '.ranges'):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def _probe_size(self, url, headers):
+        """Total size if the server serves byte ranges, else None."""
+        request = Request(url, None, headers)
+        request.headers['Range'] = 'bytes=0-0'
+        try:
+            response = self.ydl.urlopen(request)
+        except (HTTPError, TransportError):
+            return None
+        try:
+            if response.status != 206:
+                return None
+            start, _, total = parse_http_range(
+                response.headers.get('Content-Range'))
+            return total if start == 0 else None
+        finally:
+            response.close()
+
+    def _ranged_download(self, filename, tmpfilename, info_dict, headers,
+                         size, connections, resume=None):
+        # Each connection requests at most this much at once; YouTube
+        # throttles long-running range requests (the reason its formats
+        # carry an http_chunk_size)
+        chunk_size = (self.params.get('http_chunk_size')
+                      or info_dict.get('downloader_options', {}).get('http_chunk_size')
+                      or size)
+        ranges_file = tmpfilename + '.ranges'
+        self.report_destination(filename)
+        if resume is not None:
+            # [first, last, position] of each range, updated in place
+            parts = resume['parts']
+            done = sum(position - first for first, _, position in parts)
+            self.to_screen(f'[download] Resuming ranged download at {done} bytes')
+        else:
+            part_size = -(-size // connections)
+            parts = [[start, min(start + part_size, size) - 1, start]
+                     for start in range(0, size, part_size)]
+            done = 0
+            with open(tmpfilename, 'wb') as f:
+                f.truncate(size)
+            self._save_ranges(ranges_file, size, parts)
+
+        state = {'downloaded': done, 'last_hook': 0.0, 'last_save': time.time(),
+                 'error': None}
+        lock = threading.Lock()
+        start_time = time.time()
+
+        def save():
+            with lock:
+                snapshot = [list(part) for part in parts]
+            self._save_ranges(ranges_file, size, snapshot)
+
+        def report(part, n):
+            with lock:
+                part[2] += n
+                state['downloaded'] += n
+                now = time.time()
+                if now - state['last_save'] >= _SAVE_INTERVAL:
+                    state['last_save'] = now
+                    snapshot = [list(p) for p in parts]
+                else:
+                    snapshot = None
+                if now - state['last_hook'] < _PROGRESS_INTERVAL:
+                    hook = False
+                else:
+                    state['last_hook'] = now
+                    hook = True
+                downloaded = state['downloaded']
+            if snapshot is not None:
+                self._save_ranges(ranges_file, size, snapshot)
+            if not hook:
+                return
+            self._hook_progress({
+                'status': 'downloading',
+                'downloaded_bytes': downloaded,
+                'total_bytes': size,
+                'tmpfilename': tmpfilename,
+                'filename': filename,
+                'eta': self.calc_eta(start_time, now, size, downloaded),
+                'speed': self.calc_speed(start_time, now, downloaded),
+                'elapsed': now - start_time,
+                'ctx_id': info_dict.get('ctx_id'),
+            }, info_dict)
+
+        def fetch_part(part):
+            retries = self.params.get('retries', 10)
+            _, last, position = part
+            # Unbuffered: a saved position never runs ahead of the data
+            # actually handed to the OS
+            with open(tmpfilename, 'r+b', buffering=0) as f:
+                while position <= last and state['error'] is None:
+                    end = min(position + chunk_size - 1, last)
+                    request = Request(info_dict['url'], None, headers)
+                    request.headers['Range'] = f'bytes={position}-{end}'
+                    try:
+                        response = self.ydl.urlopen(request)
+                        try:
+                            if response.status != 206:
+                                raise RangesNotSupported()
+                            f.seek(position)
+                            while position <= end:
+                                if state['error'] is not None:
+                                    return  # another connection failed
+                                data = response.read(min(_READ_SIZE, end - position + 1))
+                                if not data:
+                                    raise ContentTooShortError(position, end + 1)
+                                f.write(data)
+                                position += len(data)
+                                report(part, len(data))
+                        finally:
+                            response.close()
+                    except (HTTPError, TransportError, ContentTooShortError) as err:
+                        if retries <= 0 or (isinstance(err, HTTPError)
+                                            and 400 <= err.status < 500
+                                            and err.status != 429):
+                            # Out of retries, or e.g. an expired URL (403)
+                            raise
+                        retries -= 1
+                        self.report_retry(err, self.params.get('retries', 10) - retries,
+                                          self.params.get('retries', 10))
+
+        def worker(part):
+            try:
+                fetch_part(part)
+            except BaseException as e:
+                with lock:
+                    if state['error'] is None:
+                        state['error'] = e
+
+        threads = [threading.Thread(target=worker, args=(part,), daemon=True)
+                   for part in parts if part[2] <= part[1]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if state['error'] is not None:
+            if not isinstance(state['error'], RangesNotSupported):
+                save()  # the next attempt continues from here
+            raise state['error']
+
+        self.try_rename(tmpfilename, filename)
+        if os.path.isfile(ranges_file):
+            os.remove(ranges_file)
+        self._hook_progress({
+            'downloaded_bytes': size,
+            'total_bytes': size,
+            'filename': filename,
+            'status': 'finished',
+            'elapsed': time.time() - start_time,
+            'ctx_id': info_dict.get('ctx_id'),
+        }, info_dict)
+        return True
+
+
+# Params that differ from one run of an instance to the next; reuse()
+# swaps them, everything else is fixed when the instance is created
+PER_RUN_PARAMS = frozenset({
+    'progress_hooks', 'cancel_event', 'logger', 'outtmpl', 'paths',
+    'noplaylist', 'playliststart', 'playlistend', 'playlist_reverse',
+    'ignoreerrors', 'download_archive', 'bandwidth_site'})
+
+
+class RangedYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL that downloads plain HTTP(S) formats with RangedHttpFD.
+
+    Everything else (DASH/HLS fragments, ffmpeg, external downloaders) is
+    left to yt-dlp's own downloader selection. With a ConnectionTuner in
+    the 'connection_tuner' param (see tuning.py), each format's fragment
+    and range concurrency comes from the tuner's value for its CDN host,
+    and the download's throughput is fed back to it.
+
+    With a BandwidthLimiter in the 'bandwidth_limiter' param (see
+    bandwidth.py), every response body this instance reads - plain, ranged
+    or fragmented - is throttled as one download of 'bandwidth_site'.
+
+    With a callable in the 'postprocess_stage' param, a downloaded file's
+    ffmpeg post-processing (merging formats, audio extraction, fixups, and
+    the move out of the temp folder after them) is handed to it instead of
+    running on the downloading thread: stage(fn) runs fn elsewhere and
+    returns a Future, or returns None to have it run inline after all.
+
+    A YoutubeDLCookieJar in the 'cookie_jar' param is used as the
+    instance's cookie jar instead of one loaded from 'cookiefile' /
+    'cookiesfrombrowser' (see browsercookies.py).
+
+    A video whose post-processing was handed off is recorded in the
+    'download_archive' only once that post-processing has succeeded.
+
+    With a threading.Event (or anything with is_set()) in 'cancel_event',
+    setting it stops the instance at its next HTTP request or progress
+    report - between extraction steps and within a few hundred ms of a
+    download - by raising DownloadCancelled, which yt-dlp lets through
+    even with ignoreerrors.
+
+    An instance can run again with other PER_RUN_PARAMS (see reuse()),
+    keeping its extractors, caches and open connections.
+    """
+
+    def __init__(self, params=None, *args, **kwargs):
+        super().__init__(params, *args, **kwargs)
+        self.add_progress_hook(self._check_cancelled)
+        self._start_run()
+
+    def _start_run(self):
+        limiter = self.params.get('bandwidth_limiter')
+        self._throttle = (limiter.throttle(self.params.get('bandwidth_site'))
+                          if limiter is not None else None)
+        # Futures of the current video's handed-off post-processing, and of
+        # the whole run's
+        self._deferred_pps = []
+        self._run_deferred_pps = []
+
+    def when_idle(self, fn):
+        """Call fn() once the post-processing this run handed off has
+        finished (right away if there is none); until then the instance
+        is still in use."""
+        pending = [f for f in self._run_deferred_pps if not f.done()]
+        if not pending:
+            fn()
+            return
+        remaining = [len(pending)]
+        lock = threading.Lock()
+
+        def one_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            fn()
+        for future in pending:
+            future.add_done_callback(one_done)
+
+    def reuse(self, params):
+        """Prepare for another run: take the PER_RUN_PARAMS from params
+        (dropping the previous run's) and reset per-run state. The rest of
+        params is expected to equal what the instance was created with."""
+        for key in PER_RUN_PARAMS:
+            if key in params:
+                self.params[key] = params[key]
+            else:
+                self.params.pop(key, None)
+        self._parse_outtmpl()
+        self._progress_hooks = [self._check_cancelled,
+                                *self.params.get('progress_hooks', [])]
+        # An archive object (archive.py), not a file name yt-dlp would load
+        archive = self.params.get('download_archive')
+        self.archive = archive if archive is not None else set()
+        self._download_retcode = 0
+        self._num_downloads = 0
+        self._num_videos = 0
+        self._playlist_level = 0
+        self._playlist_urls = set()
+        self._start_run()
+
+    @functools.cached_property
+    def cookiejar(self):
+        jar = self.params.get('cookie_jar')
+        return jar if jar is not None else super().cookiejar
+
+    def _check_cancelled(self, *_):
+        cancel_event = self.params.get('cancel_event')
+        if cancel_event is not None and cancel_event.is_set():
+            raise DownloadCancelled()
+
+    def urlopen(self, req):
+        self._check_cancelled()
+        response = super().urlopen(req)
+        if self._throttle is not None:
+            self._throttle.wrap(response)
+        return response
+
+    def post_process(self, filename, info, files_to_move=None):
+        stage = self.params.get('postprocess_stage')
+        pps = (info.get('__postprocessors') or []) + self._pps['post_process']
+        if stage is None or not any(isinstance(pp, FFmpegPostProcessor) for pp in pps):
+            return super().post_process(filename, info, files_to_move)
+        # The deferred run gets its own copy; yt-dlp carries on with info
+        future = stage(functools.partial(
+            super().post_process, filename, dict(info), dict(files_to_move or {})))
+        if future is None:
+            return super().post_process(filename, info, files_to_move)
+        self._deferred_pps.append(future)
+        self._run_deferred_pps.append(future)
+        info['filepath'] = filename
+        return info
+
+    def process_video_result(self, info_dict, download=True):
+        self._deferred_pps = []
+        return super().process_video_result(info_dict, download)
+
+    def record_download_archive(self, info_dict):
+        pending, self._deferred_pps = self._deferred_pps, []
+        if not pending:
+            return super().record_download_archive(info_dict)
+        remaining = [len(pending)]
+        lock = threading.Lock()
+
+        def one_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if all(not f.cancelled() and f.exception() is None for f in pending):
+                super(RangedYoutubeDL, self).record_download_archive(info_dict)
+        for future in pending:
+            future.add_done_callback(one_done)
+
+    def dl(self, name, info, subtitle=False, test=False):
+        if test or not info.get('url'):
+            return super().dl(name, info, subtitle=subtitle, test=test)
+        params = self.params
+        tuner = params.get('connection_tuner')
+        monitor = (tuner.monitor(info, self._throttle)
+                   if tuner is not None and not subtitle else None)
+        if monitor is not None:
+            params = {**params,
+                      'concurrent_fragment_downloads': monitor.connections,
+                      'ranged_connections': monitor.connections}
+
+        fd_cls = get_suitable_downloader(info, params, to_stdout=(name == '-'))
+        if (fd_cls is HttpFD and name != '-' and not subtitle
+                and (params.get('ranged_connections') or 1) >= 2):
+            fd_cls = RangedHttpFD
+        fd = fd_cls(self, params)
+        for ph in self._progress_hooks:
+            fd.add_progress_hook(ph)
+        if monitor is not None:
+            fd.add_progress_hook(monitor.progress_hook)
+            monitor.watch_retries(fd)
+        self.write_debug(f'Invoking {fd.FD_NAME} downloader on "{info["url"]}"'
+                         + (f' with {monitor.connections} connections' if monitor else ''))
+
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        try:
+            result = fd.download(name, new_info, subtitle)
+        except Exception:
+            if monitor is not None:
+                monitor.finish(ok=False)
+            raise
+        if monitor is not None:
+            monitor.finish(ok=result[0])
+        return result
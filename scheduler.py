@@ -0,0 +1,500 @@
+"""Bounded download job scheduler shared by the GUI and the extension API.
+
+Every download runs as a job on a fixed pool of worker threads instead of a
+thread of its own, so a burst of extension clicks or a few playlists can't
+start dozens of yt-dlp instances fighting over bandwidth and disk. Jobs wait
+in a priority queue (FIFO within a priority) and sites with aggressive rate
+limiting (Instagram/Threads) additionally get a per-site concurrency cap.
+
+Jobs also carry their download progress (fed by Job.progress_hook) and
+the scheduler keeps a change counter, so API clients can follow many jobs
+without polling each one (JobScheduler.changes).
+
+A job can hand work off to another stage (Job.defer, e.g. ffmpeg
+post-processing on its own pool): once its target returns, the job frees
+its download slot and stays 'processing' until the handed-off work is done.
+
+Submitting a job with the dedupe_key of one that hasn't finished yet
+returns that job instead of queueing a second one (single-flight), so a
+double click can't start two downloads racing on the same file.
+
+Jobs are cancelled cooperatively (JobScheduler.cancel): a queued job is
+dropped right away, a running one gets its cancel_event set, which its
+target is expected to poll and bail out on by raising.
+
+With a journal (see jobjournal.py), jobs submitted with a resume spec are
+recorded when queued and forgotten once finished, so the ones a crash or
+an exit interrupted can be queued again at the next start. Jobs still
+queued at shutdown are left in the journal on purpose.
+
+Kept free of tkinter so the API side can use it on its own.
+"""
+
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first. The GUI is interactive (someone is watching the progress
+# bar), so its jobs overtake queued extension downloads.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+# Finished jobs kept for status queries; older ones are forgotten
+MAX_FINISHED_JOBS = 1000
+
+_current = threading.local()
+
+
+def current_job():
+    """The Job whose target is running on this thread, or None."""
+    return getattr(_current, 'job', None)
+
+
+class Job:
+    """One unit of work: target() runs on a scheduler worker thread."""
+
+    def __init__(self, target, url, key=None, site=None,
+                 priority=PRIORITY_NORMAL, label=None, dedupe_key=None,
+                 resume=None):
+        # Short ids are plenty for a local app and easier to read in logs
+        self.id = uuid.uuid4().hex[:12]
+        self.target = target
+        self.url = url
+        # Identity of the media the job works on (the canonical
+        # 'extractor id' key), shared by all equivalent URLs
+        self.key = key or url
+        # Identity of the work itself (media plus format, type, output);
+        # see JobScheduler.submit
+        self.dedupe_key = dedupe_key
+        # JSON-able description the job can be recreated from after a
+        # restart, or None if it can't be; see JobScheduler.journal
+        self.resume = resume
+        self.site = site
+        self.priority = priority
+        self.label = label or url
+        self.state = 'queued'
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # Latest progress of the file being downloaded, see progress_hook
+        self.downloaded_bytes = None
+        self.total_bytes = None
+        self.speed = None
+        self.eta = None
+        self.filename = None
+        # Temp files (.part) of the job's downloads, removed if it is
+        # cancelled
+        self.partial_files = set()
+        # Set when the job is cancelled; the target polls it
+        self.cancel_event = threading.Event()
+        self.version = 0  # scheduler change counter at the last update
+        self.scheduler = None
+        self._deferred = []  # futures of handed-off work, see defer
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished; True if it did in time."""
+        return self._done.wait(timeout)
+
+    @property
+    def deferred(self):
+        return bool(self._deferred)
+
+    def defer(self, future):
+        """Make the job finish only once future (a concurrent.futures
+        Future) has; call from the job's target. Its exception fails the job."""
+        self._deferred.append(future)
+
+    def add_done_callback(self, fn):
+        """Call fn(job) when the job has finished, deferred work included
+        (right away if it already has)."""
+        with self._callbacks_lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def progress_hook(self, d):
+        """yt-dlp progress hook recording d on this job."""
+        if d.get('status') not in ('downloading', 'finished'):
+            return
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        self.downloaded_bytes = d.get('downloaded_bytes')
+        self.total_bytes = int(total) if total else None
+        self.speed = d.get('speed')
+        self.eta = d.get('eta')
+        self.filename = d.get('filename')
+        if d.get('tmpfilename'):
+            self.partial_files.add(d['tmpfilename'])
+        if self.scheduler is not None:
+            self.scheduler._touch(self)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'url': self.url,
+            'key': self.key,
+            'site': self.site,
+            'label': self.label,
+            'state': self.state,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'downloaded_bytes': self.downloaded_bytes,
+            'total_bytes': self.total_bytes,
+            'speed': self.speed,
+            'eta': self.eta,
+            'filename': self.filename,
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.state} {self.label!r}>'
+
+
+class JobScheduler:
+    """Runs submitted jobs on at most max_workers threads.
+
+    site_limits caps how many jobs of one site run at once; a job whose site
+    is at its cap stays queued while other sites' jobs go ahead of it.
+    """
+
+    def __init__(self, max_workers=3, site_limits=None):
+        self.max_workers = max(1, int(max_workers))
+        self.site_limits = dict(site_limits or {})
+        lock = threading.RLock()
+        self._cond = threading.Condition(lock)  # queue/worker state
+        self._changed = threading.Condition(lock)  # job updates, see changes()
+        self._queue = []  # heap of (priority, seq, job)
+        self._seq = itertools.count()
+        self._jobs = {}
+        self._running_by_site = {}
+        self._workers = []
+        self._version = 0
+        self._closed = False
+        self._inflight = {}  # dedupe key -> unfinished Job
+        # JobJournal recording the resume specs of unfinished jobs, or None
+        self.journal = None
+
+    def submit(self, target, url, key=None, site=None,
+               priority=PRIORITY_NORMAL, label=None, dedupe_key=None,
+               resume=None):
+        """Queue target() and return its Job immediately.
+
+        If an unfinished job has the same dedupe_key, that job is returned
+        instead and target is never run. resume (see Job.resume) is
+        recorded in the journal until the job has finished.
+        """
+        job = Job(target, url, key=key, site=site, priority=priority,
+                  label=label, dedupe_key=dedupe_key, resume=resume)
+        job.scheduler = self
+        with self._cond:
+            self._check_open()
+            existing = self._attach(job)
+            if existing is not None:
+                return existing
+            self._jobs[job.id] = job
+            self._touch_locked(job)
+            heapq.heappush(self._queue, (priority, next(self._seq), job))
+            # Recorded before a worker can pick it up, so a fast job
+            # can't be forgotten before it was recorded
+            self._record([job])
+            self._spawn_workers()
+            self._cond.notify()
+        logger.debug(f"Queued {job!r} ({len(self._queue)} waiting)")
+        return job
+
+    def submit_many(self, specs):
+        """Queue several jobs at once; specs are dicts of submit()'s
+        arguments. Returns the Jobs in the same order (existing ones for
+        duplicates, as with submit)."""
+        jobs = [Job(**spec) for spec in specs]
+        queued = []
+        with self._cond:
+            self._check_open()
+            for i, job in enumerate(jobs):
+                existing = self._attach(job)
+                if existing is not None:
+                    jobs[i] = existing
+                    continue
+                job.scheduler = self
+                self._jobs[job.id] = job
+                heapq.heappush(self._queue, (job.priority, next(self._seq), job))
+                self._touch_locked(job)
+                queued.append(job)
+            self._record(queued)
+            self._spawn_workers()
+            self._cond.notify_all()
+        logger.debug(f"Queued {len(jobs)} jobs ({len(self._queue)} waiting)")
+        return jobs
+
+    def _attach(self, job):
+        """The unfinished job job duplicates, or None after registering job
+        as the one in flight for its dedupe key. Caller holds the lock."""
+        if job.dedupe_key is None:
+            return None
+        existing = self._inflight.get(job.dedupe_key)
+        if existing is not None:
+            logger.debug(f"{job.label!r} is already in flight as {existing!r}")
+            return existing
+        self._inflight[job.dedupe_key] = job
+        return None
+
+    def _record(self, jobs):
+        # Caller holds the lock
+        entries = [(job.id, job.created, job.resume)
+                   for job in jobs if job.resume is not None]
+        if self.journal is not None and entries:
+            self.journal.add(entries)
+
+    def _release(self, job):
+        # Caller holds the lock
+        if job.dedupe_key is not None and self._inflight.get(job.dedupe_key) is job:
+            del self._inflight[job.dedupe_key]
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """All known jobs, oldest first."""
+        with self._cond:
+            return sorted(self._jobs.values(), key=lambda j: j.created)
+
+    def cancel(self, job_id):
+        """Cancel a job. A queued job is finished as 'cancelled' at once; a
+        running one is asked to stop (its cancel_event is set) and ends up
+        'cancelled' when its target gives up. Deferred work that hasn't
+        started is dropped. Returns the Job, or None if there is none."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished is not None:
+                return job
+            job.cancel_event.set()
+            queued = job.state == 'queued'
+            if queued:
+                self._queue = [entry for entry in self._queue if entry[2] is not job]
+                heapq.heapify(self._queue)
+            else:
+                self._touch_locked(job)
+        logger.debug(f"Cancelling {job!r}")
+        if queued:
+            self._finish(job, concurrent.futures.CancelledError())
+        for future in job._deferred:
+            future.cancel()
+        return job
+
+    def queued_ahead(self, job):
+        """How many queued jobs would run before this one."""
+        with self._cond:
+            key = next(((p, s) for p, s, j in self._queue if j is job), None)
+            if key is None:
+                return 0
+            return sum(1 for p, s, _ in self._queue if (p, s) < key)
+
+    def changes(self, since=0, timeout=None):
+        """Wait until some job changed after change counter since.
+
+        Returns (counter, jobs changed since then, oldest first); jobs is
+        empty on timeout. Pass the returned counter as since next time.
+        Intermediate progress of a job is coalesced into its latest state.
+        """
+        with self._cond:
+            if self._version <= since:
+                self._changed.wait_for(lambda: self._version > since, timeout)
+            changed = [j for j in self._jobs.values() if j.version > since]
+            return self._version, sorted(changed, key=lambda j: j.version)
+
+    def _touch(self, job):
+        with self._cond:
+            self._touch_locked(job)
+
+    def _touch_locked(self, job):
+        # Caller holds the lock
+        self._version += 1
+        job.version = self._version
+        self._changed.notify_all()
+
+    def _forget_finished(self):
+        # Caller holds the lock
+        finished = [j for j in self._jobs.values() if j.finished is not None]
+        if len(finished) > MAX_FINISHED_JOBS:
+            finished.sort(key=lambda j: j.finished)
+            for job in finished[:len(finished) - MAX_FINISHED_JOBS]:
+                del self._jobs[job.id]
+
+    def shutdown(self, timeout=None):
+        """Stop accepting jobs and wait for the running ones to finish.
+
+        Jobs still waiting in the queue are failed without being started -
+        their done callbacks run - and stay in the journal, to be resumed
+        next time. Returns True if
+        all running jobs (and their deferred work) finished within timeout
+        seconds.
+        """
+        with self._cond:
+            self._closed = True
+            unstarted = [job for _, _, job in self._queue]
+            self._queue.clear()
+            self._cond.notify_all()
+            workers = list(self._workers)
+        for job in unstarted:
+            self._finish(job, RuntimeError('Not started: shutting down'),
+                         keep_journaled=True)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in workers:
+            worker.join(None if deadline is None
+                        else max(0, deadline - time.monotonic()))
+        if any(worker.is_alive() for worker in workers):
+            return False
+        for job in self.jobs():
+            if not job.wait(None if deadline is None
+                            else max(0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def _check_open(self):
+        # Caller holds the lock
+        if self._closed:
+            raise RuntimeError('Scheduler is shut down')
+
+    def set_max_workers(self, max_workers):
+        """Resize the pool. Shrinking lets surplus workers exit once idle."""
+        with self._cond:
+            self.max_workers = max(1, int(max_workers))
+            self._spawn_workers()
+            self._cond.notify_all()
+
+    def _spawn_workers(self):
+        # Caller holds the lock. Workers start lazily so merely importing
+        # the module doesn't start threads.
+        self._workers = [w for w in self._workers if w.is_alive()]
+        if self._closed:
+            return
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker_loop, daemon=True,
+                name=f'job-worker-{len(self._workers) + 1}')
+            self._workers.append(worker)
+            worker.start()
+
+    def _site_has_room(self, site):
+        limit = self.site_limits.get(site)
+        return limit is None or self._running_by_site.get(site, 0) < limit
+
+    def _take_next(self):
+        """Pop the best-priority job whose site has a free slot, or None.
+
+        Caller holds the lock. Jobs skipped because their site is full are
+        pushed back unchanged, so they keep their place in line.
+        """
+        skipped = []
+        job = None
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            if self._site_has_room(entry[2].site):
+                job = entry[2]
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+        return job
+
+    def _worker_loop(self):
+        me = threading.current_thread()
+        while True:
+            with self._cond:
+                while True:
+                    if (self._workers.index(me) >= self.max_workers
+                            or (self._closed and not self._queue)):
+                        # Pool was shrunk (this worker is surplus) or shut down
+                        self._workers.remove(me)
+                        return
+                    job = self._take_next()
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                self._running_by_site[job.site] = (
+                    self._running_by_site.get(job.site, 0) + 1)
+                job.state = 'running'
+                job.started = time.time()
+                self._touch_locked(job)
+            _current.job = job
+            error = None
+            try:
+                job.result = job.target()
+            except Exception as e:
+                error = e
+                if job.cancel_event.is_set():
+                    logger.info(f"Job {job.id} cancelled")
+                else:
+                    logger.error(f"Job {job.id} failed: {e}", exc_info=True)
+            finally:
+                _current.job = None
+                with self._cond:
+                    self._running_by_site[job.site] -= 1
+                    # A finished job may free a site slot a queued job of
+                    # that site is waiting for
+                    self._cond.notify_all()
+                if error is None and job._deferred:
+                    with self._cond:
+                        job.state = 'processing'
+                        self._touch_locked(job)
+                    self._finish_after_deferred(job)
+                else:
+                    self._finish(job, error)
+
+    def _finish_after_deferred(self, job):
+        remaining = [len(job._deferred)]
+
+        def one_done(_):
+            with self._cond:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            errors = [concurrent.futures.CancelledError() if f.cancelled()
+                      else f.exception() for f in job._deferred]
+            errors = [e for e in errors if e is not None]
+            if errors and not job.cancel_event.is_set():
+                logger.error(f"Job {job.id} failed: {errors[0]}",
+                             exc_info=errors[0])
+            self._finish(job, errors[0] if errors else None)
+        for future in list(job._deferred):
+            future.add_done_callback(one_done)
+
+    def _finish(self, job, error=None, keep_journaled=False):
+        if error is None:
+            job.state = 'done'
+        elif job.cancel_event.is_set():
+            job.state = 'cancelled'
+            job.error = 'Cancelled'
+        else:
+            job.state = 'failed'
+            job.error = str(error)
+        job.finished = time.time()
+        with self._cond:
+            self._release(job)
+            self._touch_locked(job)
+            self._forget_finished()
+        if (self.journal is not None and job.resume is not None
+                and not keep_journaled):
+            self.journal.remove(job.id)
+        with job._callbacks_lock:
+            job._done.set()
+            callbacks, job._callbacks = job._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(job)
+            except Exception:
+                logger.error(f"Done callback of job {job.id} failed", exc_info=True)
@@ -0,0 +1,505 @@
+"""Local HTTP API for the Chrome extension and scripts.
+
+The desktop app serves it from a background thread (run_api_server). Run on its
+own - ``python server.py``, or ``python downstream.py --headless`` - it is
+a download server without the GUI: only the API and the job engine start,
+and tkinter/pyperclip are never imported, so it runs on headless machines.
+On Ctrl+C/SIGTERM it stops accepting requests and lets running downloads
+finish before exiting; a second signal exits immediately.
+"""
+
+import argparse
+import os
+import json
+import signal
+import sys
+import threading
+import time
+import logging
+from flask import Flask, Response, request, jsonify
+from flask_cors import CORS
+from waitress import wasyncore
+from waitress.server import create_server
+
+from core import (
+    APP_NAME, APP_VERSION, QUALITY_FORMATS, AUDIO_FORMATS,
+    get_base_path, load_settings, write_settings_file, build_download_paths,
+    audio_postprocessors,
+    canonical_url, canonical_key_str, site_of, site_ydl_opts, download_dedupe_key,
+    download_resume_spec, resume_jobs, download_archive,
+    run_download, run_extraction, with_job_progress,
+    extraction_cache, extraction_cache_key, bandwidth_limiter,
+    apply_rate_limits, job_scheduler, configure_engine, stop_process_pool,
+)
+from scheduler import PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+# Create Flask app instance
+flask_app = Flask(__name__)
+CORS(flask_app)  # Enable CORS for Chrome extension
+
+@flask_app.route('/')
+def index():
+    return jsonify({
+        'status': 'running',
+        'message': 'Downstream API is active'
+    })
+
+def api_job_spec(url, item_settings, app_settings):
+    """Scheduler job (JobScheduler.submit arguments) downloading url for the
+    API, with the extension's settings spelling: {'downloadType': ...,
+    'quality': ..., 'audioFormat': ..., 'sync': ...}; audioFormat defaults
+    to the app's setting. With sync, a playlist or channel URL downloads
+    only the videos not in the download archive. Raises ValueError for an
+    unknown download type or audio format."""
+    video_url = canonical_url(url)
+    download_type = item_settings.get('downloadType', 'video-audio')
+    if download_type == 'video-audio':  # extension uses this spelling
+        download_type = 'video+audio'
+    # Extension quality names -> QUALITY_FORMATS keys
+    quality = item_settings.get('quality', 'highest')
+    quality = {'highest': 'best', 'lowest': 'low'}.get(quality, quality)
+
+    type_presets = QUALITY_FORMATS.get(download_type)
+    if type_presets is None:
+        raise ValueError(f'Unknown download type: {download_type}')
+    if quality not in type_presets:
+        quality = 'best'
+    selected_format, format_sort = type_presets[quality]
+
+    ydl_opts = {
+        **site_ydl_opts(video_url, app_settings),
+        'format': selected_format,
+        'outtmpl': '%(title)s.%(ext)s',
+        'paths': build_download_paths(app_settings),
+        'merge_output_format': app_settings['format'],
+    }
+    if format_sort:
+        ydl_opts['format_sort'] = format_sort
+    if download_type == 'audio-only':
+        audio_format = item_settings.get('audioFormat', app_settings['audio_format'])
+        if audio_format not in AUDIO_FORMATS:
+            raise ValueError(f'Unknown audio format: {audio_format}')
+        ydl_opts['postprocessors'] = audio_postprocessors(audio_format)
+    sync = bool(item_settings.get('sync'))
+    if sync:
+        ydl_opts['download_archive'] = download_archive
+        # One broken video mustn't stop the rest of the sync
+        ydl_opts['ignoreerrors'] = True
+    cache_key = extraction_cache_key(video_url, app_settings)
+
+    def download_job():
+        job_opts = with_job_progress(ydl_opts)
+        # A URL recently opened in the GUI (or downloaded before) is already
+        # extracted
+        cached_info = None if sync else extraction_cache.get(cache_key)
+        try:
+            if sync:
+                if run_download(video_url, job_opts) != 0:
+                    raise Exception("Some videos could not be downloaded")
+            elif cached_info is not None:
+                run_download(video_url, job_opts, cached_info)
+            else:
+                info = run_extraction(video_url, job_opts, download=True)
+                if info and 'entries' not in info:
+                    extraction_cache.put(cache_key, info, site=site_of(video_url))
+            logger.info(f"Download completed successfully: {video_url}")
+        except Exception as e:
+            logger.error(f"Download failed: {str(e)}")
+            raise
+
+    return {
+        'target': download_job,
+        'url': video_url,
+        'key': canonical_key_str(video_url),
+        'site': site_of(video_url),
+        'priority': PRIORITY_NORMAL,
+        'label': f"{download_type}:{quality}" + (" (sync)" if sync else ""),
+        'dedupe_key': download_dedupe_key(video_url, ydl_opts),
+        'resume': download_resume_spec(
+            video_url, ydl_opts,
+            f"{download_type}:{quality}" + (" (sync)" if sync else ""), PRIORITY_NORMAL),
+    }
+
+@flask_app.route('/api/download', methods=['POST'])
+def api_download():
+    try:
+        data = request.json
+        if not data or 'url' not in data or 'settings' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid request data. Required: url and settings'
+            }), 400
+
+        logger.info(f"Download request received for URL: {data['url']}")
+        logger.debug(f"Download settings: {data['settings']}")
+
+        # Honor the folders and merge format configured in the desktop
+        # app's Settings
+        try:
+            spec = api_job_spec(data['url'], data['settings'],
+                                load_settings(get_base_path()))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        job = job_scheduler.submit(**spec)
+        if job.target is not spec['target']:
+            # The same download is already queued or running (another
+            # click, the GUI): report that job instead of racing it
+            return jsonify({'success': True, 'message': 'Download already in progress',
+                            'job_id': job.id, 'duplicate': True})
+        return jsonify({'success': True, 'message': 'Download queued',
+                        'job_id': job.id})
+
+    except Exception as e:
+        logger.error(f"Download error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Batch items are queued in chunks of this many (one scheduler lock hold
+# and journal transaction each). Waitress receives the whole request body
+# (at most API_MAX_BODY_SIZE) before the app runs, so nothing starts
+# before the upload ends; NDJSON is still parsed line by line rather than
+# as one document held in memory.
+BATCH_CHUNK_SIZE = 500
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson',
+                    'application/jsonl', 'application/x-jsonlines')
+
+@flask_app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """Queue many downloads in one request.
+
+    The body is a JSON array, or NDJSON (one item per line) with an NDJSON
+    Content-Type. An item is a URL string or {"url": ..., "downloadType":
+    ..., "quality": ...} (the /api/download settings, video+audio at best
+    by default). Items are canonicalized and duplicates (same media, type
+    and quality) queued once. Responds with a job per queued item, the
+    number of duplicates skipped and per-item errors (by 0-based index).
+    An item whose download is already in progress gets that job, marked
+    duplicate.
+    """
+    app_settings = load_settings(get_base_path())
+    if request.mimetype in NDJSON_MIMETYPES:
+        def parse_lines():
+            for line in request.stream:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield ValueError('Invalid JSON')
+        items = parse_lines()
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            return jsonify({
+                'success': False,
+                'error': 'Expected a JSON array of URLs or NDJSON'
+            }), 400
+
+    queued, errors, pending = [], [], []
+    seen = set()
+    duplicates = 0
+
+    def flush():
+        jobs = job_scheduler.submit_many([spec for _, spec in pending])
+        for (index, spec), job in zip(pending, jobs):
+            entry = {'index': index, 'url': job.url, 'job_id': job.id}
+            if job.target is not spec['target']:
+                entry['duplicate'] = True
+            queued.append(entry)
+        pending.clear()
+
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, Exception):
+                raise item
+            if isinstance(item, str):
+                item = {'url': item}
+            if not isinstance(item, dict) or not isinstance(item.get('url'), str):
+                raise ValueError('Expected a URL or an object with a url')
+            spec = api_job_spec(item['url'], item, app_settings)
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        if spec['dedupe_key'] in seen:
+            duplicates += 1
+            continue
+        seen.add(spec['dedupe_key'])
+        pending.append((index, spec))
+        if len(pending) >= BATCH_CHUNK_SIZE:
+            flush()
+    flush()
+
+    logger.info(f"Batch: {len(queued)} downloads queued, {duplicates} duplicates, "
+                f"{len(errors)} invalid")
+    return jsonify({'success': True, 'jobs': queued,
+                    'duplicates': duplicates, 'errors': errors})
+
+@flask_app.route('/api/cache', methods=['GET'])
+def api_cache_stats():
+    return jsonify(extraction_cache.stats())
+
+@flask_app.route('/api/jobs', methods=['GET'])
+def api_jobs():
+    """All known jobs, oldest first; ?state=queued,running filters."""
+    states = set(filter(None, request.args.get('state', '').split(',')))
+    return jsonify({'jobs': [job.to_dict() for job in job_scheduler.jobs()
+                             if not states or job.state in states]})
+
+@flask_app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job(job_id):
+    job = job_scheduler.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@flask_app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def api_cancel_job(job_id):
+    """Cancel a job. A queued job is cancelled at once (200); a running one
+    is asked to stop and becomes 'cancelled' shortly after (202), its
+    partial files removed."""
+    job = job_scheduler.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    if job.finished is not None:
+        return jsonify({'success': False, 'error': f'Job already {job.state}'}), 409
+    job_scheduler.cancel(job_id)
+    return jsonify(job.to_dict()), 200 if job.finished is not None else 202
+
+# Progress events of a job are merged to at most one per this many seconds
+SSE_COALESCE_INTERVAL = 0.5
+# Comment lines sent on an idle stream so proxies/clients don't time it out
+SSE_KEEPALIVE_INTERVAL = 15
+
+@flask_app.route('/api/jobs/events', methods=['GET'])
+def api_job_events():
+    """Server-Sent Events stream of job updates.
+
+    Each event is 'event: job' with a job's JSON (as /api/jobs/<id>) and
+    its id set to the scheduler's change counter, so a reconnecting
+    EventSource (Last-Event-ID) resumes without losing updates. A new
+    stream starts with every unfinished job. ?job=<id>[,<id>...] limits it
+    to those jobs.
+    """
+    wanted = set(filter(None, request.args.get('job', '').split(',')))
+    try:
+        since = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        since = None
+
+    def stream():
+        version = since
+        if version is None:
+            version, _ = job_scheduler.changes(0, timeout=0)
+            jobs = [j for j in job_scheduler.jobs() if j.finished is None]
+        else:
+            jobs = []
+        # Waitress sends the response headers with the first chunk; without
+        # one now, an EventSource with nothing to report yet would wait for
+        # the first change or keep-alive to see the connection open
+        yield ": connected\n\n"
+        idle_since = time.monotonic()
+        # Ends when the server shuts down, so the stream doesn't hold it up
+        while not api_stopping.is_set():
+            for job in jobs:
+                if not wanted or job.id in wanted:
+                    yield (f"id: {version}\nevent: job\n"
+                           f"data: {json.dumps(job.to_dict())}\n\n")
+                    idle_since = time.monotonic()
+            time.sleep(SSE_COALESCE_INTERVAL)
+            version, jobs = job_scheduler.changes(version, timeout=1)
+            if time.monotonic() - idle_since >= SSE_KEEPALIVE_INTERVAL:
+                yield ": keep-alive\n\n"
+                idle_since = time.monotonic()
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+@flask_app.route('/api/limits', methods=['GET'])
+def api_get_limits():
+    """Current bandwidth limits in KB/s (0 = unlimited)."""
+    settings = load_settings(get_base_path())
+    return jsonify({key: settings[key] for key in (
+        'download_rate_limit', 'per_download_rate_limit', 'site_rate_limits')})
+
+@flask_app.route('/api/limits', methods=['PUT'])
+def api_set_limits():
+    """Change bandwidth limits; takes any of download_rate_limit,
+    per_download_rate_limit (KB/s) and site_rate_limits ({site: KB/s}).
+    Applies to running downloads and is saved to settings.json."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object'}), 400
+    base_path = get_base_path()
+    settings = load_settings(base_path)
+    try:
+        for key in ('download_rate_limit', 'per_download_rate_limit'):
+            if key in data:
+                if int(data[key]) < 0:
+                    raise ValueError(f'{key} must not be negative')
+                settings[key] = int(data[key])
+        if 'site_rate_limits' in data:
+            if not isinstance(data['site_rate_limits'], dict):
+                raise ValueError('site_rate_limits must be an object')
+            settings['site_rate_limits'] = {
+                site: int(rate) for site, rate in data['site_rate_limits'].items()}
+            if any(rate < 0 for rate in settings['site_rate_limits'].values()):
+                raise ValueError('site_rate_limits must not be negative')
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    write_settings_file(base_path, settings)
+    apply_rate_limits(settings)
+    logger.info(f"Bandwidth limits changed via API: {bandwidth_limiter.limits()}")
+    return jsonify({'success': True, **{key: settings[key] for key in (
+        'download_rate_limit', 'per_download_rate_limit', 'site_rate_limits')}})
+
+# Not 5000: that's Flask's default, and other dev servers squat on it (a
+# collision was observed in the wild). Must match the extension's background.js
+# and manifest.json host_permissions.
+API_PORT = 47811
+
+
+# Request threads. Every open /api/jobs/events stream occupies one.
+API_THREADS = 16
+# Open connections beyond this wait in the listen backlog (API_BACKLOG deep,
+# then refused) instead of piling up unbounded work
+API_CONNECTION_LIMIT = 200
+API_BACKLOG = 128
+# Idle keep-alive connections (and clients stalling mid-request) are
+# closed after this many seconds
+API_CHANNEL_TIMEOUT = 30
+API_MAX_BODY_SIZE = 64 * 1024 * 1024
+
+# Set once the API is shutting down; ends long-lived SSE streams
+api_stopping = threading.Event()
+
+
+class ApiServer:
+    """The API on waitress, a production WSGI server: a fixed pool of
+    request threads, HTTP/1.1 keep-alive, a bounded number of connections
+    and timeouts for idle or stalled clients.
+
+    Binds 127.0.0.1 only: the API is meant for the local Chrome extension,
+    exposing it on all interfaces would let anyone on the network trigger
+    downloads. Raises OSError if the port is taken.
+    """
+
+    def __init__(self):
+        self._server = create_server(
+            flask_app, host='127.0.0.1', port=API_PORT, ident=APP_NAME,
+            threads=API_THREADS, connection_limit=API_CONNECTION_LIMIT,
+            backlog=API_BACKLOG, channel_timeout=API_CHANNEL_TIMEOUT,
+            max_request_body_size=API_MAX_BODY_SIZE,
+            # Send each write at once; SSE events are far smaller than
+            # waitress' default send buffer
+            send_bytes=1)
+
+    def serve_forever(self):
+        """Serve until shutdown() has completed."""
+        self._server.run()
+
+    def shutdown(self, timeout=5):
+        """Stop accepting connections, let requests in progress finish (up
+        to timeout seconds), then close all connections."""
+        server = self._server
+        api_stopping.set()
+        # waitress' event loop isn't thread-safe; socket changes go through
+        # its trigger, which runs them on the loop's thread
+        server.trigger.pull_trigger(lambda: wasyncore.dispatcher.close(server))
+        dispatcher = server.task_dispatcher
+        deadline = time.monotonic() + timeout
+        while ((dispatcher.queue or dispatcher.active_count)
+               and time.monotonic() < deadline):
+            time.sleep(0.05)
+        dispatcher.shutdown(timeout=max(0, deadline - time.monotonic()))
+
+        def close_connections():
+            for channel in list(server._map.values()):
+                if channel is not server.trigger:
+                    channel.will_close = True
+            # With the trigger gone too, serve_forever() returns once the
+            # remaining connections are closed
+            server.trigger.close()
+        server.trigger.pull_trigger(close_connections)
+
+
+def run_api_server():
+    """Serve the API until the process exits (the desktop app's API thread)."""
+    try:
+        server = ApiServer()
+    except OSError:
+        # Port taken: GUI downloads still work, only the extension is affected
+        logger.critical(
+            f"Could not bind 127.0.0.1:{API_PORT} - is another copy of the "
+            "app running? The Chrome extension will not work this session.",
+            exc_info=True)
+        return
+    server.serve_forever()
+
+
+def main(argv=None):
+    """Headless entry point: serve the API and run downloads until stopped."""
+    parser = argparse.ArgumentParser(
+        description=f"Run the {APP_NAME} download API and job engine without the GUI.")
+    parser.add_argument(
+        "--drain-timeout", type=float, default=None, metavar="SECONDS",
+        help="on shutdown, wait at most this long for running downloads "
+             "(default: until they finish)")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="log debug messages")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
+    )
+    settings = load_settings(get_base_path())
+    configure_engine(settings)
+
+    try:
+        server = ApiServer()
+    except OSError:
+        logger.critical(f"Could not bind 127.0.0.1:{API_PORT} - is another "
+                        "copy of the app running?", exc_info=True)
+        return 1
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        if stop.is_set():
+            logger.warning("Second stop signal - exiting without waiting")
+            os._exit(1)
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    if hasattr(signal, "SIGBREAK"):  # Ctrl+Break / console close on Windows
+        signal.signal(signal.SIGBREAK, request_stop)
+
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True,
+                                     name="api-server")
+    server_thread.start()
+    logger.info(f"{APP_NAME} {APP_VERSION} serving on "
+                f"http://127.0.0.1:{API_PORT} (headless)")
+    resume_jobs(settings)
+    # Waiting with a timeout keeps the main thread responsive to signals
+    while not stop.wait(1):
+        pass
+
+    running = sum(1 for job in job_scheduler.jobs() if job.state == 'running')
+    logger.info(f"Shutting down - waiting for {running} running download(s)")
+    server.shutdown()
+    server_thread.join(5)
+    drained = job_scheduler.shutdown(timeout=args.drain_timeout)
+    if drained:
+        stop_process_pool()
+    extraction_cache.close()
+    if not drained:
+        logger.warning("Drain timeout reached; unfinished downloads were abandoned")
+        return 1
+    logger.info("Shut down cleanly")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
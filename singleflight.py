@@ -0,0 +1,71 @@
+"""Collapsing identical concurrent calls into one.
+
+When the GUI's auto-fetch and a manual search, or two clicks of the
+extension button, ask for the same URL at the same moment, only the first
+caller (the leader) does the network work; callers arriving while it runs
+wait for it and get its result - or its exception - instead of starting a
+second extraction. Nothing is remembered once the call has finished; that
+is the extraction cache's job.
+
+If the leader gave up because it was cancelled, a waiter that wasn't
+cancelled itself doesn't inherit that: it retries, becoming the leader.
+"""
+
+import concurrent.futures
+import threading
+
+# How often a waiting caller checks its own cancel event
+_CANCEL_POLL_INTERVAL = 0.2
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False  # the leader's cancel event was set
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; see do()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn, cancel_event=None):
+        """Return fn(), or the result of the fn() already running for key.
+
+        cancel_event is the caller's (a threading.Event or None): fn is
+        expected to watch it when this caller leads; while waiting for
+        another caller's fn, setting it raises CancelledError.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+            if leader:
+                try:
+                    flight.result = fn()
+                    return flight.result
+                except BaseException as e:
+                    flight.error = e
+                    flight.cancelled = (cancel_event is not None
+                                        and cancel_event.is_set())
+                    raise
+                finally:
+                    with self._lock:
+                        del self._flights[key]
+                    flight.done.set()
+
+            while not flight.done.wait(_CANCEL_POLL_INTERVAL):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise concurrent.futures.CancelledError()
+            if flight.error is None:
+                return flight.result
+            if flight.cancelled and not (cancel_event is not None
+                                         and cancel_event.is_set()):
+                continue  # the leader was cancelled, not us
+            raise flight.error
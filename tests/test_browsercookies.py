@@ -0,0 +1,29 @@
+import time
+
+from yt_dlp.cookies import YoutubeDLCookieJar
+
+import browsercookies
+import core
+from browsercookies import BrowserCookieCache
+
+
+def test_pooled_instances_pick_up_reloaded_cookies(monkeypatch):
+    loads = []
+
+    def extract(browser, *args, **kwargs):
+        loads.append(browser)
+        return YoutubeDLCookieJar()
+    monkeypatch.setattr(browsercookies, 'extract_cookies_from_browser', extract)
+    cache = BrowserCookieCache(ttl=0.2)
+    monkeypatch.setattr(core, 'browser_cookies', cache)
+    core.ydl_pool.clear()
+
+    opts = {**core.BASE_YDL_OPTS, 'cookiesfrombrowser': ('firefox',)}
+    first = core.run_with_cookie_fallback(opts, lambda ydl: ydl)
+    assert core.run_with_cookie_fallback(opts, lambda ydl: ydl) is first
+    time.sleep(0.3)
+    # The TTL ran out: the cookies are reloaded and the old instance, made
+    # with the previous ones, isn't handed out again
+    assert core.run_with_cookie_fallback(opts, lambda ydl: ydl) is not first
+    assert len(loads) == 2
+    core.ydl_pool.clear()
@@ -0,0 +1,29 @@
+from core import canonical_key, canonical_url, is_playlist_url
+
+
+def test_video_link_inside_playlist_keeps_the_playlist():
+    for url in ("https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PLabc123",
+                "https://www.youtube.com/watch?list=PLabc123&v=dQw4w9WgXcQ",
+                "https://youtu.be/dQw4w9WgXcQ?list=PLabc123&t=3"):
+        assert canonical_key(url) == ("youtube:playlist", "PLabc123")
+        assert canonical_url(url) == "https://www.youtube.com/playlist?list=PLabc123"
+        assert is_playlist_url(url)
+
+
+def test_plain_video_link():
+    url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42"
+    assert canonical_key(url) == ("youtube", "dQw4w9WgXcQ")
+    assert not is_playlist_url(url)
+
+
+def test_mix_link_stays_a_video():
+    url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=RDdQw4w9WgXcQ"
+    assert canonical_key(url) == ("youtube", "dQw4w9WgXcQ")
+
+
+def test_threads_links_without_scheme():
+    assert canonical_key("threads.net/@u/post/ABC") == ("threads", "ABC")
+    assert (canonical_key("https://www.threads.com/@other/post/ABC")
+            == canonical_key("threads.net/@u/post/ABC"))
+    assert canonical_key("www.threads.net/@u/post/ABC?img_index=2") == ("threads", "ABC-2")
+    assert canonical_key("threads.net/@some.user") == ("threads:user", "some.user")
@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_worker_reimport_does_not_load_gui_modules():
+    # What a spawned worker does with the launcher script: run it as
+    # __mp_main__. tkinter and pyperclip are made unimportable, as on a
+    # headless host.
+    code = (
+        "import sys, runpy\n"
+        "sys.modules['tkinter'] = None\n"
+        "sys.modules['_tkinter'] = None\n"
+        "sys.modules['pyperclip'] = None\n"
+        f"runpy.run_path({os.path.join(ROOT, 'downstream.py')!r}, run_name='__mp_main__')\n"
+        "import downstream\n"
+        "assert 'gui' not in sys.modules\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
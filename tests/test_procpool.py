@@ -0,0 +1,43 @@
+import collections
+import os
+import threading
+import time
+
+from procpool import ProcessPool
+
+
+def test_each_worker_is_recycled_after_its_own_task_count():
+    pool = ProcessPool(max_workers=2, max_tasks_per_child=3)
+    try:
+        # One process stays busy the whole time; the other must still be
+        # replaced every 3 tasks
+        busy = threading.Thread(target=pool.run, args=(time.sleep, 3))
+        busy.start()
+        time.sleep(0.5)
+        pids = collections.Counter(pool.run(os.getpid) for _ in range(9))
+        busy.join()
+    finally:
+        pool.shutdown()
+    assert len(pids) == 3
+    assert set(pids.values()) == {3}
+
+
+def _defer_sleep(seconds):
+    import procpool
+    future = procpool.defer(lambda: time.sleep(seconds))
+    return future is not None
+
+
+def test_deferred_work_outlasts_the_task():
+    pool = ProcessPool(max_workers=1)
+    deferred = []
+    try:
+        assert pool.run(_defer_sleep, 1, on_deferred=deferred.append)
+        assert len(deferred) == 1 and not deferred[0].done()
+        # The worker already takes the next task
+        assert pool.run(os.getpid)
+        assert deferred[0].result(timeout=10) is None
+        # Without on_deferred the work runs within the task
+        assert not pool.run(_defer_sleep, 0)
+    finally:
+        pool.shutdown()
@@ -0,0 +1,42 @@
+from yt_dlp import YoutubeDL
+
+from core import canonical_key
+from yt_dlp_plugins.extractor.threads import ThreadsBaseIE, ThreadsIE
+
+
+def _response(**post):
+    pk = ThreadsIE._shortcode_to_pk('AB')
+    post = {'pk': pk, 'code': 'AB', 'user': {'username': 'u'}, **post}
+    return {'data': {'data': {'edges': [
+        {'node': {'thread_items': [{'post': post}]}}]}}}
+
+
+def _video(name):
+    return [{'url': f'https://example.invalid/{name}.mp4', 'type': 101}]
+
+
+def _extract(monkeypatch, response, url):
+    monkeypatch.setattr(ThreadsBaseIE, '_download_webpage',
+                        lambda self, *args, **kwargs: '"LSD",[],{"token":"t"}')
+    monkeypatch.setattr(ThreadsBaseIE, '_download_json',
+                        lambda self, *args, **kwargs: response)
+    return ThreadsIE(YoutubeDL({'quiet': True})).extract(url)
+
+
+def test_img_index_id_matches_canonical_key(monkeypatch):
+    responses = (
+        _response(video_versions=_video('a')),
+        _response(carousel_media=[{'pk': 1, 'video_versions': _video('a')}]),
+        _response(carousel_media=[{'pk': 1, 'video_versions': _video('a')},
+                                  {'pk': 2, 'video_versions': _video('b')}]),
+    )
+    url = 'https://www.threads.net/@u/post/AB?img_index=1'
+    for response in responses:
+        info = _extract(monkeypatch, response, url)
+        assert ('threads', info['id']) == canonical_key(url) == ('threads', 'AB-1')
+
+
+def test_single_video_post_keeps_its_code(monkeypatch):
+    url = 'https://www.threads.net/@u/post/AB'
+    info = _extract(monkeypatch, _response(video_versions=_video('a')), url)
+    assert ('threads', info['id']) == canonical_key(url) == ('threads', 'AB')
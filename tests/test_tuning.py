@@ -0,0 +1,27 @@
+from bandwidth import BandwidthLimiter
+from tuning import ConnectionTuner
+
+INFO = {'url': 'https://rr1---sn-abc.googlevideo.com/videoplayback'}
+
+
+def _download(monitor, throttle=None, size=8 * 1024 * 1024):
+    monitor.progress_hook({'status': 'downloading', 'downloaded_bytes': 0})
+    if throttle is not None:
+        throttle.consume(size)
+    monitor.progress_hook({'status': 'finished', 'downloaded_bytes': size})
+    monitor.finish(ok=True)
+
+
+def test_unthrottled_download_is_tuned(tmp_path):
+    tuner = ConnectionTuner(str(tmp_path / 'tuning.json'), default=4)
+    _download(tuner.monitor(INFO))
+    assert tuner.value_for('googlevideo.com') == 5
+
+
+def test_rate_limited_download_is_not_tuned(tmp_path):
+    tuner = ConnectionTuner(str(tmp_path / 'tuning.json'), default=4)
+    # 64 MB/s cap: the 8 MB read beyond the burst waits ~0.1 s
+    throttle = BandwidthLimiter(total=64 * 1024 * 1024).throttle('youtube')
+    _download(tuner.monitor(INFO, throttle), throttle)
+    assert throttle.waited > 0
+    assert tuner.value_for('googlevideo.com') == 4
@@ -0,0 +1,154 @@
+"""Per-host tuning of download connection counts.
+
+How many fragments/byte ranges to fetch at once depends on the link and on
+the CDN: on a fast line 4 leaves bandwidth unused, on a slow one it only
+adds contention and 429s. ConnectionTuner watches each download through its
+progress hooks and retry reports and hill-climbs the count per CDN host:
+keep stepping while throughput improves, turn around when it drops, and
+halve on throttling or errors. Tuned values are saved to a JSON file so the
+next run starts where the last one ended.
+
+A download our own bandwidth limiter held back (bandwidth.py) measures the
+limit, not the link: its throughput isn't fed back.
+"""
+
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Downloads shorter than this say little about the link
+_MIN_SAMPLE_BYTES = 4 * 1024 * 1024
+# Throughput changes within this ratio count as noise
+_RATE_TOLERANCE = 0.05
+
+
+def host_key(url):
+    """CDN host family of url: rr3---sn-xyz.googlevideo.com and
+    rr1---sn-abc.googlevideo.com share one link, so both -> googlevideo.com."""
+    host = (urlparse(url or '').hostname or '').lower()
+    return '.'.join(host.split('.')[-2:]) or None
+
+
+class DownloadMonitor:
+    """Measures one download for the tuner; created by ConnectionTuner.monitor."""
+
+    def __init__(self, tuner, host, connections, throttle=None):
+        self.tuner = tuner
+        self.host = host
+        self.connections = connections
+        # The download's bandwidth.Throttle, if it has one; what it has made
+        # the download wait so far
+        self.throttle = throttle
+        self._waited = throttle.waited if throttle is not None else 0.0
+        self.retries = 0
+        self._first = None  # (time, downloaded_bytes) of the first report
+        self._last = None
+
+    def progress_hook(self, d):
+        if d.get('status') not in ('downloading', 'finished'):
+            return
+        sample = (time.monotonic(), d.get('downloaded_bytes') or 0)
+        if self._first is None:
+            self._first = sample
+        self._last = sample
+
+    def watch_retries(self, fd):
+        """Count the retries fd reports (429s, resets, stalls)."""
+        report_retry = fd.report_retry
+
+        def counting_report_retry(*args, **kwargs):
+            self.retries += 1
+            return report_retry(*args, **kwargs)
+        fd.report_retry = counting_report_retry
+
+    def finish(self, ok):
+        rate = None
+        if self._first is not None:
+            elapsed = self._last[0] - self._first[0]
+            transferred = self._last[1] - self._first[1]
+            if elapsed > 0 and transferred >= _MIN_SAMPLE_BYTES:
+                rate = transferred / elapsed
+        if self.throttle is not None and self.throttle.waited > self._waited:
+            # Slowed down by a rate limit: the rate says nothing about the
+            # connection count
+            rate = None
+        if not ok or self.retries:
+            self.tuner.record(self.host, self.connections, None, errors=True)
+        elif rate is not None:
+            self.tuner.record(self.host, self.connections, rate)
+
+
+class ConnectionTuner:
+    """Per-host connection counts within [minimum, maximum], persisted to path."""
+
+    def __init__(self, path, default=4, minimum=1, maximum=16):
+        self.path = path
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self._lock = threading.Lock()
+        self._hosts = None  # host -> {'value', 'rate', 'step'}, loaded lazily
+
+    def _load(self):
+        # Caller holds the lock
+        if self._hosts is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self._hosts = json.load(f)
+            except (OSError, ValueError):
+                self._hosts = {}
+        return self._hosts
+
+    def _save(self):
+        # Caller holds the lock
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(self._hosts, f)
+        except OSError:
+            logger.warning("Could not save connection tuning", exc_info=True)
+
+    def _clamp(self, value):
+        return min(max(int(value), self.minimum), self.maximum)
+
+    def value_for(self, host):
+        with self._lock:
+            state = self._load().get(host)
+            return self._clamp(state['value'] if state else self.default)
+
+    def monitor(self, info, throttle=None):
+        """A DownloadMonitor for downloading the format described by info,
+        through throttle (a bandwidth.Throttle) if given."""
+        host = host_key(info.get('fragment_base_url') or info.get('url'))
+        return DownloadMonitor(self, host, self.value_for(host), throttle)
+
+    def record(self, host, connections, rate, errors=False):
+        """Feed back one download: its throughput (bytes/s) or errors."""
+        if not host:
+            return
+        with self._lock:
+            hosts = self._load()
+            state = hosts.setdefault(host, {'value': self.default, 'rate': None, 'step': 1})
+            if errors:
+                # Throttled or failing: back off hard, then probe upwards again
+                value = connections // 2
+                state.update(rate=None, step=1)
+            else:
+                previous, step = state.get('rate'), state.get('step', 1)
+                if previous is None or rate > previous * (1 + _RATE_TOLERANCE):
+                    value = connections + step
+                elif rate < previous * (1 - _RATE_TOLERANCE):
+                    step = -step
+                    value = connections + step
+                else:
+                    value = connections
+                if self._clamp(value) == connections and value != connections:
+                    step = -step  # ran into a bound; probe the other way next
+                state.update(rate=rate, step=step)
+            state['value'] = self._clamp(value)
+            logger.debug(f"Connections for {host}: {connections} -> {state['value']} "
+                         f"(rate={rate}, errors={errors})")
+            self._save()
@@ -0,0 +1,106 @@
+"""Reusing YoutubeDL instances across fetches and downloads.
+
+A new YoutubeDL per fetch or download pays for option processing,
+extractor setup and a fresh HTTP session each time - a new TCP/TLS
+handshake with the same CDN for every video. YoutubeDLPool keeps finished
+instances and hands them out again to runs with the same option profile:
+the options minus the per-run ones (progress hooks, output template and
+paths, playlist range, see rangedl.PER_RUN_PARAMS), which are swapped in by
+RangedYoutubeDL.reuse(). Repeated jobs so get warm connections, extractor
+instances and caches.
+
+An instance serves one run at a time, and returns to the pool only once
+the post-processing its run handed off is done too. Instances are retired
+after max_age seconds, and an instance whose run raised is closed rather
+than reused. State an instance is created with that can go stale belongs in
+the profile: core adds the generation of the browser cookies it loaded, so
+instances holding cookies that have since been reloaded aren't reused.
+"""
+
+import contextlib
+import json
+import logging
+import threading
+import time
+
+from rangedl import PER_RUN_PARAMS
+
+logger = logging.getLogger(__name__)
+
+
+def profile_key(params):
+    """The option profile of params: the options an instance is created
+    with. Engine objects (tuner, limiter, stage) count by identity."""
+    return json.dumps(
+        {k: v for k, v in params.items() if k not in PER_RUN_PARAMS},
+        sort_keys=True, default=lambda o: f'<{type(o).__name__} {id(o):x}>')
+
+
+class YoutubeDLPool:
+    """Idle YoutubeDL instances by option profile; see instance()."""
+
+    def __init__(self, factory, max_idle=8, max_age=10 * 60):
+        # factory(params) creates an instance for params
+        self.factory = factory
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._idle = []  # (created, profile key, instance), least recently used first
+
+    @contextlib.contextmanager
+    def instance(self, params):
+        """Context manager yielding an instance set up for params: an idle
+        one with the same profile if there is one, else a new one."""
+        key = profile_key(params)
+        ydl, created = self._take(key)
+        if ydl is None:
+            ydl, created = self.factory(dict(params)), time.monotonic()
+        else:
+            ydl.reuse(params)
+        try:
+            yield ydl
+        except BaseException:
+            ydl.when_idle(lambda: self._close(ydl))
+            raise
+        ydl.when_idle(lambda: self._put(key, ydl, created))
+
+    def _take(self, key):
+        now = time.monotonic()
+        with self._lock:
+            expired = [e for e in self._idle if now - e[0] >= self.max_age]
+            self._idle = [e for e in self._idle if now - e[0] < self.max_age]
+            # Most recently used first: its connections are the warmest
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._idle[i][1] == key:
+                    created, _, ydl = self._idle.pop(i)
+                    break
+            else:
+                created = ydl = None
+        for _, _, old in expired:
+            self._close(old)
+        return ydl, created
+
+    def _put(self, key, ydl, created):
+        if time.monotonic() - created >= self.max_age:
+            self._close(ydl)
+            return
+        with self._lock:
+            self._idle.append((created, key, ydl))
+            surplus = self._idle[:-self.max_idle] if len(self._idle) > self.max_idle else []
+            del self._idle[:len(surplus)]
+        for _, _, old in surplus:
+            self._close(old)
+
+    def clear(self):
+        """Close every idle instance (e.g. after settings changed)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for _, _, ydl in idle:
+            self._close(ydl)
+
+    @staticmethod
+    def _close(ydl):
+        try:
+            ydl.close()
+        except Exception:
+            logger.warning("Closing a YoutubeDL instance failed", exc_info=True)
@@ -10,6 +10,22 @@ same GraphQL endpoint the web app uses:
 3. POST /api/graphql (BarcelonaPostPageContentQuery) - returns the post
    JSON including video_versions CDN URLs
 
+A post with several videos (a carousel) becomes a multi_video playlist,
+one entry per video, all from that one response. The response also holds
+the rest of the thread (the replies); with the extractor argument
+include_replies=true (``--extractor-args "threads:include_replies=true"``)
+their videos are entries too.
+
+Profiles (threads.com/@user, ThreadsUserIE) work the same way with the
+profile page and BarcelonaProfileThreadsTabQuery, paged with its cursor.
+Its posts come with their video_versions, so the playlist's entries (one
+per video) are complete and no post is extracted again.
+
+The LSD token and csrftoken from step 1 stay valid for a while, so they are
+kept per session (anonymous, or per logged-in account) and step 1 is
+skipped for later posts until they expire - or until the API rejects them,
+in which case the page is fetched again and the request retried once.
+
 Works anonymously for public posts (verified 2026-07); login-walled posts
 need browser cookies (Settings > Instagram/Threads login).
 
@@ -18,12 +34,18 @@ package on sys.path (in development that's the script directory; in the
 packaged exe it's bundled via build.py).
 """
 
+import hashlib
+import itertools
 import json
 import re
+import threading
+import time
 
 from yt_dlp.extractor.common import InfoExtractor
 from yt_dlp.utils import (
     ExtractorError,
+    int_or_none,
+    parse_qs,
     strftime_or_none,
     urlencode_postdata,
 )
@@ -58,7 +80,207 @@ def _link_source_name(url):
     return _LINK_SOURCE_NAMES.get(key, domain)
 
 
-class ThreadsIE(InfoExtractor):
+class ThreadsBaseIE(InfoExtractor):
+    """Session tokens, GraphQL requests and post parsing shared by the
+    Threads extractors."""
+    _VALID_URL = False
+
+    # Meta serves an empty response to yt-dlp's default User-Agent
+    _UA = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+           '(KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36')
+
+    # How long a page's LSD token and csrftoken are reused for
+    _TOKEN_TTL = 30 * 60
+    # session key -> (lsd, csrftoken, time fetched); shared by all instances
+    # of all Threads extractors
+    _session_tokens = {}
+    _session_tokens_lock = threading.Lock()
+
+    def _session_key(self):
+        """Whose session the tokens belong to: the logged-in account (by a
+        hash of its session cookie) or 'anonymous'."""
+        session = self._get_cookies('https://www.threads.com/').get('sessionid')
+        if not session or not session.value:
+            return 'anonymous'
+        return hashlib.sha256(session.value.encode()).hexdigest()[:16]
+
+    def _session_lsd(self, url, video_id, refresh=False):
+        """(LSD token, whether it came from the cache). A cached token's
+        csrftoken is put into this instance's cookies if it lacks one."""
+        key = self._session_key()
+        with self._session_tokens_lock:
+            cached = self._session_tokens.get(key)
+        if (not refresh and cached is not None
+                and time.time() - cached[2] < self._TOKEN_TTL):
+            lsd, csrftoken, _ = cached
+            if csrftoken and not self._get_cookies(
+                    'https://www.threads.com/').get('csrftoken'):
+                self._set_cookie('.threads.com', 'csrftoken', csrftoken)
+            return lsd, True
+
+        # The page itself is an empty shell, but fetching it sets the
+        # csrftoken cookie and embeds the LSD token the API requires
+        webpage = self._download_webpage(
+            url, video_id, headers={'User-Agent': self._UA},
+            note='Downloading session tokens')
+        return self._remember_session_tokens(webpage), False
+
+    def _remember_session_tokens(self, webpage, fatal=True):
+        """Cache the LSD token embedded in a Threads page, along with the
+        csrftoken cookie fetching it set; returns the token."""
+        lsd = self._search_regex(
+            r'"LSD",\[\],\{"token":"([^"]+)"', webpage, 'lsd token', fatal=fatal)
+        if lsd:
+            csrftoken = self._get_cookies('https://www.threads.com/').get('csrftoken')
+            with self._session_tokens_lock:
+                self._session_tokens[self._session_key()] = (
+                    lsd, csrftoken.value if csrftoken else None, time.time())
+        return lsd
+
+    def _forget_session_lsd(self):
+        with self._session_tokens_lock:
+            self._session_tokens.pop(self._session_key(), None)
+
+    def _call_graphql(self, url, video_id, friendly_name, doc_id, variables,
+                      note='Downloading JSON'):
+        """POST a GraphQL query with the session's tokens and return the
+        response. If tokens from the cache are rejected - an HTTP error, a
+        non-JSON answer or an API error - they are fetched anew and the
+        query sent once more."""
+        lsd, cached = self._session_lsd(url, video_id)
+        while True:
+            try:
+                response = self._download_json(
+                    'https://www.threads.com/api/graphql', video_id, note=note,
+                    # Error responses carry an anti-JSON-hijacking prefix
+                    transform_source=lambda s: s.removeprefix('for (;;);'),
+                    data=urlencode_postdata({
+                        'av': '0',
+                        '__user': '0',
+                        '__a': '1',
+                        '__req': '1',
+                        'dpr': '1',
+                        'lsd': lsd,
+                        'fb_api_caller_class': 'RelayModern',
+                        'fb_api_req_friendly_name': friendly_name,
+                        'variables': json.dumps(variables),
+                        'server_timestamps': 'true',
+                        'doc_id': doc_id,
+                    }),
+                    headers={
+                        'User-Agent': self._UA,
+                        'Content-Type': 'application/x-www-form-urlencoded',
+                        'X-FB-LSD': lsd,
+                        'X-IG-App-ID': '238260118697367',
+                        'X-ASBD-ID': '129477',
+                        'X-FB-Friendly-Name': friendly_name,
+                        'Origin': 'https://www.threads.com',
+                        'Referer': url,
+                        'Accept': '*/*',
+                        # Meta rejects the request (error 1357055) without these
+                        'Sec-Fetch-Site': 'same-origin',
+                        'Sec-Fetch-Mode': 'cors',
+                        'Sec-Fetch-Dest': 'empty',
+                    })
+            except ExtractorError:
+                if not cached:
+                    raise
+                response = None
+            if not cached or (response is not None
+                              and not traverse_obj(response, 'error')):
+                return response
+            self.write_debug('Cached Threads session tokens were rejected; refreshing')
+            self._forget_session_lsd()
+            lsd, cached = self._session_lsd(url, video_id, refresh=True)
+
+    def _check_api_error(self, response):
+        if traverse_obj(response, 'error'):
+            raise ExtractorError(
+                'Threads API error: {}'.format(
+                    traverse_obj(response, 'errorSummary') or response['error']),
+                expected=True)
+
+    def _post_metadata(self, post):
+        username = traverse_obj(post, ('user', 'username'))
+        uploader_url = f'https://www.threads.com/@{username}' if username else None
+        caption = traverse_obj(post, ('caption', 'text'))
+        return {
+            'id': post.get('code'),
+            'title': caption or 'Threads post by {}'.format(username or 'unknown'),
+            'description': caption,
+            'uploader': username,
+            'uploader_id': username,
+            'uploader_url': uploader_url,
+            'channel': username,
+            'channel_url': uploader_url,
+            'channel_is_verified': traverse_obj(post, ('user', 'is_verified')),
+            'timestamp': post.get('taken_at'),
+            'upload_date': strftime_or_none(post.get('taken_at')),
+            'like_count': post.get('like_count'),
+        }
+
+    def _post_videos(self, post, img_index=None):
+        """Info dicts of a post's videos, from its GraphQL JSON: one for a
+        video post, one per video for a carousel (none for posts without
+        video). Each is complete - formats, thumbnails and metadata - and
+        downloadable without another request. A carousel's videos are
+        addressed by their position (?img_index=N, as on Instagram); with
+        img_index, only the video there is returned, under its positional
+        id even if it is the post's only one - the id core.canonical_key
+        gives such a URL."""
+        metadata = self._post_metadata(post)
+        post_url = 'https://www.threads.com/@{}/post/{}'.format(
+            metadata['uploader_id'] or '_', post.get('code'))
+        videos = []
+        # Carousel posts carry several media items; plain posts are their
+        # own single media item
+        for index, media in enumerate(post.get('carousel_media') or [post], 1):
+            formats = []
+            for video in media.get('video_versions') or []:
+                if not video.get('url'):
+                    continue
+                formats.append({
+                    'format_id': '{}-{}'.format(media.get('pk'), video.get('type')),
+                    'url': video['url'],
+                    'ext': 'mp4',
+                    'width': media.get('original_width'),
+                    'height': media.get('original_height'),
+                })
+            if not formats:
+                continue
+            thumbnails = []
+            for thumb in traverse_obj(media, ('image_versions2', 'candidates')) or []:
+                if not thumb.get('url'):
+                    continue
+                thumbnails.append({
+                    'url': thumb['url'],
+                    'width': thumb.get('width'),
+                    'height': thumb.get('height'),
+                })
+            videos.append((index, {
+                **metadata,
+                'formats': formats,
+                'thumbnails': thumbnails,
+                'webpage_url': post_url,
+                # Identified as ThreadsIE's also when listed by another
+                # extractor, so download archive keys match the post URLs
+                'extractor': ThreadsIE.IE_NAME,
+                'extractor_key': ThreadsIE.ie_key(),
+            }))
+
+        if img_index is None and len(videos) == 1:
+            return [videos[0][1]]
+        return [{
+            **info,
+            'id': f'{info["id"]}-{index}',
+            # Distinct titles, so the files don't overwrite each other
+            'title': f'{info["title"]} ({number})' if len(videos) > 1 else info['title'],
+            'webpage_url': f'{post_url}?img_index={index}',
+        } for number, (index, info) in enumerate(videos, 1)
+            if img_index in (None, index)]
+
+
+class ThreadsIE(ThreadsBaseIE):
     IE_NAME = 'threads'
     _VALID_URL = r'https?://(?:www\.)?threads\.(?:net|com)/(?P<uploader>[^/?#]+)/post/(?P<id>[^/?#&]+)'
 
@@ -66,10 +288,6 @@ class ThreadsIE(InfoExtractor):
     # old ones stay valid for a long time
     _GRAPHQL_DOC_ID = '25460088156920903'
 
-    # Meta serves an empty response to yt-dlp's default User-Agent
-    _UA = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
-           '(KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36')
-
     _TESTS = [{
         'url': 'https://www.threads.net/@tntsportsbr/post/C6cqebdCfBi',
         'info_dict': {
@@ -95,120 +313,53 @@ class ThreadsIE(InfoExtractor):
     def _real_extract(self, url):
         video_id = self._match_id(url)
         pk = self._shortcode_to_pk(video_id)
-
-        # The page itself is an empty shell, but fetching it sets the
-        # csrftoken cookie and embeds the LSD token the API requires
-        webpage = self._download_webpage(
-            url, video_id, headers={'User-Agent': self._UA})
-        lsd = self._search_regex(
-            r'"LSD",\[\],\{"token":"([^"]+)"', webpage, 'lsd token')
-
-        response = self._download_json(
-            'https://www.threads.com/api/graphql', video_id,
-            note='Downloading post JSON',
-            # Error responses carry an anti-JSON-hijacking prefix
-            transform_source=lambda s: s.removeprefix('for (;;);'),
-            data=urlencode_postdata({
-                'av': '0',
-                '__user': '0',
-                '__a': '1',
-                '__req': '1',
-                'dpr': '1',
-                'lsd': lsd,
-                'fb_api_caller_class': 'RelayModern',
-                'fb_api_req_friendly_name': 'BarcelonaPostPageContentQuery',
-                'variables': json.dumps({'postID': pk}),
-                'server_timestamps': 'true',
-                'doc_id': self._GRAPHQL_DOC_ID,
-            }),
-            headers={
-                'User-Agent': self._UA,
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'X-FB-LSD': lsd,
-                'X-IG-App-ID': '238260118697367',
-                'X-ASBD-ID': '129477',
-                'X-FB-Friendly-Name': 'BarcelonaPostPageContentQuery',
-                'Origin': 'https://www.threads.com',
-                'Referer': url,
-                'Accept': '*/*',
-                # Meta rejects the request (error 1357055) without these
-                'Sec-Fetch-Site': 'same-origin',
-                'Sec-Fetch-Mode': 'cors',
-                'Sec-Fetch-Dest': 'empty',
-            })
-
-        if traverse_obj(response, 'error'):
-            raise ExtractorError(
-                'Threads API error: {}'.format(
-                    traverse_obj(response, 'errorSummary') or response['error']),
-                expected=True)
-
-        formats = []
-        thumbnails = []
-        metadata = {'id': video_id}
-        linked_url = None
-
-        # The response carries the whole thread (post + replies); pick our post
-        for node in traverse_obj(response, ('data', 'data', 'edges')) or []:
-            for item in traverse_obj(node, ('node', 'thread_items')) or []:
-                post = item.get('post')
-                if not post or (str(post.get('pk')) != pk
-                                and post.get('code') != video_id):
-                    continue
-
-                # Cross-posts / link-share posts (media_type 19) have no
-                # media of their own; the video lives behind the shared link
-                # (commonly an Instagram reel)
-                linked_url = traverse_obj(post, (
-                    'text_post_app_info', 'link_preview_attachment', 'url'))
-
-                # Carousel posts carry several media items; plain posts are
-                # their own single media item
-                for media in post.get('carousel_media') or [post]:
-                    for video in media.get('video_versions') or []:
-                        if not video.get('url'):
-                            continue
-                        formats.append({
-                            'format_id': '{}-{}'.format(
-                                media.get('pk'), video.get('type')),
-                            'url': video['url'],
-                            'ext': 'mp4',
-                            'width': media.get('original_width'),
-                            'height': media.get('original_height'),
-                        })
-
-                for thumb in traverse_obj(
-                        post, ('image_versions2', 'candidates')) or []:
-                    if not thumb.get('url'):
-                        continue
-                    thumbnails.append({
-                        'url': thumb['url'],
-                        'width': thumb.get('width'),
-                        'height': thumb.get('height'),
-                    })
-
-                username = traverse_obj(post, ('user', 'username'))
-                caption = traverse_obj(post, ('caption', 'text'))
-                metadata.setdefault('uploader_id', username)
-                metadata.setdefault(
-                    'channel_is_verified',
-                    traverse_obj(post, ('user', 'is_verified')))
-                if username:
-                    metadata.setdefault(
-                        'uploader_url', f'https://www.threads.com/@{username}')
-                metadata.setdefault('timestamp', post.get('taken_at'))
-                metadata.setdefault('like_count', post.get('like_count'))
-                if caption:
-                    metadata.setdefault('title', caption)
-                    metadata.setdefault('description', caption)
-
-        if not formats:
+        img_index = int_or_none(traverse_obj(parse_qs(url), ('img_index', -1)))
+
+        response = self._call_graphql(
+            url, video_id, 'BarcelonaPostPageContentQuery', self._GRAPHQL_DOC_ID,
+            {'postID': pk}, note='Downloading post JSON')
+        self._check_api_error(response)
+
+        # The response carries the whole thread: the post and the author's
+        # follow-ups, then the replies
+        posts = [
+            item['post']
+            for node in traverse_obj(response, ('data', 'data', 'edges')) or []
+            for item in traverse_obj(node, ('node', 'thread_items')) or []
+            if item.get('post')]
+        post = next((p for p in posts if str(p.get('pk')) == pk
+                     or p.get('code') == video_id), None) or {}
+        videos = self._post_videos(post)
+
+        if img_index is not None and videos:
+            # One video of a carousel, or the post's only one - under the
+            # same positional id either way
+            video = next(iter(self._post_videos(post, img_index)), None)
+            if not video:
+                raise ExtractorError(
+                    f'No video at position {img_index} of this Threads post', expected=True)
+            return video
+
+        if self._configuration_arg('include_replies', ['false'])[0] == 'true':
+            # The videos of the rest of the thread too, from this response
+            seen = {post.get('code')}
+            for other in posts:
+                if other.get('code') not in seen:
+                    seen.add(other.get('code'))
+                    videos.extend(self._post_videos(other))
+
+        if not videos:
+            # Cross-posts / link-share posts (media_type 19) have no media
+            # of their own; the video lives behind the shared link
+            # (commonly an Instagram reel)
+            linked_url = traverse_obj(post, (
+                'text_post_app_info', 'link_preview_attachment', 'url'))
             if linked_url:
                 # Don't silently follow the link: extraction on the target
                 # site fails often (logins, rate limits) with errors that
                 # never mention this was a cross-post. Surface the real
                 # location instead; the GUI parses this exact phrasing
-                # (CROSSPOST_ERROR_RE in downstream.py) to offer a retry.
+                # (CROSSPOST_ERROR_RE in core.py) to offer a retry.
                 raise ExtractorError(
                     'This Threads post is a cross-post with no video hosted '
                     'on Threads. Download it from the source instead - '
@@ -219,20 +370,106 @@ class ThreadsIE(InfoExtractor):
                 'deleted, or visible only when logged in - if you are logged in '
                 'to Threads in your browser, configure that browser for cookies',
                 expected=True)
+            return {**self._post_metadata(post), 'id': video_id, 'formats': []}
+
+        if len(videos) == 1:
+            return {**videos[0], 'id': video_id}
+        # Several videos - a carousel, or a thread: each its own entry,
+        # so they can be downloaded separately (and in parallel)
+        metadata = self._post_metadata(post)
+        return self.playlist_result(
+            videos, video_id, metadata['title'], metadata['description'],
+            multi_video=True, **{k: v for k, v in metadata.items()
+                                 if k not in ('id', 'title', 'description')})
+
+
+class ThreadsUserIE(ThreadsBaseIE):
+    IE_NAME = 'threads:user'
+    IE_DESC = "A Threads account's video posts"
+    # The profile's threads tab, or its media tab. Both list the same
+    # videos (the media tab is the threads tab minus text-only posts), so
+    # both map to the same query.
+    _VALID_URL = r'https?://(?:www\.)?threads\.(?:net|com)/@(?P<id>[\w.]+)(?:/(?P<tab>media))?/?(?:[?#]|$)'
+
+    # Relay doc_id of BarcelonaProfileThreadsTabQuery; see ThreadsIE
+    _GRAPHQL_DOC_ID = '6232751443445612'
+    _PAGE_SIZE = 25
+
+    _TESTS = [{
+        'url': 'https://www.threads.net/@tntsportsbr',
+        'info_dict': {
+            'id': 'tntsportsbr',
+        },
+        'playlist_mincount': 1,
+    }, {
+        'url': 'https://www.threads.com/@tntsportsbr/media',
+        'only_matching': True,
+    }]
 
-        metadata.setdefault(
-            'title', 'Threads post by {}'.format(
-                metadata.get('uploader_id') or 'unknown'))
-        metadata['channel'] = metadata.get('uploader_id')
-        metadata['channel_url'] = metadata.get('uploader_url')
-        metadata['uploader'] = metadata.get('uploader_id')
-        metadata['upload_date'] = strftime_or_none(metadata.get('timestamp'))
+    def _user_id(self, username, webpage):
+        # The numeric account ID is embedded in the profile page; Threads
+        # accounts share it with their Instagram account, whose public
+        # profile API is the fallback
+        user_id = self._search_regex(
+            (r'"user_id":"(\d+)"', r'"userID":"(\d+)"', r'"profile_id":"(\d+)"'),
+            webpage, 'user id', default=None)
+        if user_id:
+            return user_id
+        profile = self._download_json(
+            'https://i.instagram.com/api/v1/users/web_profile_info/', username,
+            query={'username': username}, note='Downloading user ID',
+            headers={'User-Agent': self._UA, 'X-IG-App-ID': '936619743392459'})
+        return traverse_obj(profile, ('data', 'user', 'id', {str}))
+
+    def _entries(self, url, username, user_id):
+        seen = set()
+        cursor = None
+        for page in itertools.count(1):
+            variables = {'userID': user_id, 'first': self._PAGE_SIZE}
+            if cursor:
+                variables['after'] = cursor
+            response = self._call_graphql(
+                url, username, 'BarcelonaProfileThreadsTabQuery',
+                self._GRAPHQL_DOC_ID, variables, note=f'Downloading page {page}')
+            self._check_api_error(response)
+            media_data = traverse_obj(response, ('data', 'mediaData')) or {}
+
+            # Threads of the account, each its post plus the account's own
+            # follow-ups (older responses list them under 'threads')
+            threads = (traverse_obj(media_data, ('edges', ..., 'node'))
+                       or media_data.get('threads') or [])
+            for thread in threads:
+                for item in thread.get('thread_items') or []:
+                    post = item.get('post') or {}
+                    if not post.get('code') or post['code'] in seen:
+                        continue
+                    seen.add(post['code'])
+                    # Finished entries, one per video: downloading them
+                    # needs no further request
+                    yield from self._post_videos(post)
 
-        return {
-            **metadata,
-            'formats': formats,
-            'thumbnails': thumbnails,
-        }
+            cursor = traverse_obj(media_data, ('page_info', 'end_cursor'))
+            if not threads or not cursor or not traverse_obj(
+                    media_data, ('page_info', 'has_next_page')):
+                return
+
+    def _real_extract(self, url):
+        username, tab = self._match_valid_url(url).group('id', 'tab')
+        url = f'https://www.threads.com/@{username}'
+        webpage = self._download_webpage(
+            url, username, headers={'User-Agent': self._UA})
+        # The profile page carries the session tokens too; the first
+        # GraphQL request then needs no fetch of its own
+        self._remember_session_tokens(webpage, fatal=False)
+        user_id = self._user_id(username, webpage)
+        if not user_id:
+            raise ExtractorError(f'Could not find the Threads account @{username}', expected=True)
+
+        # Pages are requested as the entries are consumed, so e.g. a
+        # playlistend of 10 fetches only the first page
+        return self.playlist_result(
+            self._entries(url, username, user_id), username,
+            f'@{username} on Threads' + (' (media)' if tab else ''))
 
 
 class ThreadsIOSIE(InfoExtractor):